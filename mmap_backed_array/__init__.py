@@ -1,6 +1,22 @@
 from .mmap_array import *
+from .shaped_view import *
+from .record_array import *
+from .hash_map import *
+from .bit_array import *
+from .bytes_array import *
+from .versioned import *
+from .notify import *
+from .lazy_array import *
+from .memo_cache import *
+from .search_index import *
 
-__all__ = [mmap_array.__all__, 'typecodes']
+__all__ = (
+    mmap_array.__all__ + shaped_view.__all__ + record_array.__all__ +
+    hash_map.__all__ + bit_array.__all__ + bytes_array.__all__ +
+    versioned.__all__ + notify.__all__ + lazy_array.__all__ +
+    memo_cache.__all__ + search_index.__all__ +
+    ['typecodes']
+)
 
 from .mmap_array import _mmap
 
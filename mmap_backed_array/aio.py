@@ -0,0 +1,116 @@
+"""
+asyncio support for mmaparrays.
+
+Loading, flushing and faulting in the pages of a large mapping can block
+for a long time. These coroutines split that work into bounded chunks that
+run on an executor, so the event loop only waits for one chunk at a time
+and keeps serving other tasks in between. The array must not be resized by
+anything else while one of them is running.
+"""
+import asyncio
+import mmap
+import os
+
+from .mmap_array import ffi, C
+
+# Default number of bytes handed to the executor at a time
+DEFAULT_CHUNK_SIZE = 16 * 1024 * 1024
+
+
+def _byte_range(arr, start, stop):
+    """Byte offsets of the items [start:stop] in the mapping"""
+    start, stop, _ = slice(start, stop).indices(len(arr))
+    stop = max(start, stop)
+    return start*arr.itemsize, stop*arr.itemsize
+
+
+def _chunks(begin, end, chunk_size):
+    """Split [begin, end) into (offset, size) chunks"""
+    for offset in range(begin, end, chunk_size):
+        yield offset, min(chunk_size, end - offset)
+
+
+async def load(arr, path, n=None, chunk_size=None, executor=None):
+    """Append the items stored in a file to the array.
+    The file is read straight into the mapping without intermediate copies.
+    :arr: the mmaparray to append to
+    :path: the file to read
+    :n: the number of items to read, defaults to the whole file
+    :chunk_size: the number of bytes read at a time
+    :executor: executor to read on, defaults to the loop's default executor
+    :raises EOFError: if the file holds fewer than n items, the complete
+        items that were read are kept like fromfile does
+    """
+    loop = asyncio.get_running_loop()
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    f = await loop.run_in_executor(executor, open, path, 'rb')
+    try:
+        if n is None:
+            stat = await loop.run_in_executor(executor, os.fstat, f.fileno())
+            if stat.st_size % arr.itemsize:
+                raise ValueError("file size is not a multiple of the item size")
+            n = stat.st_size // arr.itemsize
+        nbytes = n*arr.itemsize
+        pos = arr._size
+        arr._resize(pos + nbytes)
+        done = 0
+        try:
+            while done < nbytes:
+                size = min(chunk_size, nbytes - done)
+                target = ffi.buffer(ffi.cast('char *', arr._data) + pos + done, size)
+                count = await loop.run_in_executor(executor, f.readinto, target)
+                if not count:
+                    raise EOFError
+                done += count
+        except EOFError:
+            arr._resize(pos + done - done % arr.itemsize)
+            raise
+        except BaseException:
+            arr._resize(pos)
+            raise
+    finally:
+        f.close()
+
+
+async def flush(arr, start=None, stop=None, chunk_size=None, executor=None):
+    """Flush the items [start:stop] of a file backed array to disk.
+    :chunk_size: the number of bytes flushed at a time
+    """
+    loop = asyncio.get_running_loop()
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    begin, end = _byte_range(arr, start, stop)
+    # flush offsets must be aligned to the allocation granularity
+    granularity = mmap.ALLOCATIONGRANULARITY
+    begin -= begin % granularity
+    chunk_size = max(granularity, chunk_size - chunk_size % granularity)
+    for offset, size in _chunks(begin, end, chunk_size):
+        await loop.run_in_executor(executor, arr._mmap.flush, offset, size)
+
+
+async def prefetch(arr, start=None, stop=None, chunk_size=None, executor=None):
+    """Fault in the pages holding the items [start:stop] so that later
+    accesses from the event loop don't block on page faults.
+    :chunk_size: the number of bytes faulted in at a time
+    """
+    loop = asyncio.get_running_loop()
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    begin, end = _byte_range(arr, start, stop)
+    for offset, size in _chunks(begin, end, chunk_size):
+        data = ffi.cast('unsigned char *', arr._data)
+        await loop.run_in_executor(
+            executor, C.mba_touch_pages, data + offset, size, mmap.PAGESIZE
+        )
+
+
+async def iter_chunks(arr, chunk_items=None, start=None, stop=None, executor=None):
+    """Iterate over the items [start:stop] as array.array chunks, each
+    chunk is copied out of the mapping on the executor.
+    :chunk_items: the number of items in each chunk
+    """
+    loop = asyncio.get_running_loop()
+    chunk_items = chunk_items or max(1, DEFAULT_CHUNK_SIZE // arr.itemsize)
+    start, stop, _ = slice(start, stop).indices(len(arr))
+    for begin, size in _chunks(start, stop, chunk_items):
+        yield await loop.run_in_executor(
+            executor, arr.__getitem__, slice(begin, begin + size)
+        )
@@ -0,0 +1,409 @@
+"""
+Apache Arrow IPC file format support without pyarrow.
+
+write_file lays the columns of a table out as a single record batch in an
+Arrow IPC file. Each column's data starts on a boundary of the mmap
+allocation granularity, so read_file can map every column straight from
+the file into an mmaparray while Arrow readers can memory map the same
+file. Columns of files written by other Arrow writers are copied if they
+aren't aligned that way.
+
+Only non-nullable columns of the numeric typecodes are supported.
+"""
+import array
+import collections.abc
+import mmap
+import os
+import struct
+import sys
+
+from .mmap_array import mmaparray, ffi, _typecode_to_type
+
+MAGIC = b'ARROW1'
+
+_CONTINUATION = 0xFFFFFFFF
+_METADATA_V5 = 4
+_HEADER_SCHEMA = 1
+_HEADER_RECORD_BATCH = 3
+_TYPE_INT = 2
+_TYPE_FLOATING_POINT = 3
+_PRECISION_SINGLE = 1
+_PRECISION_DOUBLE = 2
+_LITTLE_ENDIAN = 0
+_BIG_ENDIAN = 1
+_NATIVE_ENDIAN = _LITTLE_ENDIAN if sys.byteorder == 'little' else _BIG_ENDIAN
+
+# Block, FieldNode and Buffer structs
+_BLOCK = struct.Struct('<qi4xq')
+_FIELD_NODE = struct.Struct('<qq')
+_BUFFER = struct.Struct('<qq')
+
+
+def _align(n, alignment):
+    return n + -n % alignment
+
+
+# A minimal flatbuffers encoder. Objects are laid out front to back, every
+# table is preceded by its vtable and the objects it refers to follow it so
+# that all offsets point forwards.
+
+class _Table:
+    """A flatbuffers table, fields is a list indexed by field id of None,
+    a (struct format, value) pair for scalars or an object to refer to
+    """
+    def __init__(self, *fields):
+        self.fields = fields
+
+
+class _TableVector:
+    """A vector of tables"""
+    def __init__(self, tables):
+        self.tables = list(tables)
+
+
+class _StructVector:
+    """A vector of structs packed with a struct.Struct"""
+    def __init__(self, layout, items):
+        self.layout = layout
+        self.items = list(items)
+
+
+def _pad(buf, alignment):
+    buf.extend(bytes(-len(buf) % alignment))
+
+
+def _encode(root):
+    """Encode a table and everything it refers to as a flatbuffer"""
+    buf = bytearray(4)
+    pending = [(0, root)]
+    while pending:
+        position, obj = pending.pop(0)
+        target = _encode_object(buf, obj, pending)
+        struct.pack_into('<I', buf, position, target - position)
+    _pad(buf, 8)
+    return bytes(buf)
+
+
+def _encode_object(buf, obj, pending):
+    """Append an object to buf, returns its position"""
+    if isinstance(obj, _Table):
+        return _encode_table(buf, obj, pending)
+    if isinstance(obj, bytes):
+        _pad(buf, 4)
+        position = len(buf)
+        buf += struct.pack('<I', len(obj)) + obj + b'\x00'
+        return position
+    if isinstance(obj, _TableVector):
+        _pad(buf, 4)
+        position = len(buf)
+        buf += struct.pack('<I', len(obj.tables)) + bytes(4*len(obj.tables))
+        for i, table in enumerate(obj.tables):
+            pending.append((position + 4 + 4*i, table))
+        return position
+    # struct vector, the elements are 8 byte aligned
+    while (len(buf) + 4) % 8:
+        buf.append(0)
+    position = len(buf)
+    buf += struct.pack('<I', len(obj.items))
+    for item in obj.items:
+        buf += obj.layout.pack(*item)
+    return position
+
+
+def _encode_table(buf, table, pending):
+    """Append a vtable and its table to buf, returns the table position"""
+    slots = []
+    for field_id, field in enumerate(table.fields):
+        if field is None:
+            continue
+        size = struct.calcsize('<' + field[0]) if isinstance(field, tuple) else 4
+        slots.append((size, field_id, field))
+    # biggest first so the fields need no padding
+    slots.sort(key=lambda slot: -slot[0])
+    offsets = [0]*len(table.fields)
+    inline_size = 4
+    for size, field_id, _ in slots:
+        inline_size = _align(inline_size, size)
+        offsets[field_id] = inline_size
+        inline_size += size
+    alignment = max([4] + [size for size, _, _ in slots])
+
+    _pad(buf, 2)
+    vtable = len(buf)
+    buf += struct.pack('<%dH' % (2 + len(offsets)), 4 + 2*len(offsets), inline_size, *offsets)
+    _pad(buf, alignment)
+    position = len(buf)
+    buf += bytes(_align(inline_size, alignment))
+    struct.pack_into('<i', buf, position, position - vtable)
+    for size, field_id, field in slots:
+        if isinstance(field, tuple):
+            struct.pack_into('<' + field[0], buf, position + offsets[field_id], field[1])
+        else:
+            pending.append((position + offsets[field_id], field))
+    return position
+
+
+# Decoding of flatbuffers
+
+class _Reader:
+    """Access to a table in a flatbuffer"""
+    def __init__(self, buf, position):
+        self.buf = buf
+        self.position = position
+        self.vtable = position - struct.unpack_from('<i', buf, position)[0]
+        self.vtable_size = struct.unpack_from('<H', buf, self.vtable)[0]
+
+    @classmethod
+    def root(cls, buf, position=0):
+        return cls(buf, position + struct.unpack_from('<I', buf, position)[0])
+
+    def _field(self, field_id):
+        entry = 4 + 2*field_id
+        if entry >= self.vtable_size:
+            return None
+        offset = struct.unpack_from('<H', self.buf, self.vtable + entry)[0]
+        return self.position + offset if offset else None
+
+    def scalar(self, field_id, fmt, default=0):
+        position = self._field(field_id)
+        if position is None:
+            return default
+        return struct.unpack_from('<' + fmt, self.buf, position)[0]
+
+    def _target(self, field_id):
+        position = self._field(field_id)
+        if position is None:
+            return None
+        return position + struct.unpack_from('<I', self.buf, position)[0]
+
+    def table(self, field_id):
+        position = self._target(field_id)
+        return None if position is None else _Reader(self.buf, position)
+
+    def string(self, field_id):
+        position = self._target(field_id)
+        if position is None:
+            return None
+        length = struct.unpack_from('<I', self.buf, position)[0]
+        return bytes(self.buf[position + 4:position + 4 + length])
+
+    def tables(self, field_id):
+        position = self._target(field_id)
+        if position is None:
+            return []
+        count = struct.unpack_from('<I', self.buf, position)[0]
+        return [_Reader.root(self.buf, position + 4 + 4*i) for i in range(count)]
+
+    def structs(self, field_id, layout):
+        position = self._target(field_id)
+        if position is None:
+            return []
+        count = struct.unpack_from('<I', self.buf, position)[0]
+        return [layout.unpack_from(self.buf, position + 4 + layout.size*i)
+                for i in range(count)]
+
+
+# Arrow metadata
+
+def _arrow_type(typecode, itemsize):
+    """The Arrow type union (type id, type table) of a typecode"""
+    if typecode == 'f':
+        return _TYPE_FLOATING_POINT, _Table(('h', _PRECISION_SINGLE))
+    if typecode == 'd':
+        return _TYPE_FLOATING_POINT, _Table(('h', _PRECISION_DOUBLE))
+    if typecode in 'bhilqBHILQ':
+        return _TYPE_INT, _Table(('i', itemsize*8), ('?', typecode.islower()))
+    raise TypeError("typecode %r can't be stored in an Arrow file" % typecode)
+
+
+def _typecode(field):
+    """The typecode for an Arrow Field table"""
+    type_id = field.scalar(2, 'B')
+    arrow_type = field.table(3)
+    if type_id == _TYPE_FLOATING_POINT:
+        precision = arrow_type.scalar(0, 'h')
+        if precision == _PRECISION_SINGLE:
+            return 'f'
+        if precision == _PRECISION_DOUBLE:
+            return 'd'
+    elif type_id == _TYPE_INT:
+        itemsize = arrow_type.scalar(0, 'i') // 8
+        for typecode in ('bhil' if arrow_type.scalar(1, '?', False) else 'BHIL'):
+            if ffi.sizeof(_typecode_to_type[typecode]) == itemsize:
+                return typecode
+    raise TypeError("column %r has an unsupported Arrow type" % field.string(0).decode())
+
+
+def _schema(columns):
+    fields = []
+    for name, arr in columns:
+        type_id, type_table = _arrow_type(arr.typecode, arr.itemsize)
+        fields.append(_Table(
+            name.encode('utf-8'), ('?', False), ('B', type_id), type_table,
+            None, _TableVector([]),
+        ))
+    return _Table(('h', _NATIVE_ENDIAN), _TableVector(fields))
+
+
+def _message(header_type, header, body_length):
+    return _encode(_Table(
+        ('h', _METADATA_V5), ('B', header_type), header, ('q', body_length),
+    ))
+
+
+def _columns(columns):
+    """Validate the columns to write, returns a list of (name, array)"""
+    if isinstance(columns, collections.abc.Mapping):
+        columns = columns.items()
+    columns = list(columns)
+    for name, arr in columns:
+        if not isinstance(arr, (mmaparray, array.array)):
+            raise TypeError("column %r is not an array" % name)
+    if len(set(len(arr) for _, arr in columns)) > 1:
+        raise ValueError("columns must have the same length")
+    return columns
+
+
+def _column_buffer(arr):
+    """Buffer of the items of an array"""
+    if isinstance(arr, mmaparray):
+        return ffi.buffer(arr._data, len(arr)*arr.itemsize)
+    return memoryview(arr).cast('B')
+
+
+def write_file(path, columns):
+    """Write columns to an Arrow IPC file as one record batch.
+    The data of each column starts on an mmap allocation granularity
+    boundary so read_file can map it without copying.
+    :path: the file to write
+    :columns: mapping of names to arrays, or a sequence of (name, array)
+        pairs, the arrays (mmaparray or array.array) must have the same
+        length and a numeric typecode
+    """
+    columns = _columns(columns)
+    length = len(columns[0][1]) if columns else 0
+    granularity = mmap.ALLOCATIONGRANULARITY
+
+    # body layout, each column is an empty validity buffer and its data
+    buffers = []
+    body_length = 0
+    for _, arr in columns:
+        body_length = _align(body_length, granularity)
+        buffers.append((body_length, 0))
+        buffers.append((body_length, len(arr)*arr.itemsize))
+        body_length = _align(body_length + len(arr)*arr.itemsize, 8)
+
+    schema = _schema(columns)
+    schema_message = _message(_HEADER_SCHEMA, schema, 0)
+    batch_message = _message(_HEADER_RECORD_BATCH, _Table(
+        ('q', length),
+        _StructVector(_FIELD_NODE, [(length, 0)] * len(columns)),
+        _StructVector(_BUFFER, buffers),
+    ), body_length)
+
+    with open(path, 'wb') as f:
+        f.write(MAGIC + b'\x00\x00')
+        f.write(struct.pack('<Ii', _CONTINUATION, len(schema_message)) + schema_message)
+
+        # pad the metadata so that the body starts on a boundary
+        batch_offset = f.tell()
+        metadata_length = _align(batch_offset + 8 + len(batch_message), granularity) - batch_offset
+        f.write(struct.pack('<Ii', _CONTINUATION, metadata_length - 8) + batch_message)
+        f.write(bytes(metadata_length - 8 - len(batch_message)))
+        body = f.tell()
+        for (_, arr), (offset, size) in zip(columns, buffers[1::2]):
+            f.write(bytes(body + offset - f.tell()))
+            f.write(_column_buffer(arr))
+        f.write(bytes(body + body_length - f.tell()))
+
+        # end of stream marker and the footer
+        f.write(struct.pack('<Ii', _CONTINUATION, 0))
+        footer = _encode(_Table(
+            ('h', _METADATA_V5), schema,
+            _StructVector(_BLOCK, []),
+            _StructVector(_BLOCK, [(batch_offset, metadata_length, body_length)]),
+        ))
+        f.write(footer + struct.pack('<i', len(footer)) + MAGIC)
+
+
+def _read_footer(f, size):
+    """Read and check the footer of an Arrow file"""
+    if size < 2*len(MAGIC) + 6:
+        raise ValueError("not an Arrow file")
+    f.seek(0)
+    start = f.read(len(MAGIC))
+    f.seek(size - len(MAGIC) - 4)
+    tail = f.read(len(MAGIC) + 4)
+    if start != MAGIC or tail[4:] != MAGIC:
+        raise ValueError("not an Arrow file")
+    footer_length = struct.unpack('<i', tail[:4])[0]
+    f.seek(size - len(MAGIC) - 4 - footer_length)
+    return _Reader.root(f.read(footer_length))
+
+
+def _read_message(f, offset, metadata_length):
+    """Read the flatbuffer of the message at offset"""
+    f.seek(offset)
+    metadata = f.read(metadata_length)
+    start = 8 if struct.unpack_from('<I', metadata)[0] == _CONTINUATION else 4
+    return _Reader.root(metadata, start)
+
+
+def read_file(path, batch=0, access=mmap.ACCESS_COPY):
+    """Read a record batch of an Arrow IPC file.
+    Columns whose data is aligned to the mmap allocation granularity, like
+    those written by write_file, are mapped from the file without copying,
+    others are copied into anonymous mappings. Mapped columns can't be
+    resized, that raises BufferError.
+    :path: the file to read
+    :batch: the index of the record batch to read
+    :access: the access used to map columns, by default changes are
+        private to the process. mmap.ACCESS_WRITE writes them to the file.
+        mmap.ACCESS_READ isn't supported, mmaparrays write through pointers
+        and would crash on a read only mapping.
+    :returns: dict mapping the column names to mmaparrays
+    """
+    if access not in (mmap.ACCESS_COPY, mmap.ACCESS_WRITE):
+        raise ValueError("access must be mmap.ACCESS_COPY or mmap.ACCESS_WRITE")
+    granularity = mmap.ALLOCATIONGRANULARITY
+    with open(path, 'r+b' if access == mmap.ACCESS_WRITE else 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        footer = _read_footer(f, size)
+        schema = footer.table(1)
+        if schema.scalar(0, 'h') != _NATIVE_ENDIAN:
+            raise ValueError("the file's byte order is not the native byte order")
+        fields = schema.tables(1)
+        blocks = footer.structs(3, _BLOCK)
+        offset, metadata_length, body_length = blocks[batch]
+        message = _read_message(f, offset, metadata_length)
+        if message.scalar(1, 'B') != _HEADER_RECORD_BATCH:
+            raise ValueError("block %d is not a record batch" % batch)
+        record_batch = message.table(2)
+        if record_batch.table(3) is not None:
+            raise ValueError("compressed Arrow files are not supported")
+        length = record_batch.scalar(0, 'q')
+        nodes = record_batch.structs(1, _FIELD_NODE)
+        buffers = record_batch.structs(2, _BUFFER)
+        body = offset + metadata_length
+
+        result = {}
+        for i, field in enumerate(fields):
+            name = field.string(0).decode('utf-8')
+            typecode = _typecode(field)
+            if nodes[i][1]:
+                raise ValueError("column %r has null values" % name)
+            column = mmaparray(typecode)
+            nbytes = length*column.itemsize
+            data_offset = body + buffers[2*i + 1][0]
+            if nbytes and data_offset % granularity == 0:
+                column = mmaparray(typecode, mmap=mmap.mmap(
+                    f.fileno(), nbytes, access=access, offset=data_offset
+                ))
+                # resizing would truncate the whole file
+                column._fixed = True
+            elif nbytes:
+                column._resize(nbytes)
+                f.seek(data_offset)
+                f.readinto(ffi.buffer(column._data, nbytes))
+            result[name] = column
+        return result
@@ -0,0 +1,212 @@
+"""mmap backed array of bits"""
+import operator
+
+from .mmap_array import mmaparray, ffi, C
+from . import parallel
+
+__all__ = [
+    "mmapbitarray",
+]
+
+_AND, _OR, _XOR, _NOT = 0, 1, 2, 3
+
+
+def _words_for(length):
+    """Number of 64 bit words needed to hold length bits"""
+    return (length + 63) // 64
+
+
+class mmapbitarray:
+    """mmap backed array of bits, packed 64 to a word.
+
+    Bit i is bit i % 64 of the native 64 bit word i // 64. Bits past the
+    end of the array in the last word are always zero. Counting, searching
+    and the bitwise operators work a word at a time in C.
+    """
+    def __init__(self, data=None, mmap=None):
+        """
+        :data: the number of (zero) bits, or an iterable of truth values
+        :mmap: optional mmap to use as backing, every bit of the whole
+            64 bit words it holds is part of the array
+        """
+        if mmap is None:
+            self._storage = mmaparray('B')
+        else:
+            self._storage = mmaparray('B', mmap=mmap)
+            self._storage._setsize(len(self._storage) - len(self._storage) % 8)
+        self._setlength(len(self._storage)*8)
+
+        if isinstance(data, int):
+            self.resize(data)
+        elif data is not None:
+            self.extend(data)
+
+    def _setlength(self, length):
+        self._length = length
+        self._words = ffi.cast('uint64_t *', self._storage._data)
+
+    def resize(self, length):
+        """Grow or shrink to the given number of bits, new bits are zero"""
+        length = operator.index(length)
+        if length < 0:
+            raise ValueError("length must not be negative")
+        old_length = self._length
+        if length < old_length:
+            # keep the bits past the end zero
+            C.mba_fill_bits(self._words, length, _words_for(length)*64, 0)
+        self._storage._resize(_words_for(length)*8)
+        self._setlength(length)
+
+    def _index(self, index):
+        index = operator.index(index)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("bit index out of range")
+        return index
+
+    def _range(self, start, stop):
+        start, stop, _ = slice(start, stop).indices(self._length)
+        return start, max(start, stop)
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        index = self._index(index)
+        return bool((self._words[index >> 6] >> (index & 63)) & 1)
+
+    def __setitem__(self, index, value):
+        index = self._index(index)
+        bit = 1 << (index & 63)
+        if value:
+            self._words[index >> 6] |= bit
+        else:
+            self._words[index >> 6] &= ~bit & 0xffffffffffffffff
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self[i]
+
+    def __repr__(self):
+        return "mmapbitarray('{}')".format(
+            "".join('1' if bit else '0' for bit in self)
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, mmapbitarray):
+            return NotImplemented
+        return self._length == other._length and self.tobytes() == other.tobytes()
+
+    def flip(self, index):
+        """Invert a bit and return its new value"""
+        index = self._index(index)
+        self._words[index >> 6] ^= 1 << (index & 63)
+        return self[index]
+
+    def fill(self, value, start=None, stop=None):
+        """Set every bit in [start:stop] to value"""
+        start, stop = self._range(start, stop)
+        C.mba_fill_bits(self._words, start, stop, 1 if value else 0)
+
+    def append(self, value):
+        """Append a bit"""
+        length = self._length
+        self.resize(length + 1)
+        if value:
+            self[length] = True
+
+    def extend(self, values):
+        """Append bits from an iterable of truth values"""
+        values = [bool(value) for value in values]
+        length = self._length
+        self.resize(length + len(values))
+        for i, value in enumerate(values, length):
+            if value:
+                self._words[i >> 6] |= 1 << (i & 63)
+
+    def count(self, value=True, start=None, stop=None, threads=None):
+        """Number of bits in [start:stop] equal to value (popcount)"""
+        start, stop = self._range(start, stop)
+        words = self._words
+        ones = sum(parallel.run(
+            stop - start,
+            lambda begin, end: C.mba_count_bits(words, start + begin, start + end),
+            threads,
+        ))
+        return ones if value else (stop - start) - ones
+
+    def find(self, value=True, start=None, stop=None, threads=None):
+        """Index of the first bit in [start:stop] equal to value, or -1"""
+        start, stop = self._range(start, stop)
+        words = self._words
+        value = 1 if value else 0
+        def find_part(begin, end):
+            return C.mba_find_bit(words, start + begin, start + end, value)
+        for found, (_, end) in zip(parallel.run(stop - start, find_part, threads),
+                                   parallel.partition(stop - start, threads)):
+            if found < start + end:
+                return found
+        return -1
+
+    def any(self):
+        """True if any bit is set"""
+        return self.find(True) >= 0
+
+    def all(self):
+        """True if every bit is set"""
+        return self.find(False) < 0
+
+    def _bitop(self, other, op, out):
+        """Combine the words of self and other into out"""
+        if other is not None:
+            if not isinstance(other, mmapbitarray):
+                return NotImplemented
+            if other._length != self._length:
+                raise ValueError("bit arrays must have the same length")
+        a = self._words
+        b = a if other is None else other._words
+        dst = out._words
+        parallel.run(
+            _words_for(self._length),
+            lambda begin, end: C.mba_bitop(dst + begin, a + begin, b + begin, end - begin, op),
+        )
+        if op == _NOT:
+            C.mba_fill_bits(dst, self._length, _words_for(self._length)*64, 0)
+        return out
+
+    def _new(self):
+        return mmapbitarray(self._length)
+
+    def __and__(self, other):
+        return self._bitop(other, _AND, self._new())
+
+    def __or__(self, other):
+        return self._bitop(other, _OR, self._new())
+
+    def __xor__(self, other):
+        return self._bitop(other, _XOR, self._new())
+
+    def __invert__(self):
+        return self._bitop(None, _NOT, self._new())
+
+    def __iand__(self, other):
+        return self._bitop(other, _AND, self)
+
+    def __ior__(self, other):
+        return self._bitop(other, _OR, self)
+
+    def __ixor__(self, other):
+        return self._bitop(other, _XOR, self)
+
+    def buffer_info(self):
+        """Tuple of address, length in bytes of the words"""
+        return self._storage.buffer_info()
+
+    def tobytes(self):
+        """Returns a bytes object holding the words"""
+        return self._storage.tobytes()
+
+    def tolist(self):
+        """Convert to a list of bools"""
+        return list(self)
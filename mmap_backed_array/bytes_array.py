@@ -0,0 +1,147 @@
+"""mmap backed array of variable length byte strings"""
+import array
+import itertools
+import operator
+
+from .mmap_array import mmaparray, ffi, C
+
+__all__ = [
+    "mmapbytesarray",
+]
+
+
+class mmapbytesarray:
+    """mmap backed array of variable length byte strings.
+
+    The items are stored back to back in a data mapping and an offsets
+    mmaparray('L') holds len(self)+1 offsets into it, item i being
+    data[offsets[i]:offsets[i+1]]. Both mappings can be shared with other
+    processes like any mmaparray.
+    """
+    def __init__(self, data=None, offsets_mmap=None, data_mmap=None):
+        """
+        :data: optional iterable of bytes-like items to append
+        :offsets_mmap: optional mmap holding the offsets
+        :data_mmap: optional mmap holding the item data, required if
+            offsets_mmap is given
+        """
+        if (offsets_mmap is None) != (data_mmap is None):
+            raise TypeError("offsets_mmap and data_mmap must be given together")
+        if offsets_mmap is None:
+            self._offsets = mmaparray('L', (0,))
+            self._data = mmaparray('B')
+        else:
+            self._offsets = mmaparray('L', mmap=offsets_mmap)
+            self._data = mmaparray('B', mmap=data_mmap)
+            if not len(self._offsets):
+                self._offsets.append(0)
+            if self._offsets[-1] > len(self._data):
+                raise ValueError("offsets refer past the end of the data mmap")
+            # the data mmap may have been preallocated past the last item
+            self._data._setsize(self._offsets[-1])
+
+        if data is not None:
+            self.extend(data)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _index(self, index):
+        index = operator.index(index)
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("index out of range")
+        return index
+
+    def _bounds(self, index):
+        offsets = self._offsets._data
+        return offsets[index], offsets[index + 1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        start, stop = self._bounds(self._index(index))
+        return bytes(ffi.buffer(self._data._data + start, stop - start))
+
+    def view(self, index):
+        """Zero copy memoryview of an item.
+        The memoryview refers directly to the mapping and must not be used
+        after more items have been added.
+        """
+        start, stop = self._bounds(self._index(index))
+        return memoryview(ffi.buffer(self._data._data + start, stop - start))
+
+    def itemlength(self, index):
+        """Length in bytes of an item"""
+        start, stop = self._bounds(self._index(index))
+        return stop - start
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return "mmapbytesarray({!r})".format(list(self))
+
+    def append(self, item):
+        """Append a bytes-like item"""
+        self._data.frombytes(memoryview(item).cast('B'))
+        self._offsets.append(len(self._data))
+
+    def extend(self, items):
+        """Append many bytes-like items at once, the data mapping is resized
+        once and each item is copied straight into place.
+        """
+        source = items  # keeps the mapping of views of another array alive
+        if items is self:
+            items = list(items)
+        elif isinstance(items, mmapbytesarray):
+            items = [items.view(i) for i in range(len(items))]
+        items = [memoryview(item).cast('B') for item in items]
+        if not items:
+            return
+        base = len(self._data)
+        ends = array.array('L', itertools.accumulate(
+            itertools.chain((base,), (item.nbytes for item in items))
+        ))
+        self._data._resize(ends[-1])
+        for start, item in zip(ends, items):
+            if item.nbytes:
+                self._data._copy_in(start, item, item.nbytes)
+        del ends[0]
+        self._offsets.extend(ends)
+
+    def bisect_left(self, key, lo=0, hi=None):
+        """Index where key would be inserted to keep sorted items sorted,
+        before any equal items. The items in [lo:hi] must be sorted.
+        """
+        return self._bisect(key, lo, hi, 0)
+
+    def bisect_right(self, key, lo=0, hi=None):
+        """Like bisect_left but after any items equal to key"""
+        return self._bisect(key, lo, hi, 1)
+
+    def _bisect(self, key, lo, hi, right):
+        if hi is None:
+            hi = len(self)
+        if not 0 <= lo <= hi <= len(self):
+            raise ValueError("lo and hi must satisfy 0 <= lo <= hi <= len(self)")
+        key = ffi.from_buffer(memoryview(key).cast('B'))
+        return C.mba_bytes_bisect(
+            self._offsets._data, self._data._data, lo, hi, key, len(key), right
+        )
+
+    def search_sorted(self, key):
+        """Index of key in an array whose items are sorted, or -1"""
+        index = self.bisect_left(key)
+        if index < len(self) and self[index] == bytes(key):
+            return index
+        return -1
+
+    def tolist(self):
+        """Convert to a list of bytes"""
+        return list(self)
+
+    offsets = property(operator.attrgetter('_offsets'))
@@ -0,0 +1,166 @@
+"""
+Block level deltas between two versions of an array.
+
+diff compares the mappings of an old and a new version of a table block
+by block in C across the thread pool, and packs the blocks that changed
+into a patch. apply_patch writes only those blocks into an array holding
+the old version, so refreshing a large file backed table opened with
+mmaparray.open costs in proportion to what changed rather than to its
+size.
+
+A patch is an mmaparray('B') holding a header, the indices of the
+changed blocks and their new bytes, so it can be written to a file or
+sent elsewhere as it is.
+"""
+import os
+import struct
+
+from .mmap_array import mmaparray, ffi, C
+from . import parallel
+
+__all__ = ["diff", "apply_patch", "patch_info", "save_patch", "load_patch"]
+
+DEFAULT_BLOCK_SIZE = 1 << 16
+
+_MAGIC = b'MBAPATCH'
+# magic, typecode, block size, old size in bytes, new size in bytes,
+# number of changed blocks
+_HEADER = struct.Struct('<8sc7xQQQQ')
+
+
+def diff(old, new, block_size=DEFAULT_BLOCK_SIZE, threads=None):
+    """Find the blocks of new that differ from old.
+    :old: the mmaparray holding the old version
+    :new: the mmaparray holding the new version, of the same typecode
+    :block_size: the number of bytes in each block
+    :returns: the patch as an mmaparray('B'), apply it with apply_patch
+    """
+    if old.typecode != new.typecode:
+        raise TypeError("can't diff arrays of different typecodes")
+    if block_size < 1:
+        raise ValueError("block_size must be positive")
+    size = new._size
+    changed = mmaparray._zeros('B', -(-size // block_size))
+    flags = ffi.cast('unsigned char *', changed._data)
+    old_data = ffi.cast('unsigned char *', old._data)
+    new_data = ffi.cast('unsigned char *', new._data)
+
+    def diff_part(begin, end):
+        # each partition takes the blocks starting in its range of bytes
+        C.mba_diff_blocks(old_data, old._size, new_data, size, block_size,
+                          -(-begin // block_size), -(-end // block_size), flags)
+    parallel.run(size, diff_part, threads)
+
+    blocks = mmaparray('L', (i for i, flag in enumerate(changed.tobytes()) if flag))
+    count = len(blocks)
+    data_size = _data_size(block_size, size, count, blocks[-1] if count else 0)
+    header = _HEADER.pack(_MAGIC, old.typecode.encode(), block_size, old._size, size, count)
+    patch = mmaparray._zeros('B', _HEADER.size + blocks._size + data_size)
+    out = ffi.cast('unsigned char *', patch._data)
+    ffi.memmove(out, header, _HEADER.size)
+    ffi.memmove(out + _HEADER.size, blocks._data, blocks._size)
+    C.mba_copy_blocks(out + _HEADER.size + blocks._size, new_data, size, block_size,
+                      ffi.cast('uint64_t *', blocks._data), count, 0)
+    return patch
+
+
+def patch_info(patch):
+    """Read the header of a patch.
+    :returns: dict of the typecode, block_size, old_size and new_size in
+        bytes, and the indices of the changed blocks as a list
+    """
+    data, typecode, block_size, old_size, new_size, count = _parse(patch)
+    blocks = ffi.cast('uint64_t *', data + _HEADER.size)
+    return {
+        'typecode': typecode,
+        'block_size': block_size,
+        'old_size': old_size,
+        'new_size': new_size,
+        'blocks': [blocks[i] for i in range(count)],
+    }
+
+
+def apply_patch(arr, patch):
+    """Write the changed blocks of a patch into an array in place.
+    The array is resized to the size of the new version first, every
+    other byte is left as it is.
+    :arr: the mmaparray holding the version the patch was made from
+    :patch: a patch from diff or load_patch, or any bytes-like object
+        holding one
+    :raises ValueError: if the array isn't the size the patch was made from
+    """
+    data, typecode, block_size, old_size, new_size, count = _parse(patch)
+    if typecode != arr.typecode:
+        raise TypeError("patch is for typecode %r, not %r" % (typecode, arr.typecode))
+    if arr._size != old_size:
+        raise ValueError(
+            "array is %d bytes but the patch was made from %d bytes" % (arr._size, old_size)
+        )
+    if new_size != arr._size:
+        arr._resize(new_size)
+    blocks = data + _HEADER.size
+    C.mba_copy_blocks(ffi.cast('unsigned char *', arr._data), blocks + count * 8,
+                      new_size, block_size, ffi.cast('uint64_t *', blocks), count, 1)
+
+
+def save_patch(patch, path):
+    """Write a patch to a file"""
+    with open(path, 'wb') as f:
+        f.write(ffi.buffer(_parse(patch)[0], len(patch)))
+
+
+def load_patch(path):
+    """Read a patch written by save_patch.
+    :returns: the patch as an mmaparray('B')
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        patch = mmaparray._zeros('B', size)
+        if f.readinto(ffi.buffer(patch._data, size)) != size:
+            raise ValueError("patch file %s changed while reading" % path)
+    _parse(patch)
+    return patch
+
+
+def _data_size(block_size, new_size, count, last_block):
+    """The number of bytes of block data in a patch"""
+    if not count:
+        return 0
+    return (count - 1) * block_size + min(block_size, new_size - last_block * block_size)
+
+
+def _parse(patch):
+    """Check a patch and read its header.
+    :returns: tuple of a pointer to the bytes of the patch, the typecode,
+        the block size, the old and new sizes and the number of blocks
+    """
+    if isinstance(patch, mmaparray):
+        if patch.itemsize != 1:
+            raise TypeError("a patch is an array of bytes")
+        data = ffi.cast('unsigned char *', patch._data)
+        size = patch._size
+    else:
+        data = ffi.from_buffer('unsigned char[]', patch)
+        size = len(data)
+    if size < _HEADER.size:
+        raise ValueError("patch is truncated")
+    magic, typecode, block_size, old_size, new_size, count = _HEADER.unpack(
+        ffi.buffer(data, _HEADER.size)
+    )
+    if magic != _MAGIC:
+        raise ValueError("not a patch")
+    expected = _HEADER.size + count * 8
+    if size >= expected and count:
+        blocks = ffi.cast('uint64_t *', data + _HEADER.size)
+        # the blocks must be in order and inside the new version
+        previous = -1
+        for i in range(count):
+            if blocks[i] <= previous:
+                raise ValueError("patch blocks are out of order")
+            previous = blocks[i]
+        if previous * block_size >= new_size:
+            raise ValueError("patch block %d is past the end of the array" % previous)
+        expected += _data_size(block_size, new_size, count, previous)
+    if size != expected:
+        raise ValueError("patch is %d bytes, expected %d" % (size, expected))
+    return data, typecode.decode(), block_size, old_size, new_size, count
@@ -0,0 +1,297 @@
+"""mmap backed hash table from 64 bit integer keys to fixed width values"""
+import array
+import collections.abc
+import operator
+
+from .mmap_array import mmaparray, ffi, C, _typecode_to_type
+
+__all__ = [
+    "mmapdict",
+]
+
+_MAGIC = b'MBADICT1'
+_HEADER_SIZE = ffi.sizeof('struct mba_dict_header')
+_MIN_CAPACITY = 8
+_ZERO = ffi.new('char[1]')
+
+
+def _layout(capacity, itemsize):
+    """Byte offsets of the keys, values and used flags and the total size
+    of a table with the given capacity.
+    """
+    keys = _HEADER_SIZE
+    values = keys + 8*capacity
+    used = values + itemsize*capacity
+    return keys, values, used, used + capacity
+
+
+def _key_vector(keys):
+    """Get a pointer to a vector of 64 bit keys.
+    :returns: tuple of (pointer, length, owner) where owner must be kept
+        alive while the pointer is used
+    """
+    if isinstance(keys, mmaparray) and keys.itemsize == 8 and keys.typecode in 'lL':
+        return ffi.cast('uint64_t *', keys._data), len(keys), keys
+    try:
+        view = memoryview(keys)
+    except TypeError:
+        view = None
+    if (view is None or view.ndim != 1 or view.itemsize != 8 or
+            view.format.lstrip('@=') not in ('l', 'L', 'q', 'Q')):
+        view = memoryview(array.array('Q', keys))
+    owner = ffi.from_buffer(view)
+    return ffi.cast('uint64_t *', owner), len(view), owner
+
+
+class mmapdict(collections.abc.MutableMapping):
+    """mmap backed hash table mapping unsigned 64 bit integers to values of
+    a single typecode.
+
+    The table uses open addressing with linear probing and is stored in a
+    single mapping (header, keys, values and used flags), so it can be
+    shared between processes like an mmaparray. It grows by rehashing into
+    a mapping of twice the capacity when the load factor is exceeded, and
+    other processes sharing the table map the grown table on their next
+    access. Only one process may modify the table at a time.
+    """
+    def __init__(self, typecode, data=None, capacity=16, max_load=0.75, mmap=None):
+        """
+        :typecode: the typecode of the values
+        :data: optional mapping or iterable of (key, value) pairs to add
+        :capacity: initial number of slots, rounded up to a power of two
+        :max_load: the fraction of the slots that may be used before the
+            table grows
+        :mmap: optional mmap to store the table in. An mmap holding an
+            existing table is opened, an empty one is initialised.
+        """
+        try:
+            itemtype = _typecode_to_type[typecode]
+        except (KeyError, TypeError):
+            raise ValueError("bad typecode %r" % (typecode,))
+        if not 0 < max_load < 1:
+            raise ValueError("max_load must be between 0 and 1")
+        self._typecode = typecode
+        self._itemtype = itemtype
+        self._itemsize = ffi.sizeof(itemtype)
+        self._ptrtype = ffi.getctype(itemtype, '*')
+        self._max_load = max_load
+        self._get_many = getattr(C, 'mba_dict_get_many_{}'.format(self._itemsize))
+        self._put_many = getattr(C, 'mba_dict_put_many_{}'.format(self._itemsize))
+        self._delete = getattr(C, 'mba_dict_delete_{}'.format(self._itemsize))
+        self._rehash = getattr(C, 'mba_dict_rehash_{}'.format(self._itemsize))
+
+        # scratch space for single item operations
+        self._key_scratch = ffi.new('uint64_t[1]')
+        self._value_scratch = ffi.new(ffi.getctype(itemtype, '[1]'))
+        self._found_scratch = ffi.new('uint8_t[1]')
+
+        if mmap is None:
+            self._storage = mmaparray('B')
+            self._initialize(capacity)
+        else:
+            self._storage = mmaparray('B', mmap=mmap)
+            self._open(capacity)
+
+        if data is not None:
+            if isinstance(data, collections.abc.Mapping):
+                data = data.items()
+            for key, value in data:
+                self[key] = value
+
+    def _initialize(self, capacity):
+        """Set up an empty table with at least the given capacity"""
+        capacity = max(_MIN_CAPACITY, 1 << (max(capacity, 1) - 1).bit_length())
+        size = _layout(capacity, self._itemsize)[-1]
+        # only ever grow the mapping, readers in other processes may be
+        # probing it and would fault on pages cut off by shrinking it
+        if len(self._storage) < size:
+            self._storage._resize(size)
+        C.mba_fill_1(self._storage._data, size, _ZERO)
+        self._bind()
+        self._header.magic = _MAGIC
+        self._header.capacity = capacity
+        self._header.count = 0
+        self._header.itemsize = self._itemsize
+        self._header.typecode = self._typecode.encode('ascii')
+        self._bind()
+
+    def _open(self, capacity):
+        """Open the table stored in the mmap, or initialise an empty mmap"""
+        raw = b''
+        if len(self._storage) >= _HEADER_SIZE:
+            raw = bytes(ffi.buffer(self._storage._data, _HEADER_SIZE))
+        if not raw.strip(b'\x00'):
+            self._initialize(capacity)
+            return
+        if raw[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("mmap does not hold an mmapdict")
+        self._bind()
+        if self._header.typecode != self._typecode.encode('ascii'):
+            raise TypeError(
+                "mmap holds values of typecode %r" % self._header.typecode.decode('ascii')
+            )
+        if len(self._storage) < _layout(self._header.capacity, self._itemsize)[-1]:
+            raise ValueError("mmap is too small for the table it holds")
+
+    def _bind(self):
+        """Refresh the pointers into the storage after it has been resized"""
+        base = ffi.cast('char *', self._storage._data)
+        self._header = ffi.cast('struct mba_dict_header *', base)
+        capacity = self._header.capacity
+        keys, values, used, _ = _layout(capacity, self._itemsize)
+        self._capacity = capacity
+        self._mask = capacity - 1
+        self._max_count = min(capacity - 1, int(capacity*self._max_load))
+        self._count = ffi.addressof(self._header, 'count')
+        self._keys = ffi.cast('uint64_t *', base + keys)
+        self._values = ffi.cast(self._ptrtype, base + values)
+        self._used = ffi.cast('uint8_t *', base + used)
+
+    def _refresh(self):
+        """Rebind to the table if another process sharing the mapping grew
+        it, extending the mapping to the new size of the file.
+        :raises RuntimeError: if the mapping can't follow the table
+        """
+        capacity = self._header.capacity
+        if capacity == self._capacity or not capacity:
+            # unchanged, or the writer is still setting up the grown table
+            return
+        size = _layout(capacity, self._itemsize)[-1]
+        backing = self._storage._mmap
+        if len(backing) < size:
+            try:
+                # resizing truncates the file, keep it at its current size
+                if backing.size() < size:
+                    raise ValueError
+                backing.resize(backing.size())
+            except (ValueError, OSError, SystemError, TypeError):
+                raise RuntimeError("mmapdict was grown by another process, reopen it")
+        self._storage._setsize(size)
+        self._bind()
+
+    def _grow(self):
+        """Rehash into a table of twice the capacity"""
+        old = mmaparray('B', self._storage)
+        old_base = ffi.cast('char *', old._data)
+        capacity = self._capacity
+        count = self._header.count
+        keys, values, used, _ = _layout(capacity, self._itemsize)
+        self._initialize(2*capacity)
+        self._rehash(
+            ffi.cast('uint64_t *', old_base + keys), ffi.cast('uint8_t *', old_base + used),
+            old_base + values, capacity,
+            self._keys, self._used, self._values, self._mask,
+        )
+        self._header.count = count
+
+    def __len__(self):
+        return self._header.count
+
+    def __getitem__(self, key):
+        self._refresh()
+        try:
+            self._key_scratch[0] = key
+        except (TypeError, OverflowError):
+            raise KeyError(key)
+        self._get_many(self._keys, self._used, self._values, self._mask,
+                       self._key_scratch, 1, self._value_scratch, self._found_scratch)
+        if not self._found_scratch[0]:
+            raise KeyError(key)
+        return self._value_scratch[0]
+
+    def __setitem__(self, key, value):
+        self._refresh()
+        self._key_scratch[0] = operator.index(key)
+        self._value_scratch[0] = value
+        while not self._put_many(self._keys, self._used, self._values, self._mask,
+                                 self._count, self._max_count,
+                                 self._key_scratch, self._value_scratch, 1):
+            self._grow()
+
+    def __delitem__(self, key):
+        self._refresh()
+        if (not isinstance(key, int) or not 0 <= key < 2**64 or
+                not self._delete(self._keys, self._used, self._values, self._mask, key)):
+            raise KeyError(key)
+        self._header.count -= 1
+
+    def __iter__(self):
+        self._refresh()
+        capacity = self._capacity
+        for i in range(capacity):
+            self._refresh()
+            if self._capacity != capacity:
+                raise RuntimeError("mmapdict changed size during iteration")
+            if self._used[i]:
+                yield self._keys[i]
+
+    def __repr__(self):
+        return "mmapdict({!r}, {!r})".format(self._typecode, dict(self.items()))
+
+    def clear(self):
+        """Remove all the items, the capacity is kept"""
+        self._refresh()
+        self._initialize(self._capacity)
+
+    def get_many(self, keys, default=0, found=None):
+        """Look up many keys at once.
+        :keys: mmaparray, array.array or buffer of 64 bit integer keys, or
+            an iterable of non-negative integers
+        :default: the value returned for missing keys
+        :found: optional array of typecode 'B' with the same length as keys,
+            set to 1 for each key that is present and 0 otherwise
+        :returns: mmaparray of the values
+        """
+        self._refresh()
+        key_ptr, count, owner = _key_vector(keys)
+        out = mmaparray(self._typecode, array.array(self._typecode, [default])*count)
+        found_ptr = ffi.NULL
+        if found is not None:
+            if not isinstance(found, (array.array, mmaparray)) or found.typecode != 'B':
+                raise TypeError("found must be an array of typecode 'B'")
+            if len(found) != count:
+                raise ValueError("found must have the same length as keys")
+            found_ptr = ffi.cast('uint8_t *', ffi.from_buffer(found)
+                                 if isinstance(found, array.array) else found._data)
+        if count:
+            self._get_many(self._keys, self._used, self._values, self._mask,
+                           key_ptr, count, out._data, found_ptr)
+        return out
+
+    def put_many(self, keys, values):
+        """Store many key, value pairs at once.
+        :keys: mmaparray, array.array or buffer of 64 bit integer keys, or
+            an iterable of non-negative integers
+        :values: array of the value typecode (or an iterable of values) with
+            the same length as keys
+        """
+        self._refresh()
+        key_ptr, count, owner = _key_vector(keys)
+        if not isinstance(values, (array.array, mmaparray)):
+            values = array.array(self._typecode, values)
+        if values.typecode != self._typecode:
+            raise TypeError("values must be an array of the same type")
+        if len(values) != count:
+            raise ValueError("values must have the same length as keys")
+        if isinstance(values, mmaparray):
+            value_owner = values
+            value_ptr = ffi.cast('char *', values._data)
+        else:
+            value_owner = ffi.from_buffer(values)
+            value_ptr = ffi.cast('char *', value_owner)
+        done = 0
+        while done < count:
+            done += self._put_many(
+                self._keys, self._used, self._values, self._mask,
+                self._count, self._max_count,
+                key_ptr + done, value_ptr + done*self._itemsize, count - done,
+            )
+            if done < count:
+                self._grow()
+
+    @property
+    def capacity(self):
+        self._refresh()
+        return self._capacity
+
+    typecode = property(operator.attrgetter('_typecode'))
@@ -0,0 +1,106 @@
+"""
+Block checksums for catching truncated or corrupted tables.
+
+The bytes of an array are split into blocks that are checksummed in C
+across the thread pool. save_checksums stores the checksums in a small
+file next to the data, verify (or the verify option of mmaparray)
+compares the data against them, so a damaged file is caught when it is
+opened rather than through wrong lookups.
+"""
+import struct
+
+from .mmap_array import mmaparray, ffi, C
+from . import parallel
+
+__all__ = [
+    "ChecksumError", "block_checksums", "save_checksums", "load_checksums", "verify",
+]
+
+# The algorithms and the ids the kernel and the checksum file use for them
+ALGORITHMS = {'crc32c': 0, 'xxh64': 1}
+
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+_MAGIC = b'MBACSUM1'
+# magic, algorithm id, block size, data size in bytes, number of blocks
+_HEADER = struct.Struct('<8sI4xQQQ')
+
+
+class ChecksumError(ValueError):
+    """The data does not match its checksums"""
+    def __init__(self, message, blocks=()):
+        super().__init__(message)
+        self.blocks = list(blocks)
+
+
+def block_checksums(arr, algorithm='crc32c', block_size=DEFAULT_BLOCK_SIZE, threads=None):
+    """Checksum the bytes of an array in blocks.
+    :arr: the mmaparray
+    :algorithm: 'crc32c' or 'xxh64'
+    :block_size: the number of bytes in each block, the last block holds
+        the remainder
+    :returns: mmaparray('L') of the checksum of each block
+    """
+    try:
+        algorithm_id = ALGORITHMS[algorithm]
+    except KeyError:
+        raise ValueError("unknown checksum algorithm %r" % (algorithm,))
+    if block_size < 1:
+        raise ValueError("block_size must be positive")
+    size = arr._size
+    blocks = -(-size // block_size)
+    result = mmaparray._zeros('L', blocks)
+    data = ffi.cast('unsigned char *', arr._data)
+    out = ffi.cast('uint64_t *', result._data)
+
+    def checksum_part(begin, end):
+        # each partition takes the blocks starting in its range of bytes
+        C.mba_block_checksums(algorithm_id, data, size, block_size,
+                              -(-begin // block_size), -(-end // block_size), out)
+    parallel.run(size, checksum_part, threads)
+    return result
+
+
+def save_checksums(arr, path, algorithm='crc32c', block_size=DEFAULT_BLOCK_SIZE, threads=None):
+    """Checksum an array and store the checksums in a file"""
+    checksums = block_checksums(arr, algorithm, block_size, threads)
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, ALGORITHMS[algorithm], block_size, arr._size, len(checksums)))
+        f.write(ffi.buffer(checksums._data, checksums._size))
+
+
+def load_checksums(path):
+    """Read a checksum file.
+    :returns: tuple of (algorithm, block size, data size in bytes,
+        checksums as an mmaparray('L'))
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size or header[:len(_MAGIC)] != _MAGIC:
+            raise ValueError("%s is not a checksum file" % path)
+        _, algorithm_id, block_size, size, count = _HEADER.unpack(header)
+        checksums = mmaparray._zeros('L', count)
+        if f.readinto(ffi.buffer(checksums._data, checksums._size)) != checksums._size:
+            raise ValueError("checksum file %s is truncated" % path)
+    algorithm = {value: name for name, value in ALGORITHMS.items()}[algorithm_id]
+    return algorithm, block_size, size, checksums
+
+
+def verify(arr, path, threads=None):
+    """Check an array against the checksums stored in a file.
+    :raises ChecksumError: if the size of the data differs or any block
+        doesn't match, the blocks attribute lists the bad blocks
+    """
+    algorithm, block_size, size, expected = load_checksums(path)
+    if arr._size != size:
+        raise ChecksumError(
+            "data is %d bytes but the checksums cover %d bytes" % (arr._size, size)
+        )
+    actual = block_checksums(arr, algorithm, block_size, threads)
+    if actual.tobytes() != expected.tobytes():
+        bad = [i for i, (a, b) in enumerate(zip(actual, expected)) if a != b]
+        raise ChecksumError(
+            "%d of %d blocks don't match their checksums, the first is block %d"
+            % (len(bad), len(expected), bad[0]),
+            bad,
+        )
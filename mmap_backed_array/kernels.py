@@ -0,0 +1,1529 @@
+"""
+C kernels that operate directly on the memory behind an mmaparray.
+
+The declarations and source here are compiled by ``ffi.verify`` in
+mmap_array.py. Kernels that are generic over the element type are written
+once as a C macro and instantiated for each typecode, the functions are
+named ``mba_<kernel>_<typecode>``. cffi releases the GIL for the duration of
+every call into these functions.
+"""
+
+# C types of the typecodes that hold numbers
+_numeric_ctypes = {
+    'b': 'signed char',  'B': 'unsigned char',
+    'h': 'signed short', 'H': 'unsigned short',
+    'i': 'signed int',   'I': 'unsigned int',
+    'l': 'signed long',  'L': 'unsigned long',
+    'f': 'float',        'd': 'double',
+}
+
+_signed_typecodes = 'bhil'
+_unsigned_typecodes = 'BHIL'
+_integer_typecodes = _signed_typecodes + _unsigned_typecodes
+_float_typecodes = 'fd'
+
+# Typecode used to hold running totals of each numeric typecode
+_accumulator_typecodes = dict(
+    [(tc, 'l') for tc in _signed_typecodes] +
+    [(tc, 'L') for tc in _unsigned_typecodes] +
+    [(tc, 'd') for tc in _float_typecodes]
+)
+
+
+def _instantiate(template, typecodes):
+    """Expand a declaration template once for each of the typecodes.
+    :template: format string using {tc}, {T} and {ACC}
+    :typecodes: the typecodes to expand the template for
+    """
+    return "\n".join(
+        template.format(
+            tc=tc,
+            T=_numeric_ctypes[tc],
+            ACC=_numeric_ctypes[_accumulator_typecodes[tc]],
+        )
+        for tc in typecodes
+    )
+
+
+_reduction_cdef = """
+size_t mba_argmin_{tc}(const {T} *p, size_t n);
+size_t mba_argmax_{tc}(const {T} *p, size_t n);
+{ACC} mba_cumsum_{tc}(const {T} *p, size_t n, {ACC} total, {ACC} *out);
+void mba_histogram_{tc}(const {T} *p, size_t n, double low, double high,
+                        unsigned long *counts, size_t nbins);
+"""
+
+_integer_reduction_cdef = """
+void mba_sum_{tc}(const {T} *p, size_t n, long long *hi, unsigned long long *lo);
+int mba_bincount_{tc}(const {T} *p, size_t n, unsigned long *counts, size_t ncounts);
+"""
+
+_float_reduction_cdef = """
+double mba_fsum_{tc}(const {T} *p, size_t n);
+"""
+
+_reduction_source = r"""
+#include <stddef.h>
+#include <math.h>
+
+/* Sums are accumulated in 128 bits as a (hi, lo) pair so that they can
+   never overflow, the caller combines them into a python int. */
+#define MBA_SIGNED_SUM(S, T)                                                \
+void mba_sum_##S(const T *p, size_t n, long long *hi, unsigned long long *lo) \
+{                                                                           \
+    long long h = 0;                                                        \
+    unsigned long long l = 0;                                               \
+    size_t i;                                                               \
+    for (i = 0; i < n; i++) {                                               \
+        long long x = p[i];                                                 \
+        unsigned long long old = l;                                         \
+        l += (unsigned long long)x;                                         \
+        h += (l < old) - (x < 0);                                           \
+    }                                                                       \
+    *hi = h;                                                                \
+    *lo = l;                                                                \
+}
+
+#define MBA_UNSIGNED_SUM(S, T)                                              \
+void mba_sum_##S(const T *p, size_t n, long long *hi, unsigned long long *lo) \
+{                                                                           \
+    long long h = 0;                                                        \
+    unsigned long long l = 0;                                               \
+    size_t i;                                                               \
+    for (i = 0; i < n; i++) {                                               \
+        unsigned long long old = l;                                         \
+        l += p[i];                                                          \
+        h += (l < old);                                                     \
+    }                                                                       \
+    *hi = h;                                                                \
+    *lo = l;                                                                \
+}
+
+/* Compensated (Neumaier) summation for floating point types. */
+#define MBA_FLOAT_SUM(S, T)                                                 \
+double mba_fsum_##S(const T *p, size_t n)                                   \
+{                                                                           \
+    double s = 0.0, c = 0.0;                                                \
+    size_t i;                                                               \
+    for (i = 0; i < n; i++) {                                               \
+        double x = p[i];                                                    \
+        double t = s + x;                                                   \
+        if (fabs(s) >= fabs(x))                                             \
+            c += (s - t) + x;                                               \
+        else                                                                \
+            c += (x - t) + s;                                               \
+        s = t;                                                              \
+    }                                                                       \
+    return s + c;                                                           \
+}
+
+/* Index of the first extreme element, a NaN is reported as soon as it is
+   seen. n must not be zero. */
+#define MBA_ARGEXTREME(NAME, S, T, OP)                                      \
+size_t mba_##NAME##_##S(const T *p, size_t n)                               \
+{                                                                           \
+    size_t i, best = 0;                                                     \
+    T value = p[0];                                                         \
+    if (value != value)                                                     \
+        return 0;                                                           \
+    for (i = 1; i < n; i++) {                                               \
+        T x = p[i];                                                         \
+        if (x != x)                                                         \
+            return i;                                                       \
+        if (x OP value) {                                                   \
+            value = x;                                                      \
+            best = i;                                                       \
+        }                                                                   \
+    }                                                                       \
+    return best;                                                            \
+}
+
+/* Running totals starting from total, integer totals wrap around like the
+   accumulator type. Returns the final total. */
+#define MBA_CUMSUM(S, T, ACC, UACC)                                         \
+ACC mba_cumsum_##S(const T *p, size_t n, ACC total, ACC *out)              \
+{                                                                           \
+    UACC t = (UACC)total;                                                   \
+    size_t i;                                                               \
+    for (i = 0; i < n; i++) {                                               \
+        t += (UACC)p[i];                                                    \
+        out[i] = (ACC)t;                                                    \
+    }                                                                       \
+    return (ACC)t;                                                          \
+}
+
+/* Counts of each value, returns -1 if a value is outside [0, ncounts). */
+#define MBA_BINCOUNT(S, T)                                                  \
+int mba_bincount_##S(const T *p, size_t n, unsigned long *counts, size_t ncounts) \
+{                                                                           \
+    size_t i;                                                               \
+    for (i = 0; i < n; i++) {                                               \
+        T x = p[i];                                                         \
+        if (x < 0 || (unsigned long long)x >= ncounts)                      \
+            return -1;                                                      \
+        counts[(size_t)x]++;                                                \
+    }                                                                       \
+    return 0;                                                               \
+}
+
+/* Equal width bins over [low, high], values outside the range and NaNs are
+   ignored and high itself falls into the last bin. */
+#define MBA_HISTOGRAM(S, T)                                                 \
+void mba_histogram_##S(const T *p, size_t n, double low, double high,       \
+                       unsigned long *counts, size_t nbins)                 \
+{                                                                           \
+    double scale = nbins / (high - low);                                    \
+    size_t i;                                                               \
+    for (i = 0; i < n; i++) {                                               \
+        double x = p[i];                                                    \
+        size_t bin;                                                         \
+        if (!(x >= low && x <= high))                                       \
+            continue;                                                       \
+        bin = (size_t)((x - low) * scale);                                  \
+        if (bin >= nbins)                                                   \
+            bin = nbins - 1;                                                \
+        counts[bin]++;                                                      \
+    }                                                                       \
+}
+
+#define MBA_COMMON_REDUCTIONS(S, T, ACC, UACC)                              \
+    MBA_ARGEXTREME(argmin, S, T, <)                                         \
+    MBA_ARGEXTREME(argmax, S, T, >)                                         \
+    MBA_CUMSUM(S, T, ACC, UACC)                                             \
+    MBA_HISTOGRAM(S, T)
+
+MBA_SIGNED_SUM(b, signed char)
+MBA_SIGNED_SUM(h, signed short)
+MBA_SIGNED_SUM(i, signed int)
+MBA_SIGNED_SUM(l, signed long)
+MBA_UNSIGNED_SUM(B, unsigned char)
+MBA_UNSIGNED_SUM(H, unsigned short)
+MBA_UNSIGNED_SUM(I, unsigned int)
+MBA_UNSIGNED_SUM(L, unsigned long)
+MBA_FLOAT_SUM(f, float)
+MBA_FLOAT_SUM(d, double)
+
+MBA_BINCOUNT(b, signed char)
+MBA_BINCOUNT(h, signed short)
+MBA_BINCOUNT(i, signed int)
+MBA_BINCOUNT(l, signed long)
+MBA_BINCOUNT(B, unsigned char)
+MBA_BINCOUNT(H, unsigned short)
+MBA_BINCOUNT(I, unsigned int)
+MBA_BINCOUNT(L, unsigned long)
+
+MBA_COMMON_REDUCTIONS(b, signed char, signed long, unsigned long)
+MBA_COMMON_REDUCTIONS(h, signed short, signed long, unsigned long)
+MBA_COMMON_REDUCTIONS(i, signed int, signed long, unsigned long)
+MBA_COMMON_REDUCTIONS(l, signed long, signed long, unsigned long)
+MBA_COMMON_REDUCTIONS(B, unsigned char, unsigned long, unsigned long)
+MBA_COMMON_REDUCTIONS(H, unsigned short, unsigned long, unsigned long)
+MBA_COMMON_REDUCTIONS(I, unsigned int, unsigned long, unsigned long)
+MBA_COMMON_REDUCTIONS(L, unsigned long, unsigned long, unsigned long)
+MBA_COMMON_REDUCTIONS(f, float, double, double)
+MBA_COMMON_REDUCTIONS(d, double, double, double)
+"""
+
+# Gather/scatter only moves whole elements around so the kernels are keyed
+# on the element size rather than the typecode, and on the index type.
+_element_ctypes = {
+    1: 'uint8_t', 2: 'uint16_t', 4: 'uint32_t', 8: 'uint64_t',
+}
+
+_index_ctypes = {
+    's1': 'int8_t',  's2': 'int16_t',  's4': 'int32_t',  's8': 'int64_t',
+    'u1': 'uint8_t', 'u2': 'uint16_t', 'u4': 'uint32_t', 'u8': 'uint64_t',
+}
+
+# Values of the mode argument of the gather/scatter kernels
+_index_modes = {'raise': 0, 'wrap': 1, 'clip': 2}
+
+_gather_cdef = "\n".join(
+    """
+long long mba_take_{size}_{ix}(const void *data, size_t n, const void *indices,
+                               size_t m, void *out, int mode);
+long long mba_put_{size}_{ix}(void *data, size_t n, const void *indices,
+                              size_t m, const void *values, int mode);
+""".format(size=size, ix=ix)
+    for size in _element_ctypes for ix in _index_ctypes
+)
+
+_gather_source = r"""
+#include <stdint.h>
+
+#define MBA_RAISE 0
+#define MBA_WRAP 1
+#define MBA_CLIP 2
+
+/* Map index i into [0, n) according to mode, n must not be zero.
+   Returns 0 if the index is out of bounds in MBA_RAISE mode. */
+static int mba_signed_index(long long i, size_t n, int mode, size_t *j)
+{
+    long long length = (long long)n;
+    switch (mode) {
+    case MBA_RAISE:
+        if (i < 0)
+            i += length;
+        if (i < 0 || i >= length)
+            return 0;
+        break;
+    case MBA_WRAP:
+        i %= length;
+        if (i < 0)
+            i += length;
+        break;
+    default:
+        if (i < 0)
+            i = 0;
+        else if (i >= length)
+            i = length - 1;
+    }
+    *j = (size_t)i;
+    return 1;
+}
+
+static int mba_unsigned_index(unsigned long long i, size_t n, int mode, size_t *j)
+{
+    switch (mode) {
+    case MBA_RAISE:
+        if (i >= n)
+            return 0;
+        break;
+    case MBA_WRAP:
+        i %= n;
+        break;
+    default:
+        if (i >= n)
+            i = n - 1;
+    }
+    *j = (size_t)i;
+    return 1;
+}
+
+/* Both kernels return -1 on success or the position in indices of the first
+   out of bounds index. put checks every index before writing anything. */
+#define MBA_GATHER(SIZE, ET, IX, IT, KIND)                                  \
+long long mba_take_##SIZE##_##IX(const void *data, size_t n, const void *indices, \
+                                 size_t m, void *out, int mode)             \
+{                                                                           \
+    const ET *src = (const ET *)data;                                       \
+    const IT *idx = (const IT *)indices;                                    \
+    ET *dst = (ET *)out;                                                    \
+    size_t k, j;                                                            \
+    for (k = 0; k < m; k++) {                                               \
+        if (!mba_##KIND##_index(idx[k], n, mode, &j))                       \
+            return (long long)k;                                            \
+        dst[k] = src[j];                                                    \
+    }                                                                       \
+    return -1;                                                              \
+}                                                                           \
+long long mba_put_##SIZE##_##IX(void *data, size_t n, const void *indices,  \
+                                size_t m, const void *values, int mode)     \
+{                                                                           \
+    ET *dst = (ET *)data;                                                   \
+    const IT *idx = (const IT *)indices;                                    \
+    const ET *src = (const ET *)values;                                     \
+    size_t k, j = 0;                                                        \
+    if (mode == MBA_RAISE) {                                                \
+        for (k = 0; k < m; k++) {                                           \
+            if (!mba_##KIND##_index(idx[k], n, mode, &j))                   \
+                return (long long)k;                                        \
+        }                                                                   \
+    }                                                                       \
+    for (k = 0; k < m; k++) {                                               \
+        mba_##KIND##_index(idx[k], n, mode, &j);                            \
+        dst[j] = src[k];                                                    \
+    }                                                                       \
+    return -1;                                                              \
+}
+
+#define MBA_GATHER_ALL_INDICES(SIZE, ET)                                    \
+    MBA_GATHER(SIZE, ET, s1, int8_t, signed)                                \
+    MBA_GATHER(SIZE, ET, s2, int16_t, signed)                               \
+    MBA_GATHER(SIZE, ET, s4, int32_t, signed)                               \
+    MBA_GATHER(SIZE, ET, s8, int64_t, signed)                               \
+    MBA_GATHER(SIZE, ET, u1, uint8_t, unsigned)                             \
+    MBA_GATHER(SIZE, ET, u2, uint16_t, unsigned)                            \
+    MBA_GATHER(SIZE, ET, u4, uint32_t, unsigned)                            \
+    MBA_GATHER(SIZE, ET, u8, uint64_t, unsigned)
+
+MBA_GATHER_ALL_INDICES(1, uint8_t)
+MBA_GATHER_ALL_INDICES(2, uint16_t)
+MBA_GATHER_ALL_INDICES(4, uint32_t)
+MBA_GATHER_ALL_INDICES(8, uint64_t)
+"""
+
+_strided_cdef = "\n".join(
+    """
+void mba_gather_strided_{size}(const void *src, ptrdiff_t stride, size_t n, void *dst);
+void mba_scatter_strided_{size}(void *dst, ptrdiff_t stride, size_t n, const void *src);
+void mba_fill_{size}(void *dst, size_t n, const void *value);
+void mba_delete_strided_{size}(void *data, size_t length, size_t start, size_t step, size_t n);
+""".format(size=size)
+    for size in _element_ctypes
+)
+
+_strided_source = r"""
+#include <string.h>
+
+/* Copy n items that are stride items apart to or from a contiguous block. */
+#define MBA_STRIDED(SIZE, ET)                                               \
+void mba_gather_strided_##SIZE(const void *src, ptrdiff_t stride, size_t n, void *dst) \
+{                                                                           \
+    const ET *from = (const ET *)src;                                       \
+    ET *to = (ET *)dst;                                                     \
+    size_t k;                                                               \
+    if (stride == 1) {                                                      \
+        memmove(to, from, n * SIZE);                                        \
+        return;                                                             \
+    }                                                                       \
+    for (k = 0; k < n; k++)                                                 \
+        to[k] = from[(ptrdiff_t)k * stride];                                \
+}                                                                           \
+void mba_scatter_strided_##SIZE(void *dst, ptrdiff_t stride, size_t n, const void *src) \
+{                                                                           \
+    const ET *from = (const ET *)src;                                       \
+    ET *to = (ET *)dst;                                                     \
+    size_t k;                                                               \
+    if (stride == 1) {                                                      \
+        memmove(to, from, n * SIZE);                                        \
+        return;                                                             \
+    }                                                                       \
+    for (k = 0; k < n; k++)                                                 \
+        to[(ptrdiff_t)k * stride] = from[k];                                \
+}                                                                           \
+/* Set n items to *value, with memset when all its bytes are the same. */   \
+void mba_fill_##SIZE(void *dst, size_t n, const void *value)                \
+{                                                                           \
+    const unsigned char *bytes = (const unsigned char *)value;              \
+    ET *to = (ET *)dst;                                                     \
+    ET item;                                                                \
+    size_t k;                                                               \
+    for (k = 1; k < SIZE && bytes[k] == bytes[0]; k++)                      \
+        ;                                                                   \
+    if (k == SIZE) {                                                        \
+        memset(dst, bytes[0], n * SIZE);                                    \
+        return;                                                             \
+    }                                                                       \
+    memcpy(&item, value, SIZE);                                             \
+    for (k = 0; k < n; k++)                                                 \
+        to[k] = item;                                                       \
+}                                                                           \
+/* Remove the n items start, start + step, ... from an array of length     \
+   items, closing up the gaps. step must be at least 1. */                  \
+void mba_delete_strided_##SIZE(void *data, size_t length, size_t start,     \
+                               size_t step, size_t n)                       \
+{                                                                           \
+    ET *p = (ET *)data;                                                     \
+    size_t k, to = start;                                                   \
+    for (k = 0; k < n; k++) {                                               \
+        size_t from = start + k * step + 1;                                 \
+        size_t next = k + 1 < n ? from + step - 1 : length;                 \
+        memmove(p + to, p + from, (next - from) * SIZE);                    \
+        to += next - from;                                                  \
+    }                                                                       \
+}
+
+MBA_STRIDED(1, uint8_t)
+MBA_STRIDED(2, uint16_t)
+MBA_STRIDED(4, uint32_t)
+MBA_STRIDED(8, uint64_t)
+"""
+
+_search_cdef = """
+size_t mba_count_{tc}(const {T} *p, size_t n, {T} value);
+size_t mba_find_{tc}(const {T} *p, size_t n, {T} value);
+"""
+
+_search_source = r"""
+/* find returns n if the value is not present */
+#define MBA_SEARCH(S, T)                                                    \
+size_t mba_count_##S(const T *p, size_t n, T value)                         \
+{                                                                           \
+    size_t i, count = 0;                                                    \
+    for (i = 0; i < n; i++)                                                 \
+        count += (p[i] == value);                                           \
+    return count;                                                           \
+}                                                                           \
+size_t mba_find_##S(const T *p, size_t n, T value)                          \
+{                                                                           \
+    size_t i;                                                               \
+    for (i = 0; i < n; i++) {                                               \
+        if (p[i] == value)                                                  \
+            return i;                                                       \
+    }                                                                       \
+    return n;                                                               \
+}
+
+MBA_SEARCH(b, signed char)
+MBA_SEARCH(h, signed short)
+MBA_SEARCH(i, signed int)
+MBA_SEARCH(l, signed long)
+MBA_SEARCH(B, unsigned char)
+MBA_SEARCH(H, unsigned short)
+MBA_SEARCH(I, unsigned int)
+MBA_SEARCH(L, unsigned long)
+MBA_SEARCH(f, float)
+MBA_SEARCH(d, double)
+"""
+
+_byteswap_cdef = """
+void mba_byteswap_2(void *data, size_t n);
+void mba_byteswap_4(void *data, size_t n);
+void mba_byteswap_8(void *data, size_t n);
+void mba_add_counts(unsigned long *dst, const unsigned long *src, size_t n);
+"""
+
+_byteswap_source = r"""
+void mba_byteswap_2(void *data, size_t n)
+{
+    uint16_t *p = (uint16_t *)data;
+    size_t i;
+    for (i = 0; i < n; i++)
+        p[i] = (uint16_t)((p[i] >> 8) | (p[i] << 8));
+}
+
+void mba_byteswap_4(void *data, size_t n)
+{
+    uint32_t *p = (uint32_t *)data;
+    size_t i;
+    for (i = 0; i < n; i++) {
+        uint32_t x = p[i];
+        p[i] = (x >> 24) | ((x >> 8) & 0xff00u) |
+               ((x << 8) & 0xff0000u) | (x << 24);
+    }
+}
+
+void mba_byteswap_8(void *data, size_t n)
+{
+    uint64_t *p = (uint64_t *)data;
+    size_t i;
+    for (i = 0; i < n; i++) {
+        uint64_t x = p[i];
+        x = ((x & 0x00000000ffffffffull) << 32) | (x >> 32);
+        x = ((x & 0x0000ffff0000ffffull) << 16) | ((x >> 16) & 0x0000ffff0000ffffull);
+        x = ((x & 0x00ff00ff00ff00ffull) << 8) | ((x >> 8) & 0x00ff00ff00ff00ffull);
+        p[i] = x;
+    }
+}
+
+/* Merge the counts made by separate threads */
+void mba_add_counts(unsigned long *dst, const unsigned long *src, size_t n)
+{
+    size_t i;
+    for (i = 0; i < n; i++)
+        dst[i] += src[i];
+}
+"""
+
+_memory_cdef = """
+unsigned char mba_touch_pages(const unsigned char *p, size_t n, size_t pagesize);
+size_t mba_pack_flags(uint64_t *words, const unsigned char *flags, size_t n);
+"""
+
+_memory_source = r"""
+/* Read one byte of every page so that the pages are faulted in. */
+unsigned char mba_touch_pages(const unsigned char *p, size_t n, size_t pagesize)
+{
+    const volatile unsigned char *q = p;
+    unsigned char acc = 0;
+    size_t i;
+    for (i = 0; i < n; i += pagesize)
+        acc ^= q[i];
+    if (n)
+        acc ^= q[n - 1];
+    return acc;
+}
+
+/* Set bit i of a zeroed bit array for each flags[i] with its low bit set,
+   like the page vector filled by mincore. Returns the number of bits set. */
+size_t mba_pack_flags(uint64_t *words, const unsigned char *flags, size_t n)
+{
+    size_t i, count = 0;
+    for (i = 0; i < n; i++) {
+        uint64_t bit = flags[i] & 1;
+        words[i / 64] |= bit << (i % 64);
+        count += (size_t)bit;
+    }
+    return count;
+}
+"""
+
+_dict_cdef = """
+struct mba_dict_header {
+    char magic[8];
+    uint64_t capacity;
+    uint64_t count;
+    uint64_t itemsize;
+    char typecode;
+    char reserved[31];
+};
+""" + "\n".join(
+    """
+size_t mba_dict_get_many_{size}(const uint64_t *keys, const uint8_t *used, const void *values,
+                                size_t mask, const uint64_t *query, size_t m,
+                                void *out, uint8_t *found);
+size_t mba_dict_put_many_{size}(uint64_t *keys, uint8_t *used, void *values, size_t mask,
+                                uint64_t *count, uint64_t max_count,
+                                const uint64_t *new_keys, const void *new_values, size_t m);
+int mba_dict_delete_{size}(uint64_t *keys, uint8_t *used, void *values, size_t mask,
+                           uint64_t key);
+void mba_dict_rehash_{size}(const uint64_t *keys, const uint8_t *used, const void *values,
+                            size_t capacity, uint64_t *new_keys, uint8_t *new_used,
+                            void *new_values, size_t new_mask);
+""".format(size=size)
+    for size in _element_ctypes
+)
+
+_dict_source = r"""
+struct mba_dict_header {
+    char magic[8];
+    uint64_t capacity;
+    uint64_t count;
+    uint64_t itemsize;
+    char typecode;
+    char reserved[31];
+};
+
+/* splitmix64 finalizer, spreads sequential ids across the table */
+static uint64_t mba_hash64(uint64_t x)
+{
+    x ^= x >> 30;
+    x *= 0xbf58476d1ce4e5b9ULL;
+    x ^= x >> 27;
+    x *= 0x94d049bb133111ebULL;
+    x ^= x >> 31;
+    return x;
+}
+
+/* Linear probing for the slot holding key, or the empty slot where it
+   belongs. There is always at least one empty slot. */
+static size_t mba_dict_slot(const uint64_t *keys, const uint8_t *used,
+                            size_t mask, uint64_t key)
+{
+    size_t i = (size_t)mba_hash64(key) & mask;
+    while (used[i] && keys[i] != key)
+        i = (i + 1) & mask;
+    return i;
+}
+
+/* get_many returns the number of keys found, out is left unchanged for
+   missing keys and found (if not NULL) is set to 0 or 1 for each key.
+   put_many stops before adding a key that would take count past
+   max_count and returns the number of pairs it stored.
+   delete uses backward shifting so no tombstones are needed. */
+#define MBA_DICT(SIZE, VT)                                                  \
+size_t mba_dict_get_many_##SIZE(const uint64_t *keys, const uint8_t *used,  \
+                                const void *values, size_t mask,            \
+                                const uint64_t *query, size_t m,            \
+                                void *out, uint8_t *found)                  \
+{                                                                           \
+    const VT *vals = (const VT *)values;                                    \
+    VT *dst = (VT *)out;                                                    \
+    size_t k, hits = 0;                                                     \
+    for (k = 0; k < m; k++) {                                               \
+        size_t i = mba_dict_slot(keys, used, mask, query[k]);               \
+        int hit = used[i] != 0;                                             \
+        if (hit)                                                            \
+            dst[k] = vals[i];                                               \
+        if (found)                                                          \
+            found[k] = (uint8_t)hit;                                        \
+        hits += hit;                                                        \
+    }                                                                       \
+    return hits;                                                            \
+}                                                                           \
+size_t mba_dict_put_many_##SIZE(uint64_t *keys, uint8_t *used, void *values, \
+                                size_t mask, uint64_t *count, uint64_t max_count, \
+                                const uint64_t *new_keys, const void *new_values, \
+                                size_t m)                                   \
+{                                                                           \
+    VT *vals = (VT *)values;                                                \
+    const VT *src = (const VT *)new_values;                                 \
+    size_t k;                                                               \
+    for (k = 0; k < m; k++) {                                               \
+        size_t i = mba_dict_slot(keys, used, mask, new_keys[k]);            \
+        if (!used[i]) {                                                     \
+            if (*count >= max_count)                                        \
+                return k;                                                   \
+            keys[i] = new_keys[k];                                          \
+            used[i] = 1;                                                    \
+            (*count)++;                                                     \
+        }                                                                   \
+        vals[i] = src[k];                                                   \
+    }                                                                       \
+    return m;                                                               \
+}                                                                           \
+int mba_dict_delete_##SIZE(uint64_t *keys, uint8_t *used, void *values,     \
+                           size_t mask, uint64_t key)                       \
+{                                                                           \
+    VT *vals = (VT *)values;                                                \
+    size_t i = mba_dict_slot(keys, used, mask, key), j = i;                 \
+    if (!used[i])                                                           \
+        return 0;                                                           \
+    for (;;) {                                                              \
+        size_t home;                                                        \
+        j = (j + 1) & mask;                                                 \
+        if (!used[j])                                                       \
+            break;                                                          \
+        home = (size_t)mba_hash64(keys[j]) & mask;                          \
+        /* the entry at j stays if its home is cyclically in (i, j] */      \
+        if (i <= j ? (i < home && home <= j) : (i < home || home <= j))     \
+            continue;                                                       \
+        keys[i] = keys[j];                                                  \
+        vals[i] = vals[j];                                                  \
+        i = j;                                                              \
+    }                                                                       \
+    used[i] = 0;                                                            \
+    return 1;                                                               \
+}                                                                           \
+void mba_dict_rehash_##SIZE(const uint64_t *keys, const uint8_t *used,      \
+                            const void *values, size_t capacity,            \
+                            uint64_t *new_keys, uint8_t *new_used,          \
+                            void *new_values, size_t new_mask)              \
+{                                                                           \
+    const VT *vals = (const VT *)values;                                    \
+    VT *new_vals = (VT *)new_values;                                        \
+    size_t k;                                                               \
+    for (k = 0; k < capacity; k++) {                                        \
+        size_t i;                                                           \
+        if (!used[k])                                                       \
+            continue;                                                       \
+        i = mba_dict_slot(new_keys, new_used, new_mask, keys[k]);           \
+        new_keys[i] = keys[k];                                              \
+        new_used[i] = 1;                                                    \
+        new_vals[i] = vals[k];                                              \
+    }                                                                       \
+}
+
+MBA_DICT(1, uint8_t)
+MBA_DICT(2, uint16_t)
+MBA_DICT(4, uint32_t)
+MBA_DICT(8, uint64_t)
+"""
+
+_bits_cdef = """
+size_t mba_count_bits(const uint64_t *words, size_t start, size_t stop);
+size_t mba_find_bit(const uint64_t *words, size_t start, size_t stop, int value);
+void mba_fill_bits(uint64_t *words, size_t start, size_t stop, int value);
+void mba_bitop(uint64_t *dst, const uint64_t *a, const uint64_t *b, size_t nwords, int op);
+"""
+
+_bits_source = r"""
+/* Bit i of a bit array is bit i % 64 of word i / 64. */
+
+#if defined(__GNUC__) || defined(__clang__)
+#define mba_popcount64(x) ((size_t)__builtin_popcountll(x))
+#define mba_ctz64(x) ((size_t)__builtin_ctzll(x))
+#else
+static size_t mba_popcount64(uint64_t x)
+{
+    x = x - ((x >> 1) & 0x5555555555555555ULL);
+    x = (x & 0x3333333333333333ULL) + ((x >> 2) & 0x3333333333333333ULL);
+    x = (x + (x >> 4)) & 0x0f0f0f0f0f0f0f0fULL;
+    return (size_t)((x * 0x0101010101010101ULL) >> 56);
+}
+static size_t mba_ctz64(uint64_t x)
+{
+    size_t n = 0;
+    while (!(x & 1)) {
+        x >>= 1;
+        n++;
+    }
+    return n;
+}
+#endif
+
+/* Mask of the bits of word w that fall in [start, stop) */
+static uint64_t mba_word_mask(size_t w, size_t start, size_t stop)
+{
+    uint64_t mask = ~0ULL;
+    size_t first = w * 64;
+    if (start > first)
+        mask &= ~0ULL << (start - first);
+    if (stop < first + 64)
+        mask &= ~0ULL >> (first + 64 - stop);
+    return mask;
+}
+
+size_t mba_count_bits(const uint64_t *words, size_t start, size_t stop)
+{
+    size_t w, count = 0;
+    if (start >= stop)
+        return 0;
+    for (w = start / 64; w <= (stop - 1) / 64; w++)
+        count += mba_popcount64(words[w] & mba_word_mask(w, start, stop));
+    return count;
+}
+
+/* Index of the first bit in [start, stop) equal to value, or stop */
+size_t mba_find_bit(const uint64_t *words, size_t start, size_t stop, int value)
+{
+    size_t w;
+    if (start >= stop)
+        return stop;
+    for (w = start / 64; w <= (stop - 1) / 64; w++) {
+        uint64_t word = value ? words[w] : ~words[w];
+        word &= mba_word_mask(w, start, stop);
+        if (word)
+            return w * 64 + mba_ctz64(word);
+    }
+    return stop;
+}
+
+void mba_fill_bits(uint64_t *words, size_t start, size_t stop, int value)
+{
+    size_t w;
+    if (start >= stop)
+        return;
+    for (w = start / 64; w <= (stop - 1) / 64; w++) {
+        uint64_t mask = mba_word_mask(w, start, stop);
+        if (value)
+            words[w] |= mask;
+        else
+            words[w] &= ~mask;
+    }
+}
+
+/* op: 0 and, 1 or, 2 xor, 3 not (b is unused) */
+void mba_bitop(uint64_t *dst, const uint64_t *a, const uint64_t *b, size_t nwords, int op)
+{
+    size_t i;
+    switch (op) {
+    case 0:
+        for (i = 0; i < nwords; i++)
+            dst[i] = a[i] & b[i];
+        break;
+    case 1:
+        for (i = 0; i < nwords; i++)
+            dst[i] = a[i] | b[i];
+        break;
+    case 2:
+        for (i = 0; i < nwords; i++)
+            dst[i] = a[i] ^ b[i];
+        break;
+    default:
+        for (i = 0; i < nwords; i++)
+            dst[i] = ~a[i];
+    }
+}
+"""
+
+_bytes_cdef = """
+size_t mba_bytes_bisect(const unsigned long *offsets, const unsigned char *data,
+                        size_t lo, size_t hi, const unsigned char *key, size_t keylen,
+                        int right);
+"""
+
+_bytes_source = r"""
+/* Compare item i of a variable length array with key, like memcmp but
+   shorter strings sort before longer ones with the same prefix. */
+static int mba_bytes_compare(const unsigned long *offsets, const unsigned char *data,
+                             size_t i, const unsigned char *key, size_t keylen)
+{
+    size_t length = offsets[i + 1] - offsets[i];
+    int c = memcmp(data + offsets[i], key, length < keylen ? length : keylen);
+    if (c)
+        return c;
+    return (length > keylen) - (length < keylen);
+}
+
+/* Binary search over the items [lo, hi) which must be sorted. Returns the
+   first index whose item is >= key, or > key when right is set. */
+size_t mba_bytes_bisect(const unsigned long *offsets, const unsigned char *data,
+                        size_t lo, size_t hi, const unsigned char *key, size_t keylen,
+                        int right)
+{
+    while (lo < hi) {
+        size_t mid = lo + (hi - lo) / 2;
+        int c = mba_bytes_compare(offsets, data, mid, key, keylen);
+        if (c < 0 || (right && c == 0))
+            lo = mid + 1;
+        else
+            hi = mid;
+    }
+    return lo;
+}
+"""
+
+def _crc32c_tables():
+    """Slicing by 8 lookup tables for CRC32C (Castagnoli) as C source"""
+    tables = [[0]*256 for _ in range(8)]
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ (0x82F63B78 if crc & 1 else 0)
+        tables[0][i] = crc
+    for k in range(1, 8):
+        for i in range(256):
+            previous = tables[k - 1][i]
+            tables[k][i] = (previous >> 8) ^ tables[0][previous & 0xff]
+    rows = ",\n".join(
+        "{" + ",".join("0x%08x" % value for value in table) + "}" for table in tables
+    )
+    return "static const uint32_t mba_crc32c_table[8][256] = {\n" + rows + "\n};\n"
+
+
+_checksum_cdef = """
+uint32_t mba_crc32c(uint32_t crc, const unsigned char *p, size_t n);
+uint64_t mba_xxh64(const unsigned char *p, size_t n, uint64_t seed);
+void mba_block_checksums(int algorithm, const unsigned char *p, size_t n, size_t block_size,
+                         size_t first, size_t last, uint64_t *out);
+"""
+
+_checksum_source = _crc32c_tables() + r"""
+static uint32_t mba_read32(const unsigned char *p)
+{
+    return (uint32_t)p[0] | (uint32_t)p[1] << 8 | (uint32_t)p[2] << 16 | (uint32_t)p[3] << 24;
+}
+
+static uint64_t mba_read64(const unsigned char *p)
+{
+    return (uint64_t)mba_read32(p) | (uint64_t)mba_read32(p + 4) << 32;
+}
+
+static uint32_t mba_crc32c_table_update(uint32_t crc, const unsigned char *p, size_t n)
+{
+    while (n >= 8) {
+        uint32_t one = mba_read32(p) ^ crc;
+        uint32_t two = mba_read32(p + 4);
+        crc = mba_crc32c_table[7][one & 0xff] ^ mba_crc32c_table[6][(one >> 8) & 0xff] ^
+              mba_crc32c_table[5][(one >> 16) & 0xff] ^ mba_crc32c_table[4][one >> 24] ^
+              mba_crc32c_table[3][two & 0xff] ^ mba_crc32c_table[2][(two >> 8) & 0xff] ^
+              mba_crc32c_table[1][(two >> 16) & 0xff] ^ mba_crc32c_table[0][two >> 24];
+        p += 8;
+        n -= 8;
+    }
+    while (n--)
+        crc = mba_crc32c_table[0][(crc ^ *p++) & 0xff] ^ (crc >> 8);
+    return crc;
+}
+
+#if (defined(__GNUC__) || defined(__clang__)) && defined(__x86_64__)
+/* The SSE 4.2 crc32 instruction computes CRC32C */
+__attribute__((target("sse4.2")))
+static uint32_t mba_crc32c_hw_update(uint32_t crc, const unsigned char *p, size_t n)
+{
+    uint64_t crc64 = crc;
+    while (n >= 8) {
+        uint64_t word;
+        memcpy(&word, p, 8);
+        crc64 = __builtin_ia32_crc32di(crc64, word);
+        p += 8;
+        n -= 8;
+    }
+    crc = (uint32_t)crc64;
+    while (n--)
+        crc = __builtin_ia32_crc32qi(crc, *p++);
+    return crc;
+}
+#define MBA_HAVE_CRC32C_HW 1
+#endif
+
+/* CRC32C of n bytes, continuing from the CRC of the preceding bytes */
+uint32_t mba_crc32c(uint32_t crc, const unsigned char *p, size_t n)
+{
+    crc = ~crc;
+#ifdef MBA_HAVE_CRC32C_HW
+    if (__builtin_cpu_supports("sse4.2"))
+        return ~mba_crc32c_hw_update(crc, p, n);
+#endif
+    return ~mba_crc32c_table_update(crc, p, n);
+}
+
+#define MBA_XXH_P1 0x9E3779B185EBCA87ULL
+#define MBA_XXH_P2 0xC2B2AE3D27D4EB4FULL
+#define MBA_XXH_P3 0x165667B19E3779F9ULL
+#define MBA_XXH_P4 0x85EBCA77C2B2AE63ULL
+#define MBA_XXH_P5 0x27D4EB2F165667C5ULL
+
+static uint64_t mba_rotl64(uint64_t x, int r)
+{
+    return (x << r) | (x >> (64 - r));
+}
+
+static uint64_t mba_xxh64_round(uint64_t acc, uint64_t input)
+{
+    acc += input * MBA_XXH_P2;
+    acc = mba_rotl64(acc, 31);
+    return acc * MBA_XXH_P1;
+}
+
+static uint64_t mba_xxh64_merge(uint64_t acc, uint64_t value)
+{
+    acc ^= mba_xxh64_round(0, value);
+    return acc * MBA_XXH_P1 + MBA_XXH_P4;
+}
+
+/* XXH64 hash of n bytes */
+uint64_t mba_xxh64(const unsigned char *p, size_t n, uint64_t seed)
+{
+    const unsigned char *end = p + n;
+    uint64_t h;
+    if (n >= 32) {
+        uint64_t v1 = seed + MBA_XXH_P1 + MBA_XXH_P2;
+        uint64_t v2 = seed + MBA_XXH_P2;
+        uint64_t v3 = seed;
+        uint64_t v4 = seed - MBA_XXH_P1;
+        const unsigned char *limit = end - 32;
+        do {
+            v1 = mba_xxh64_round(v1, mba_read64(p));
+            v2 = mba_xxh64_round(v2, mba_read64(p + 8));
+            v3 = mba_xxh64_round(v3, mba_read64(p + 16));
+            v4 = mba_xxh64_round(v4, mba_read64(p + 24));
+            p += 32;
+        } while (p <= limit);
+        h = mba_rotl64(v1, 1) + mba_rotl64(v2, 7) + mba_rotl64(v3, 12) + mba_rotl64(v4, 18);
+        h = mba_xxh64_merge(h, v1);
+        h = mba_xxh64_merge(h, v2);
+        h = mba_xxh64_merge(h, v3);
+        h = mba_xxh64_merge(h, v4);
+    } else {
+        h = seed + MBA_XXH_P5;
+    }
+    h += (uint64_t)n;
+    while (p + 8 <= end) {
+        h ^= mba_xxh64_round(0, mba_read64(p));
+        h = mba_rotl64(h, 27) * MBA_XXH_P1 + MBA_XXH_P4;
+        p += 8;
+    }
+    if (p + 4 <= end) {
+        h ^= (uint64_t)mba_read32(p) * MBA_XXH_P1;
+        h = mba_rotl64(h, 23) * MBA_XXH_P2 + MBA_XXH_P3;
+        p += 4;
+    }
+    while (p < end) {
+        h ^= (*p++) * MBA_XXH_P5;
+        h = mba_rotl64(h, 11) * MBA_XXH_P1;
+    }
+    h ^= h >> 33;
+    h *= MBA_XXH_P2;
+    h ^= h >> 29;
+    h *= MBA_XXH_P3;
+    h ^= h >> 32;
+    return h;
+}
+
+/* Checksums of the blocks [first, last) of n bytes split into blocks of
+   block_size bytes, the last block may be shorter. algorithm 0 is CRC32C
+   and 1 is XXH64. */
+void mba_block_checksums(int algorithm, const unsigned char *p, size_t n, size_t block_size,
+                         size_t first, size_t last, uint64_t *out)
+{
+    size_t b;
+    for (b = first; b < last; b++) {
+        size_t start = b * block_size;
+        size_t size = n - start < block_size ? n - start : block_size;
+        if (algorithm == 0)
+            out[b] = mba_crc32c(0, p + start, size);
+        else
+            out[b] = mba_xxh64(p + start, size, 0);
+    }
+}
+"""
+
+_delta_cdef = """
+void mba_diff_blocks(const unsigned char *old, size_t old_size, const unsigned char *new,
+                     size_t new_size, size_t block_size, size_t first, size_t last,
+                     unsigned char *changed);
+void mba_copy_blocks(unsigned char *dst, const unsigned char *src, size_t size,
+                     size_t block_size, const uint64_t *blocks, size_t count, int scatter);
+"""
+
+_delta_source = r"""
+/* Flag the blocks [first, last) of new that differ from old. Only the
+   first new_size bytes matter, a block reaching past the end of old is
+   always changed. */
+void mba_diff_blocks(const unsigned char *old, size_t old_size, const unsigned char *new,
+                     size_t new_size, size_t block_size, size_t first, size_t last,
+                     unsigned char *changed)
+{
+    size_t b;
+    for (b = first; b < last; b++) {
+        size_t start = b * block_size;
+        size_t end = new_size - start < block_size ? new_size : start + block_size;
+        changed[b] = end > old_size || memcmp(old + start, new + start, end - start) != 0;
+    }
+}
+
+/* Copy the listed blocks of an array of size bytes between the array and
+   a packed run of blocks. With scatter set src is the packed blocks and
+   dst the array, otherwise the blocks of src are packed into dst. */
+void mba_copy_blocks(unsigned char *dst, const unsigned char *src, size_t size,
+                     size_t block_size, const uint64_t *blocks, size_t count, int scatter)
+{
+    size_t k, packed = 0;
+    for (k = 0; k < count; k++) {
+        size_t start = blocks[k] * block_size;
+        size_t length = size - start < block_size ? size - start : block_size;
+        if (scatter)
+            memcpy(dst + start, src + packed, length);
+        else
+            memcpy(dst + packed, src + start, length);
+        packed += length;
+    }
+}
+"""
+
+_sync_cdef = """
+uint64_t mba_atomic_load(const uint64_t *p);
+void mba_atomic_store(uint64_t *p, uint64_t value);
+uint64_t mba_atomic_add(uint64_t *p, uint64_t value);
+int mba_atomic_cas(uint64_t *p, uint64_t expected, uint64_t desired);
+uint64_t mba_atomic_or(uint64_t *p, uint64_t value);
+uint64_t mba_notify(uint64_t *block);
+int mba_wait_change(uint64_t *block, uint64_t seen, double timeout, int count);
+"""
+
+_sync_source = r"""
+/* Atomic access to 64 bit words shared between processes through a
+   mapping. Loads acquire and stores release so that data written before
+   a store is seen by a process that loads the stored value. */
+
+#if defined(__GNUC__) || defined(__clang__)
+uint64_t mba_atomic_load(const uint64_t *p)
+{
+    return __atomic_load_n(p, __ATOMIC_ACQUIRE);
+}
+void mba_atomic_store(uint64_t *p, uint64_t value)
+{
+    __atomic_store_n(p, value, __ATOMIC_RELEASE);
+}
+uint64_t mba_atomic_add(uint64_t *p, uint64_t value)
+{
+    return __atomic_add_fetch(p, value, __ATOMIC_ACQ_REL);
+}
+int mba_atomic_cas(uint64_t *p, uint64_t expected, uint64_t desired)
+{
+    return __atomic_compare_exchange_n(p, &expected, desired, 0,
+                                       __ATOMIC_ACQ_REL, __ATOMIC_ACQUIRE);
+}
+uint64_t mba_atomic_or(uint64_t *p, uint64_t value)
+{
+    return __atomic_or_fetch(p, value, __ATOMIC_ACQ_REL);
+}
+#define mba_fence_acquire() __atomic_thread_fence(__ATOMIC_ACQUIRE)
+#else
+#include <windows.h>
+uint64_t mba_atomic_load(const uint64_t *p)
+{
+    return (uint64_t)InterlockedCompareExchange64((volatile LONG64 *)p, 0, 0);
+}
+void mba_atomic_store(uint64_t *p, uint64_t value)
+{
+    InterlockedExchange64((volatile LONG64 *)p, (LONG64)value);
+}
+uint64_t mba_atomic_add(uint64_t *p, uint64_t value)
+{
+    return (uint64_t)InterlockedAdd64((volatile LONG64 *)p, (LONG64)value);
+}
+int mba_atomic_cas(uint64_t *p, uint64_t expected, uint64_t desired)
+{
+    return InterlockedCompareExchange64((volatile LONG64 *)p, (LONG64)desired,
+                                        (LONG64)expected) == (LONG64)expected;
+}
+uint64_t mba_atomic_or(uint64_t *p, uint64_t value)
+{
+    return (uint64_t)InterlockedOr64((volatile LONG64 *)p, (LONG64)value) | value;
+}
+#define mba_fence_acquire() MemoryBarrier()
+#endif
+
+/* Change notification. block[0] is a generation counter and block[1] the
+   number of processes waiting on it, so that notifying costs no system
+   call while nobody waits. A futex only covers 32 bits, waiters sleep on
+   the low half of the generation. */
+
+#ifdef __linux__
+#include <limits.h>
+#include <time.h>
+#include <unistd.h>
+#include <sys/syscall.h>
+#include <linux/futex.h>
+
+static uint32_t *mba_low_word(uint64_t *p)
+{
+    const uint64_t one = 1;
+    return (uint32_t *)p + (*(const unsigned char *)&one ? 0 : 1);
+}
+
+uint64_t mba_notify(uint64_t *block)
+{
+    uint64_t generation = __atomic_add_fetch(block, 1, __ATOMIC_SEQ_CST);
+    if (__atomic_load_n(block + 1, __ATOMIC_SEQ_CST))
+        syscall(SYS_futex, mba_low_word(block), FUTEX_WAKE, INT_MAX, NULL, NULL, 0);
+    return generation;
+}
+
+/* Sleep until the generation is no longer seen or for timeout seconds if
+   timeout isn't negative. Unless count is set the waiter doesn't add
+   itself to block[1], which must then be kept nonzero so that notify
+   always wakes. Returns 1 if the generation changed and 0 if not, which
+   includes being woken by a signal. */
+int mba_wait_change(uint64_t *block, uint64_t seen, double timeout, int count)
+{
+    struct timespec ts, *tsp = NULL;
+    if (__atomic_load_n(block, __ATOMIC_SEQ_CST) != seen)
+        return 1;
+    if (timeout >= 0) {
+        ts.tv_sec = (time_t)timeout;
+        ts.tv_nsec = (long)((timeout - (double)ts.tv_sec) * 1e9);
+        tsp = &ts;
+    }
+    if (count)
+        __atomic_add_fetch(block + 1, 1, __ATOMIC_SEQ_CST);
+    /* the kernel only sleeps if the low word still holds seen */
+    syscall(SYS_futex, mba_low_word(block), FUTEX_WAIT, (uint32_t)seen, tsp, NULL, 0);
+    if (count)
+        __atomic_sub_fetch(block + 1, 1, __ATOMIC_SEQ_CST);
+    return __atomic_load_n(block, __ATOMIC_SEQ_CST) != seen;
+}
+#else
+uint64_t mba_notify(uint64_t *block)
+{
+    return mba_atomic_add(block, 1);
+}
+
+/* Without futexes the caller polls, -1 tells it to */
+int mba_wait_change(uint64_t *block, uint64_t seen, double timeout, int count)
+{
+    return mba_atomic_load(block) != seen ? 1 : -1;
+}
+#endif
+"""
+
+_memo_cdef = """
+struct mba_memo_header {
+    char magic[8];
+    uint64_t sets;
+    uint64_t ways;
+    uint64_t key_size;
+    uint64_t value_size;
+    uint64_t slot_size;
+    uint64_t hits;
+    uint64_t misses;
+    uint64_t inserts;
+    uint64_t evictions;
+    char key_format[32];
+    char value_format[32];
+    char reserved[48];
+};
+int mba_memo_get(struct mba_memo_header *header, const char *key, char *value);
+int mba_memo_put(struct mba_memo_header *header, const char *key, const char *value);
+size_t mba_memo_count(const struct mba_memo_header *header);
+"""
+
+_memo_source = r"""
+struct mba_memo_header {
+    char magic[8];
+    uint64_t sets;
+    uint64_t ways;
+    uint64_t key_size;
+    uint64_t value_size;
+    uint64_t slot_size;
+    uint64_t hits;
+    uint64_t misses;
+    uint64_t inserts;
+    uint64_t evictions;
+    char key_format[32];
+    char value_format[32];
+    char reserved[48];
+};
+
+/* The header is followed by a CLOCK hand for each set and then the slots,
+   ways slots to a set. A slot is a sequence number, the hash of the key,
+   the CLOCK reference flag, the key and the value. The sequence number is
+   odd while a writer changes the slot and 0 while the slot is empty, so
+   readers copy the slot without locking and retry if it changed. */
+#define MBA_MEMO_TRIES 1000
+
+struct mba_memo_slot {
+    uint64_t seq;
+    uint64_t hash;
+    uint64_t ref;
+    unsigned char data[];
+};
+
+static uint64_t *mba_memo_hands(struct mba_memo_header *header)
+{
+    return (uint64_t *)(header + 1);
+}
+
+static struct mba_memo_slot *mba_memo_slot(struct mba_memo_header *header, size_t set, size_t way)
+{
+    unsigned char *slots = (unsigned char *)(mba_memo_hands(header) + header->sets);
+    return (struct mba_memo_slot *)(slots + (set * header->ways + way) * header->slot_size);
+}
+
+/* Copy the value of key into value if the cache holds it. Returns 1 on a
+   hit and 0 on a miss. */
+int mba_memo_get(struct mba_memo_header *header, const char *key, char *value)
+{
+    uint64_t hash = mba_xxh64((const unsigned char *)key, header->key_size, 0);
+    size_t set = (size_t)(hash & (header->sets - 1)), way;
+    for (way = 0; way < header->ways; way++) {
+        struct mba_memo_slot *slot = mba_memo_slot(header, set, way);
+        int tries;
+        /* a slot that keeps changing, or whose writer died, is a miss */
+        for (tries = 0; tries < MBA_MEMO_TRIES; tries++) {
+            uint64_t seq = mba_atomic_load(&slot->seq);
+            int match;
+            if (seq == 0)
+                break;
+            if (seq & 1)
+                continue;
+            match = slot->hash == hash && memcmp(slot->data, key, header->key_size) == 0;
+            if (match)
+                memcpy(value, slot->data + header->key_size, header->value_size);
+            mba_fence_acquire();
+            if (mba_atomic_load(&slot->seq) != seq)
+                continue;
+            if (!match)
+                break;
+            if (!slot->ref)
+                slot->ref = 1;
+            mba_atomic_add(&header->hits, 1);
+            return 1;
+        }
+    }
+    mba_atomic_add(&header->misses, 1);
+    return 0;
+}
+
+/* Store the value of key, in the slot already holding the key, an empty
+   slot of its set or the slot the CLOCK hand of the set picks. Returns 0
+   without storing if another writer holds the slot, it is only a cache. */
+int mba_memo_put(struct mba_memo_header *header, const char *key, const char *value)
+{
+    uint64_t hash = mba_xxh64((const unsigned char *)key, header->key_size, 0);
+    size_t set = (size_t)(hash & (header->sets - 1)), way;
+    struct mba_memo_slot *slot = NULL;
+    uint64_t seq;
+    int evict = 0;
+    for (way = 0; way < header->ways && !slot; way++) {
+        struct mba_memo_slot *candidate = mba_memo_slot(header, set, way);
+        seq = mba_atomic_load(&candidate->seq);
+        if (seq == 0 || (candidate->hash == hash &&
+                         memcmp(candidate->data, key, header->key_size) == 0))
+            slot = candidate;
+    }
+    if (!slot) {
+        /* second chance, clear the reference flags until an unreferenced
+           slot comes round */
+        uint64_t *hand = mba_memo_hands(header) + set;
+        size_t turns;
+        for (turns = 0; !slot; turns++) {
+            uint64_t h = mba_atomic_add(hand, 1) - 1;
+            struct mba_memo_slot *candidate = mba_memo_slot(header, set, h % header->ways);
+            /* other processes may set flags as fast as they are cleared */
+            if (candidate->ref && turns < 2 * header->ways)
+                candidate->ref = 0;
+            else
+                slot = candidate;
+        }
+        evict = 1;
+    }
+    seq = mba_atomic_load(&slot->seq);
+    if ((seq & 1) || !mba_atomic_cas(&slot->seq, seq, seq + 1))
+        return 0;
+    slot->hash = hash;
+    slot->ref = 1;
+    memcpy(slot->data, key, header->key_size);
+    memcpy(slot->data + header->key_size, value, header->value_size);
+    mba_atomic_store(&slot->seq, seq + 2);
+    mba_atomic_add(&header->inserts, 1);
+    if (evict && seq)
+        mba_atomic_add(&header->evictions, 1);
+    return 1;
+}
+
+/* The number of slots holding a value */
+size_t mba_memo_count(const struct mba_memo_header *header)
+{
+    size_t set, way, count = 0;
+    for (set = 0; set < header->sets; set++)
+        for (way = 0; way < header->ways; way++)
+            count += mba_memo_slot((struct mba_memo_header *)header, set, way)->seq != 0;
+    return count;
+}
+"""
+
+_index_cdef = """
+int mba_is_sorted_{tc}(const {T} *p, size_t n);
+void mba_eytzinger_build_{tc}(const {T} *sorted, size_t n, {T} *tree, uint64_t *ranks);
+void mba_eytzinger_lookup_{tc}(const {T} *tree, const uint64_t *ranks, size_t n,
+                               const {T} *keys, size_t m, uint64_t *out);
+void mba_sparse_lookup_{tc}(const {T} *sorted, size_t n, const {T} *samples, size_t stride,
+                            const {T} *keys, size_t m, uint64_t *out);
+"""
+
+_index_source = r"""
+/* Search indexes of sorted arrays. The lookups find the lower bound of
+   each key, the index of the first item not less than it, and work on
+   MBA_INDEX_BATCH keys at a time, taking one step of every search in turn
+   so the cache misses of the searches overlap. */
+
+#define MBA_INDEX_BATCH 16
+
+#if defined(__GNUC__) || defined(__clang__)
+#define mba_prefetch(p) __builtin_prefetch(p)
+#else
+#define mba_prefetch(p) ((void)0)
+#endif
+
+/* The Eytzinger layout stores the items in breadth first order of a
+   complete binary search tree, tree[1] being the root and tree[2k] and
+   tree[2k+1] the children of tree[k], with ranks[k] the index of tree[k]
+   in the sorted array. The top levels of the tree share a few cache lines
+   and the nodes of each level are contiguous. */
+#define MBA_INDEX(S, T)                                                     \
+int mba_is_sorted_##S(const T *p, size_t n)                                 \
+{                                                                           \
+    size_t i;                                                               \
+    for (i = 1; i < n; i++) {                                               \
+        if (!(p[i - 1] <= p[i]))  /* false for NaN */                       \
+            return 0;                                                       \
+    }                                                                       \
+    return 1;                                                               \
+}                                                                           \
+static size_t mba_eytzinger_fill_##S(const T *sorted, size_t n, T *tree,   \
+                                     uint64_t *ranks, size_t i, size_t k)   \
+{                                                                           \
+    if (k <= n) {                                                           \
+        i = mba_eytzinger_fill_##S(sorted, n, tree, ranks, i, 2 * k);       \
+        tree[k] = sorted[i];                                                \
+        ranks[k] = i++;                                                     \
+        i = mba_eytzinger_fill_##S(sorted, n, tree, ranks, i, 2 * k + 1);   \
+    }                                                                       \
+    return i;                                                               \
+}                                                                           \
+void mba_eytzinger_build_##S(const T *sorted, size_t n, T *tree,            \
+                             uint64_t *ranks)                               \
+{                                                                           \
+    mba_eytzinger_fill_##S(sorted, n, tree, ranks, 0, 1);                   \
+}                                                                           \
+void mba_eytzinger_lookup_##S(const T *tree, const uint64_t *ranks,        \
+                              size_t n, const T *keys, size_t m,            \
+                              uint64_t *out)                                \
+{                                                                           \
+    size_t base, j, k[MBA_INDEX_BATCH];                                     \
+    for (base = 0; base < m; base += MBA_INDEX_BATCH) {                     \
+        size_t b = m - base < MBA_INDEX_BATCH ? m - base : MBA_INDEX_BATCH; \
+        const T *x = keys + base;                                           \
+        int active = 1;                                                     \
+        for (j = 0; j < b; j++)                                             \
+            k[j] = 1;                                                       \
+        while (active) {                                                    \
+            active = 0;                                                     \
+            for (j = 0; j < b; j++) {                                       \
+                if (k[j] <= n) {                                            \
+                    k[j] = 2 * k[j] + (tree[k[j]] < x[j]);                  \
+                    mba_prefetch(tree + k[j]);                              \
+                    active = 1;                                             \
+                }                                                           \
+            }                                                               \
+        }                                                                   \
+        /* undo the right turns taken after the last left turn, the node  \
+           left from is the lower bound */                                  \
+        for (j = 0; j < b; j++) {                                           \
+            size_t node = k[j] >> (mba_ctz64(~(uint64_t)k[j]) + 1);         \
+            out[base + j] = node ? ranks[node] : n;                         \
+        }                                                                   \
+    }                                                                       \
+}                                                                           \
+/* The sparse index holds every stride-th item, searching it first narrows \
+   the search of the sorted array down to stride items */                  \
+void mba_sparse_lookup_##S(const T *sorted, size_t n, const T *samples,     \
+                           size_t stride, const T *keys, size_t m,          \
+                           uint64_t *out)                                   \
+{                                                                           \
+    size_t samples_n = n ? (n - 1) / stride + 1 : 0;                        \
+    size_t base, j, lo[MBA_INDEX_BATCH], len[MBA_INDEX_BATCH];              \
+    for (base = 0; base < m; base += MBA_INDEX_BATCH) {                     \
+        size_t b = m - base < MBA_INDEX_BATCH ? m - base : MBA_INDEX_BATCH; \
+        const T *x = keys + base;                                           \
+        int active = 1;                                                     \
+        for (j = 0; j < b; j++) {                                           \
+            /* the first sample not less than the key */                   \
+            size_t first = 0, count = samples_n;                            \
+            while (count) {                                                 \
+                size_t half = count / 2;                                    \
+                if (samples[first + half] < x[j]) {                         \
+                    first += half + 1;                                      \
+                    count -= half + 1;                                      \
+                } else {                                                    \
+                    count = half;                                           \
+                }                                                           \
+            }                                                               \
+            /* the lower bound is in (sample before, that sample] */       \
+            lo[j] = first ? (first - 1) * stride + 1 : 0;                   \
+            len[j] = (first * stride < n ? first * stride : n) - lo[j];     \
+            mba_prefetch(sorted + lo[j] + len[j] / 2);                      \
+        }                                                                   \
+        while (active) {                                                    \
+            active = 0;                                                     \
+            for (j = 0; j < b; j++) {                                       \
+                if (len[j]) {                                               \
+                    size_t half = len[j] / 2;                               \
+                    if (sorted[lo[j] + half] < x[j]) {                      \
+                        lo[j] += half + 1;                                  \
+                        len[j] -= half + 1;                                 \
+                    } else {                                                \
+                        len[j] = half;                                      \
+                    }                                                       \
+                    mba_prefetch(sorted + lo[j] + len[j] / 2);              \
+                    active = 1;                                             \
+                }                                                           \
+            }                                                               \
+        }                                                                   \
+        for (j = 0; j < b; j++)                                             \
+            out[base + j] = lo[j];                                          \
+    }                                                                       \
+}
+
+MBA_INDEX(b, signed char)
+MBA_INDEX(h, signed short)
+MBA_INDEX(i, signed int)
+MBA_INDEX(l, signed long)
+MBA_INDEX(B, unsigned char)
+MBA_INDEX(H, unsigned short)
+MBA_INDEX(I, unsigned int)
+MBA_INDEX(L, unsigned long)
+MBA_INDEX(f, float)
+MBA_INDEX(d, double)
+"""
+
+CDEF = "\n".join([
+    _instantiate(_reduction_cdef, _numeric_ctypes),
+    _instantiate(_integer_reduction_cdef, _integer_typecodes),
+    _instantiate(_float_reduction_cdef, _float_typecodes),
+    _gather_cdef,
+    _strided_cdef,
+    _instantiate(_search_cdef, _numeric_ctypes),
+    _byteswap_cdef,
+    _memory_cdef,
+    _dict_cdef,
+    _bits_cdef,
+    _bytes_cdef,
+    _checksum_cdef,
+    _delta_cdef,
+    _sync_cdef,
+    _memo_cdef,
+    _instantiate(_index_cdef, _numeric_ctypes),
+])
+
+SOURCE = "\n".join([
+    _reduction_source,
+    _gather_source,
+    _strided_source,
+    _search_source,
+    _byteswap_source,
+    _memory_source,
+    _dict_source,
+    _bits_source,
+    _bytes_source,
+    _checksum_source,
+    _delta_source,
+    _sync_source,
+    _memo_source,
+    _index_source,
+])
@@ -0,0 +1,225 @@
+"""mmap backed array whose items are computed a block at a time on first access"""
+import array
+import concurrent.futures
+import mmap
+import operator
+import os
+import threading
+
+from .mmap_array import mmaparray, ffi, C, _pointer_to
+from .bit_array import mmapbitarray, _words_for
+from . import parallel
+
+__all__ = [
+    "mmaplazyarray",
+]
+
+
+class mmaplazyarray:
+    """Array of a fixed length whose items are computed on demand.
+
+    The items are split into blocks of block_size items and a block is
+    computed by compute_block(start, stop) the first time one of its items
+    is read. A shared bitmap records the blocks that are filled, so
+    processes sharing the mappings, forked children or other processes
+    opening the same path, never compute a block twice once it is filled.
+    Two processes reading the same missing block at the same moment may
+    both compute it, compute_block must be a pure function.
+    """
+    def __init__(self, typecode, length, compute_block, block_size=1 << 16, path=None):
+        """
+        :typecode: the typecode of the items
+        :length: the number of items
+        :compute_block: function called as compute_block(start, stop) that
+            returns the stop - start items [start:stop], as an array.array
+            or mmaparray of the same typecode or any iterable of items
+        :block_size: the number of items computed at a time
+        :path: optional file to keep the items in, opened with mmaparray.open.
+            The filled blocks are recorded in path + '.filled' so that they
+            are kept when the array is opened again, also after a crash
+            left it open.
+        """
+        length = operator.index(length)
+        if length < 0:
+            raise ValueError("length must not be negative")
+        if block_size < 1:
+            raise ValueError("block_size must be positive")
+        self._compute_block = compute_block
+        self._block_size = block_size
+        self._length = length
+        self._blocks = -(-length // block_size)
+        self._path = path
+        if path is None:
+            self._data = mmaparray(typecode)
+            self._filled = mmapbitarray(self._blocks)
+        else:
+            self._data = mmaparray.open(typecode, path)
+            # an array that wasn't closed leaves the file preallocated in
+            # whole growth chunks
+            nbytes = length*self._data.itemsize
+            unclosed = max(self._data._growth, nbytes + -nbytes % self._data._growth)
+            if len(self._data) not in (0, length) and self._data._size != unclosed:
+                self._data.close()
+                raise ValueError("%s holds %d items, not %d" % (path, len(self._data), length))
+            self._filled = mmapbitarray(mmap=self._open_filled(path + '.filled'))
+        self._data._resize(length*self._data.itemsize)
+        self._words = self._filled._words
+        self._complete = False
+        self._lock = threading.Lock()
+
+    def _open_filled(self, path):
+        """Map the file recording the filled blocks, zeroed when created"""
+        size = max(8, _words_for(self._blocks)*8)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            return mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+
+    @property
+    def typecode(self):
+        return self._data.typecode
+
+    @property
+    def itemsize(self):
+        return self._data.itemsize
+
+    @property
+    def block_size(self):
+        return self._block_size
+
+    @property
+    def filled(self):
+        """mmapbitarray with a bit set for each block that is filled"""
+        return self._filled
+
+    @property
+    def array(self):
+        """The mmaparray holding the items. Items of blocks that haven't
+        been computed read as zero, call materialize first for all of them.
+        """
+        return self._data
+
+    def __len__(self):
+        return self._length
+
+    def is_filled(self, block):
+        """True if the block has been computed"""
+        return bool((C.mba_atomic_load(self._words + (block >> 6)) >> (block & 63)) & 1)
+
+    def _compute(self, block):
+        """Compute a block and mark it filled"""
+        start = block*self._block_size
+        stop = min(start + self._block_size, self._length)
+        values = self._compute_block(start, stop)
+        if not (isinstance(values, (array.array, mmaparray)) and values.typecode == self.typecode):
+            values = array.array(self.typecode, values)
+        if len(values) != stop - start:
+            raise ValueError(
+                "compute_block(%d, %d) returned %d items" % (start, stop, len(values))
+            )
+        self._data._copy_in(start*self.itemsize, _pointer_to(values), len(values)*self.itemsize)
+        if self._path is not None:
+            # the items must reach the file before the bit recording them
+            begin = start*self.itemsize
+            begin -= begin % mmap.PAGESIZE
+            self._data._mmap.flush(begin, stop*self.itemsize - begin)
+        # set after the items are written so that nobody reads them early
+        C.mba_atomic_or(self._words + (block >> 6), 1 << (block & 63))
+
+    def _fill(self, start, stop):
+        """Compute the missing blocks holding the items [start:stop]"""
+        if self._complete or start >= stop:
+            return
+        for block in range(start // self._block_size, (stop - 1) // self._block_size + 1):
+            if not self.is_filled(block):
+                self._compute(block)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._length)
+            if step < 0:
+                start, stop = stop + 1, start + 1
+            self._fill(start, stop)
+            return self._data[index]
+        index = operator.index(index)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("array index out of range")
+        self._fill(index, index + 1)
+        return self._data[index]
+
+    def __iter__(self):
+        for start in range(0, self._length, self._block_size):
+            stop = min(start + self._block_size, self._length)
+            self._fill(start, stop)
+            yield from self._data[start:stop]
+
+    def __repr__(self):
+        return "mmaplazyarray(%r, %d) with %d of %d blocks filled" % (
+            self.typecode, self._length, self._filled.count(), self._blocks
+        )
+
+    def materialize(self, start=None, stop=None, threads=None):
+        """Compute every missing block holding the items [start:stop].
+        :threads: number of threads to compute blocks on, defaults to the
+            global setting. More than one only helps if compute_block
+            releases the GIL.
+        :returns: the number of blocks computed
+        """
+        start, stop, _ = slice(start, stop).indices(self._length)
+        if self._complete or start >= stop:
+            return 0
+        missing = [
+            block
+            for block in range(start // self._block_size, (stop - 1) // self._block_size + 1)
+            if not self.is_filled(block)
+        ]
+        if threads is None:
+            threads = parallel.get_threads()
+        if threads > 1 and len(missing) > 1:
+            pool = parallel._get_pool(threads)
+            for future in [pool.submit(self._compute, block) for block in missing]:
+                future.result()
+        else:
+            for block in missing:
+                self._compute(block)
+        with self._lock:
+            if self._filled.count() == self._blocks:
+                self._complete = True
+        return len(missing)
+
+    def precompute(self, threads=1):
+        """Compute the missing blocks in the background while the array is
+        in use.
+        :returns: a concurrent.futures.Future of the number of blocks computed
+        """
+        future = concurrent.futures.Future()
+
+        def run():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(self.materialize(threads=threads))
+                except BaseException as e:
+                    future.set_exception(e)
+        threading.Thread(target=run, daemon=True).start()
+        return future
+
+    def close(self):
+        """Flush the items before the record of filled blocks and close
+        an array opened on a path
+        """
+        if self._path is not None:
+            self._data.close()
+            self._filled._storage._mmap.flush()
+            self._filled._storage._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
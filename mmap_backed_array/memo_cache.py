@@ -0,0 +1,160 @@
+"""Memoization cache in shared memory"""
+import functools
+import struct
+
+from .mmap_array import mmaparray, ffi, C
+
+__all__ = [
+    "mmapmemocache",
+]
+
+_MAGIC = b'MBAMEMO1'
+_HEADER_SIZE = ffi.sizeof('struct mba_memo_header')
+_SLOT_HEADER_SIZE = 24
+
+
+def _slot_size(key_size, value_size):
+    size = _SLOT_HEADER_SIZE + key_size + value_size
+    return size + -size % 8
+
+
+class mmapmemocache:
+    """Cache of the results of a pure function shared between processes.
+
+    Keys and values are fixed width, packed with struct formats. The
+    cache is a set associative table in a single mapping: a key hashes to
+    a set of ways slots and when the set is full the CLOCK hand of the set
+    evicts a slot that wasn't used since it last came round. Lookups take
+    no lock, every slot has a sequence number that writers make odd while
+    they change it and readers check to retry torn reads. Created before
+    forking, or on a shared mmap, the cache is shared by all the processes
+    using it.
+    """
+    def __init__(self, key_format, value_format, slots=1 << 16, ways=8, mmap=None):
+        """
+        :key_format: struct format of the arguments making up a key
+        :value_format: struct format of the values, a format of a single
+            item caches single values rather than tuples
+        :slots: the number of entries, rounded up to a power of two
+        :ways: the number of slots a key may be stored in
+        :mmap: optional mmap to store the cache in. An mmap holding an
+            existing cache is opened, an empty one is initialised.
+        """
+        self._key_struct = struct.Struct(key_format)
+        self._value_struct = struct.Struct(value_format)
+        self._single = len(self._value_struct.unpack(bytes(self._value_struct.size))) == 1
+        if len(key_format) > 31 or len(value_format) > 31:
+            raise ValueError("formats must be at most 31 characters")
+        if ways < 1:
+            raise ValueError("ways must be positive")
+        sets = 1 << (max(1, -(-slots // ways)) - 1).bit_length()
+        slot_size = _slot_size(self._key_struct.size, self._value_struct.size)
+        size = _HEADER_SIZE + 8*sets + slot_size*sets*ways
+
+        if mmap is None:
+            self._storage = mmaparray('B')
+            self._storage._resize(size)
+        else:
+            self._storage = mmaparray('B', mmap=mmap)
+        self._header = ffi.cast('struct mba_memo_header *', self._storage._data)
+        if len(self._storage) >= _HEADER_SIZE and bytes(ffi.buffer(self._header.magic)) == _MAGIC:
+            self._open(key_format, value_format)
+        elif len(self._storage) < size:
+            raise ValueError("mmap is too small for the cache, it needs %d bytes" % size)
+        elif bytes(ffi.buffer(self._storage._data, _HEADER_SIZE)).strip(b'\x00'):
+            raise ValueError("mmap does not hold an mmapmemocache")
+        else:
+            header = self._header
+            header.sets = sets
+            header.ways = ways
+            header.key_size = self._key_struct.size
+            header.value_size = self._value_struct.size
+            header.slot_size = slot_size
+            header.key_format = key_format.encode('ascii')
+            header.value_format = value_format.encode('ascii')
+            header.magic = _MAGIC
+
+    def _open(self, key_format, value_format):
+        """Check the cache stored in the mmap"""
+        header = self._header
+        if (ffi.string(header.key_format) != key_format.encode('ascii') or
+                ffi.string(header.value_format) != value_format.encode('ascii')):
+            raise TypeError("mmap holds a cache of %r to %r" % (
+                ffi.string(header.key_format).decode('ascii'),
+                ffi.string(header.value_format).decode('ascii'),
+            ))
+        size = _HEADER_SIZE + 8*header.sets + header.slot_size*header.sets*header.ways
+        if len(self._storage) < size:
+            raise ValueError("mmap is too small for the cache it holds")
+
+    @property
+    def mmap(self):
+        """The mapping holding the cache"""
+        return self._storage._mmap
+
+    @property
+    def capacity(self):
+        """The number of slots"""
+        return self._header.sets * self._header.ways
+
+    def __len__(self):
+        """The number of cached values"""
+        return C.mba_memo_count(self._header)
+
+    def _pack_key(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+        return self._key_struct.pack(*key)
+
+    def get(self, key, default=None):
+        """The cached value of key, a tuple of arguments or a single one,
+        or default if it isn't cached
+        """
+        value = ffi.new('char[]', self._value_struct.size or 1)
+        if not C.mba_memo_get(self._header, self._pack_key(key), value):
+            return default
+        value = self._value_struct.unpack_from(ffi.buffer(value))
+        return value[0] if self._single else value
+
+    def put(self, key, value):
+        """Cache the value of key.
+        :returns: False if the value wasn't stored because another writer
+            was changing the slot
+        """
+        if self._single:
+            value = (value,)
+        return bool(C.mba_memo_put(self._header, self._pack_key(key),
+                                   self._value_struct.pack(*value)))
+
+    def __contains__(self, key):
+        marker = object()
+        return self.get(key, marker) is not marker
+
+    def stats(self):
+        """dict of the hits, misses, inserts and evictions of all the
+        processes sharing the cache
+        """
+        header = self._header
+        return {
+            'hits': C.mba_atomic_load(ffi.addressof(header, 'hits')),
+            'misses': C.mba_atomic_load(ffi.addressof(header, 'misses')),
+            'inserts': C.mba_atomic_load(ffi.addressof(header, 'inserts')),
+            'evictions': C.mba_atomic_load(ffi.addressof(header, 'evictions')),
+        }
+
+    def memoize(self, func):
+        """Decorator caching the results of func, which must be a pure
+        function of positional arguments matching the key format. The
+        wrapper has the cache as its cache attribute.
+        """
+        marker = object()
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            value = self.get(args, marker)
+            if value is marker:
+                value = func(*args)
+                self.put(args, value)
+            return value
+        wrapper.cache = self
+        return wrapper
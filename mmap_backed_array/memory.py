@@ -0,0 +1,79 @@
+"""
+Reporting how much of an mmaparray is held in memory.
+
+residency asks the kernel with mincore which pages of an array are
+resident, so cold ranges of a table can be found before lookups start
+faulting on them. memory_usage reads /proc/self/smaps for the mapping of
+an array to tell how much of it is shared with other processes.
+"""
+import mmap
+import os
+import platform
+import re
+
+from .mmap_array import ffi, C
+from .bit_array import mmapbitarray
+
+_SMAPS = '/proc/self/smaps'
+_SMAPS_HEADER = re.compile(r'^([0-9a-f]+)-([0-9a-f]+) ')
+_SMAPS_FIELDS = {
+    'Rss': 'rss', 'Pss': 'pss',
+    'Shared_Clean': 'shared_clean', 'Shared_Dirty': 'shared_dirty',
+    'Private_Clean': 'private_clean', 'Private_Dirty': 'private_dirty',
+    'Swap': 'swap',
+}
+
+
+def residency(arr, start=None, stop=None):
+    """Find which pages holding the items [start:stop] are resident.
+    :returns: mmapbitarray with a bit for each page, set if the page is
+        resident. Bit 0 is the page holding item start, use count() for
+        the number of resident pages.
+    """
+    if platform.system() == "Windows":
+        raise NotImplementedError("residency is not supported on Windows")
+    start, stop, _ = slice(start, stop).indices(len(arr))
+    stop = max(start, stop)
+    pagesize = mmap.PAGESIZE
+    begin = start*arr.itemsize
+    first = begin - begin % pagesize
+    end = stop*arr.itemsize
+    pages = (end - first + pagesize - 1) // pagesize if end > begin else 0
+    result = mmapbitarray(pages)
+    if pages:
+        flags = ffi.new('unsigned char[]', pages)
+        address = ffi.cast('char *', arr._data) + first
+        if C.mincore(address, pages*pagesize, flags) != 0:
+            errno = ffi.errno
+            raise OSError(errno, os.strerror(errno))
+        C.mba_pack_flags(result._words, flags, pages)
+    return result
+
+
+def memory_usage(arr):
+    """Memory used by the mapping of an array, from /proc/self/smaps.
+    The figures cover the whole mapping, including any space reserved
+    past the end of the array.
+    :returns: dict of the rss, pss, shared_clean, shared_dirty,
+        private_clean, private_dirty and swap sizes in bytes, and their
+        shared and private totals
+    """
+    if not os.path.exists(_SMAPS):
+        raise NotImplementedError("memory_usage needs %s" % _SMAPS)
+    address = arr.buffer_info()[0]
+    end = address + len(arr._mmap)
+    usage = dict.fromkeys(_SMAPS_FIELDS.values(), 0)
+    in_mapping = False
+    with open(_SMAPS) as f:
+        for line in f:
+            match = _SMAPS_HEADER.match(line)
+            if match:
+                low, high = int(match.group(1), 16), int(match.group(2), 16)
+                in_mapping = low < end and high > address
+            elif in_mapping:
+                name, _, value = line.partition(':')
+                if name in _SMAPS_FIELDS:
+                    usage[_SMAPS_FIELDS[name]] += int(value.split()[0]) * 1024
+    usage['shared'] = usage['shared_clean'] + usage['shared_dirty']
+    usage['private'] = usage['private_clean'] + usage['private_dirty']
+    return usage
@@ -1,20 +1,28 @@
 """mmap backed array datastructure"""
 import mmap
 import array, os, operator
+import errno
+import math
+import time
 import platform
+import sys
 
 from .slice_decoding import (
     _decode_old_slice,
     _decode_index,
 )
+from . import kernels
+from . import parallel
+from . import stats
 
 _mmap = mmap
 
 from cffi import FFI
 ffi = FFI()
+ffi.cdef(kernels.CDEF)
 
 if platform.system() == "Windows":
-    C = None
+    C = ffi.verify(kernels.SOURCE)
     def anon_mmap(data):
         """Create anonymous mmap for windows"""
         ANON_MAPPING_FILENO = -1
@@ -27,10 +35,11 @@ else:
     typedef unsigned int mode_t;
     int shm_open(const char *name, int oflag, mode_t mode);
     int shm_unlink(const char *name);
+    int mincore(void *addr, size_t length, unsigned char *vec);
     """)
     C = ffi.verify("""
     #include <sys/mman.h>
-    """, libraries=["rt"])
+    """ + kernels.SOURCE, libraries=["rt"])
 
 
     def anon_mmap(data):
@@ -60,6 +69,36 @@ else:
         return result
 
 
+def _allocate_file(fd, size, path=None):
+    """Make sure the blocks of the first size bytes of a file are
+    allocated on disk, growing it if needed.
+    :raises OSError: if there is not enough space
+    """
+    if size <= os.fstat(fd).st_size:
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except AttributeError:
+        os.ftruncate(fd, size)
+    except OSError as e:
+        if e.errno in (errno.EINVAL, errno.EOPNOTSUPP):
+            # the file system can't preallocate
+            os.ftruncate(fd, size)
+        else:
+            raise OSError(e.errno, e.strerror, path)
+
+
+def reserved_mmap(size):
+    """Create an anonymous shared mmap of size bytes without committing
+    memory for it. Pages only use memory once they are written to, so the
+    mapping can cover far more address space than the data it will hold.
+    """
+    if platform.system() == "Windows":
+        raise NotImplementedError("reserved mappings are not supported on Windows")
+    flags = _mmap.MAP_SHARED | getattr(_mmap, 'MAP_NORESERVE', 0)
+    return _mmap.mmap(-1, size, flags=flags)
+
+
 
 _typecode_to_type = {
     'c': ffi.typeof('char'),         'u': ffi.typeof('wchar_t'),
@@ -71,7 +110,7 @@ _typecode_to_type = {
 }
 
 __all__ = [
-    "anon_mmap", "C", "ffi", "mmaparray",
+    "anon_mmap", "reserved_mmap", "C", "ffi", "mmaparray",
 ]
 
 import ctypes
@@ -84,6 +123,80 @@ def address_of_buffer(buf):
     return address.value
 
 
+def _pointer_to(arr):
+    """Get a typed pointer to the items of an array.array or mmaparray"""
+    if isinstance(arr, mmaparray):
+        return arr._data
+    ptrtype = ffi.getctype(_typecode_to_type[arr.typecode], '*')
+    return ffi.cast(ptrtype, ffi.from_buffer(arr))
+
+
+def _index_vector(indices):
+    """Get a pointer to a vector of integer indices.
+    :indices: mmaparray, array.array or any other buffer of integers,
+        other iterables are converted to an array.array first
+    :returns: tuple of (index kernel suffix, pointer, length, owner) where
+        owner must be kept alive while the pointer is used
+    """
+    if isinstance(indices, mmaparray):
+        fmt, itemsize = indices.typecode, indices.itemsize
+        return _index_kind(fmt, itemsize), indices._data, len(indices), indices
+    try:
+        view = memoryview(indices)
+    except TypeError:
+        view = memoryview(array.array('q', indices))
+    if view.ndim != 1 or not view.c_contiguous:
+        raise ValueError("indices must be a contiguous one dimensional buffer")
+    fmt = view.format.lstrip('@=')
+    owner = ffi.from_buffer(view)
+    return _index_kind(fmt, view.itemsize), owner, len(view), owner
+
+def _index_at(kind, pointer, i):
+    """Read item i of a vector of indices from _index_vector"""
+    ctype = '{}int{}_t *'.format('' if kind[0] == 's' else 'u', 8*int(kind[1:]))
+    return ffi.cast(ctype, pointer)[i]
+
+def _array_typestr(typecode, itemsize):
+    """The NumPy array interface type string of a typecode"""
+    endian = '<' if sys.byteorder == 'little' else '>'
+    if typecode == 'c':
+        return '|S1'
+    if typecode == 'u':
+        if itemsize != 4:
+            raise TypeError("NumPy has no type for %d byte characters" % itemsize)
+        return endian + 'U1'
+    if typecode in 'fd':
+        kind = 'f'
+    elif typecode.islower():
+        kind = 'i'
+    else:
+        kind = 'u'
+    return '{}{}{}'.format('|' if itemsize == 1 else endian, kind, itemsize)
+
+
+def _typecode_for_dtype(dtype):
+    """Find the typecode with the same layout as a NumPy dtype"""
+    for typecode, itemtype in _typecode_to_type.items():
+        itemsize = ffi.sizeof(itemtype)
+        if itemsize == dtype.itemsize:
+            try:
+                typestr = _array_typestr(typecode, itemsize)
+            except TypeError:
+                continue
+            if typestr[1:] == dtype.str[1:]:
+                return typecode
+    raise TypeError("no typecode for dtype %s" % dtype)
+
+
+def _index_kind(fmt, itemsize):
+    """Find the index kernel suffix for a typecode or buffer format"""
+    if fmt in ('b', 'h', 'i', 'l', 'q', 'n'):
+        return 's{}'.format(itemsize)
+    if fmt in ('B', 'H', 'I', 'L', 'Q', 'N'):
+        return 'u{}'.format(itemsize)
+    raise TypeError("indices must be integers, got format '{}'".format(fmt))
+
+
 class mmaparray:
     """mmap backed Array like data structure"""
     def __new__(cls, typecode, *args, **kwargs):
@@ -113,11 +226,22 @@ class mmaparray:
 
         # validate **kwargs
         mmap = kwargs.pop('mmap', None)
+        reserve = kwargs.pop('reserve', None)
+        verify = kwargs.pop('verify', None)
         if kwargs:
             raise TypeError("unexpected keyword arguments %r" % kwargs.keys())
 
         # handle default mmap, validate and store mmap, compute size
-        if mmap is None:
+        if reserve is not None:
+            if mmap is not None:
+                raise TypeError("mmap and reserve can't be used together")
+            reserve = operator.index(reserve) * self.itemsize
+            if reserve <= 0:
+                raise ValueError("reserve must be positive")
+            reserve += -reserve % _mmap.PAGESIZE
+            mmap = reserved_mmap(reserve)
+            size = 0
+        elif mmap is None:
             mmap = anon_mmap(b'\x00')
             size = 0
         elif not isinstance(mmap, _mmap.mmap):
@@ -126,7 +250,14 @@ class mmaparray:
             size = len(mmap)
             size -= size % self.itemsize
         self._mmap = mmap
+        self._reserve = reserve
+        self._fd = None
+        self._fixed = False
+        self._stats = None
         self._setsize(size)
+        if verify is not None:
+            from . import integrity
+            integrity.verify(self, verify)
 
         #append the data
         if data is not None:
@@ -162,14 +293,162 @@ class mmaparray:
         :size: new size
         """
         assert size >= 0
-        if size == 0:
+        if self._fixed and size != self._size:
+            raise BufferError("can't resize an array mapped over part of a file")
+        timed = stats.enabled
+        if timed:
+            start = time.perf_counter()
+        if self._reserve is not None:
+            syscalls = self._resize_reserved(size)
+        elif self._fd is not None:
+            syscalls = self._resize_file(size)
+        elif size == 0:
             self._mmap.resize(1)
             #self._mmap[0] = b'\x00' #This gives a typeerror in cpython 3.4
             self._mmap[0] = 0
+            syscalls = 1
         else:
             self._mmap.resize(size)
+            syscalls = 1
+        if timed:
+            stats._record(self, 'resize', abs(size - self._size), start, syscalls)
         self._setsize(size)
 
+    def _move(self, dest, src, count):
+        """Move count bytes within the mapping"""
+        if stats.enabled:
+            start = time.perf_counter()
+            self._mmap.move(dest, src, count)
+            stats._record(self, 'move', count, start)
+        else:
+            self._mmap.move(dest, src, count)
+
+    def _resize_reserved(self, size):
+        """Resize within the reserved mapping, which never moves.
+        The bytes past the end are kept zero so that growing again reads
+        zeros like a resized mmap does, whole pages are given back.
+        :returns: the number of system calls made
+        """
+        if size > self._reserve:
+            raise MemoryError(
+                "size exceeds the %d bytes reserved for the array" % self._reserve
+            )
+        if size < self._size:
+            page = _mmap.PAGESIZE
+            first_page = size + -size % page
+            data = ffi.cast('char *', self._data)
+            partial = min(self._size, first_page) - size
+            ffi.buffer(data + size, partial)[:] = bytes(partial)
+            end = self._size + -self._size % page
+            if self._size > first_page:
+                try:
+                    self._mmap.madvise(_mmap.MADV_REMOVE, first_page, end - first_page)
+                except (AttributeError, OSError):
+                    for offset in range(first_page, end, page):
+                        ffi.buffer(data + offset, page)[:] = bytes(page)
+                return 1
+        return 0
+
+    def _resize_file(self, size):
+        """Resize an array opened with mmaparray.open.
+        The file grows a whole growth chunk at a time and is allocated
+        before it is mapped, so running out of disk space raises here
+        rather than faulting on a later write. Bytes past the end are kept
+        zero like a resized mmap.
+        :returns: the number of system calls made
+        """
+        capacity = max(self._growth, size + -size % self._growth)
+        mapped = len(self._mmap)
+        if capacity > mapped:
+            _allocate_file(self._fd, capacity, self._path)
+            self._mmap.resize(capacity)
+            return 2
+        syscalls = 0
+        if size < self._size:
+            if capacity < mapped:
+                self._mmap.resize(capacity)
+                syscalls = 1
+            end = min(self._size, capacity)
+            self._setsize(self._size)
+            ffi.buffer(ffi.cast('char *', self._data) + size, end - size)[:] = bytes(end - size)
+        return syscalls
+
+    @classmethod
+    def open(cls, typecode, path, growth=1 << 24, trim=True, verify=None):
+        """Open a file backed array that grows the file in large
+        preallocated chunks instead of truncating it on every resize.
+        Call close (or use the array as a context manager) when done.
+        :typecode: the typecode of the items
+        :path: the file, created if it doesn't exist. The array holds the
+            items in the file, including any zeros preallocated by an
+            earlier array that didn't trim it.
+        :growth: the number of bytes the file grows by at a time
+        :trim: cut the preallocated space off the end of the file on close
+        :verify: optional checksum file to check the items against, see
+            integrity.save_checksums
+        :raises OSError: if there is no space for the file to grow
+        :raises integrity.ChecksumError: if the items don't match
+        """
+        granularity = _mmap.ALLOCATIONGRANULARITY
+        growth = max(granularity, growth + -growth % granularity)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            size = os.fstat(fd).st_size
+            capacity = max(growth, size + -size % growth)
+            _allocate_file(fd, capacity, path)
+            self = cls(typecode, mmap=_mmap.mmap(fd, capacity))
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        self._path = path
+        self._growth = growth
+        self._trim = trim
+        self._setsize(size - size % self.itemsize)
+        if verify is not None:
+            from . import integrity
+            try:
+                integrity.verify(self, verify)
+            except BaseException:
+                # leave the file as it was
+                self._mmap.close()
+                os.ftruncate(fd, size)
+                os.close(fd)
+                raise
+        return self
+
+    def close(self):
+        """Close the mapping. An array opened with mmaparray.open is
+        flushed and, if it trims, the file is cut back to the items.
+        """
+        if self._mmap.closed:
+            return
+        size = self._size
+        if self._fd is not None:
+            self._mmap.flush()
+        self._mmap.close()
+        if self._fd is not None:
+            try:
+                if self._trim:
+                    os.ftruncate(self._fd, size)
+            finally:
+                os.close(self._fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @property
+    def reserved(self):
+        """The number of items the reserved mapping can hold without
+        moving, or None if the mapping is resized on demand
+        """
+        if self._reserve is None:
+            return None
+        return self._reserve // self.itemsize
+
 
     #Array API
     def __add__(self, other):
@@ -217,10 +496,46 @@ class mmaparray:
                 self._data[start:stop],
                 )
         else:
-            return array.array(
-                self.typecode,
-                (self._data[i] for i in range(start, stop, step)),
-                )
+            return self._get_extended_slice(start, stop, step)
+
+    def _get_extended_slice(self, start, stop, step):
+        """Gather the items of an extended slice with the strided kernel"""
+        n = len(range(start, stop, step))
+        if not n:
+            return array.array(self.typecode)
+        result = array.array(self.typecode, [self._data[start]]) * n
+        kernel = getattr(C, 'mba_gather_strided_{}'.format(self.itemsize))
+        src = self._data + start
+        dst = _pointer_to(result)
+        parallel.run(
+            n, lambda begin, end: kernel(src + begin*step, step, end - begin, dst + begin)
+        )
+        return result
+
+    def __delitem__(self, index):
+        if isinstance(index, int):
+            if index < 0:
+                index += self._length
+                if index < 0:
+                    raise IndexError
+            elif index >= self._length:
+                raise IndexError
+            index = slice(index, index + 1)
+        start, stop, step = index.indices(self._length)
+        n = len(range(start, stop, step))
+        if not n:
+            return
+        if step < 0:
+            # delete the same items going forwards
+            start, step = start + (n - 1)*step, -step
+        size = self._size
+        itemsize = self.itemsize
+        if step == 1:
+            self._move(start*itemsize, (start + n)*itemsize, size - (start + n)*itemsize)
+        else:
+            kernel = getattr(C, 'mba_delete_strided_{}'.format(itemsize))
+            kernel(self._data, self._length, start, step, n)
+        self._resize(size - n*itemsize)
 
     def __getslice__(self, i, j):
         start, stop, length = _decode_old_slice(i, j, self._length)
@@ -253,10 +568,10 @@ class mmaparray:
             while size < newsize:
                 rest = newsize-size
                 if rest < size:
-                    self._mmap.move(size, 0, rest)
+                    self._move(size, 0, rest)
                     break
                 else:
-                    self._mmap.move(size, 0, size)
+                    self._move(size, 0, size)
                     size += size
         return self
 
@@ -326,8 +641,16 @@ class mmaparray:
                 raise ValueError('attempt to assign object of length %r '
                                  'to extended slice of length %r'
                                  % (len(value), length_of_slice))
-            for i,v in zip(range(start, stop, step), value):
-                self._data[i] = v
+            if value is self or (isinstance(value, mmaparray) and value._mmap is self._mmap):
+                # the items could be overwritten before they are read
+                value = value[:]
+            kernel = getattr(C, 'mba_scatter_strided_{}'.format(self.itemsize))
+            dst = self._data + start
+            src = _pointer_to(value)
+            parallel.run(
+                length_of_slice,
+                lambda begin, end: kernel(dst + begin*step, step, end - begin, src + begin),
+            )
 
     def __setslice__(self, i, j, value):
         # validate value
@@ -345,6 +668,9 @@ class mmaparray:
         self._set_simple_slice(start, stop, length, value)
 
     def _set_simple_slice(self, start, stop, length, value):
+        if isinstance(value, mmaparray) and value is not self and value._mmap is self._mmap:
+            # another view of this mmap, its pointer goes stale on resize
+            value = mmaparray(value.typecode, value)
         # resize if necessary
         size = self._size
         newlength = len(value)
@@ -353,21 +679,40 @@ class mmaparray:
         if newlength > length:
             # need to expand first, then move
             self._resize(size+movesize)
-            self._mmap.move(pos+movesize, pos, size-pos)
+            self._move(pos+movesize, pos, size-pos)
         elif newlength < length:
             # need to move first, then shrink
-            self._mmap.move(pos+movesize, pos, size-pos)
+            self._move(pos+movesize, pos, size-pos)
             self._resize(size+movesize)
 
         # then copy values over as a single block
-        startpos = start*self.itemsize
-        stoppos = (start+newlength)*self.itemsize
-        if isinstance(value, mmaparray):
-            ffi.cast("char*", self._data)[startpos:stoppos] = value.tobytes()
+        if value is self:
+            self._spread_self(start, stop, newlength)
+        elif newlength:
+            self._copy_in(start*self.itemsize, _pointer_to(value), newlength*self.itemsize)
+
+    def _copy_in(self, pos, src, count):
+        """Copy count bytes from a pointer to the mapping at offset pos"""
+        if stats.enabled:
+            start = time.perf_counter()
+            ffi.memmove(ffi.cast("char*", self._data) + pos, src, count)
+            stats._record(self, 'copy', count, start)
         else:
-            ffi.cast("char*", self._data)[startpos:stoppos] = value.tobytes()#Can this be done with memoryview?
-            #ffi.cast("char*", self._data)[startpos:stoppos] = memoryview(value)
-
+            ffi.memmove(ffi.cast("char*", self._data) + pos, src, count)
+
+    def _spread_self(self, start, stop, oldlength):
+        """Finish the assignment self[start:stop] = self once the mapping
+        has been resized and the items after the slice moved into place.
+        The old items [start:stop] are still at their old position, the
+        items before the slice at the start and the ones after it at the
+        end, so the copy of the old array can be assembled in place.
+        """
+        itemsize = self.itemsize
+        begin = start*itemsize
+        self._move(2*begin, begin, (stop - start)*itemsize)
+        self._move(begin, 0, begin)
+        after = (oldlength - stop)*itemsize
+        self._move(begin + stop*itemsize, begin + oldlength*itemsize, after)
 
     def _frombytes(self, data):
         """Fill the mmap array from a bytes datasource
@@ -383,10 +728,15 @@ class mmaparray:
             pos = self._size
             assert pos % self.itemsize == 0
             self._resize(pos+bytesize)
+            timed = stats.enabled
+            if timed:
+                start = time.perf_counter()
             if isinstance(data, bytes):
                 ffi.cast("char*", self._data)[pos:pos+bytesize] = data
             else:
                 ffi.cast("char*", self._data)[pos:pos+bytesize] = ffi.from_buffer(data)
+            if timed:
+                stats._record(self, 'copy', bytesize, start)
 
     frombytes = _frombytes
 
@@ -412,13 +762,12 @@ class mmaparray:
             raise ValueError
         if othersize:
             pos = self._size
-            bytes_from_data = data.tobytes()#Note this must be called before resizing.
-                                            #otherwise bytes will be the wrong length in cases such as
-                                            #a._from_mmaparray(a) or  a.extend(a) if a is the mmaparray type
-            #TODO: Can this be done better?
             self._resize(pos + othersize)
-            #TODO: Check that this gets the underlying memory from the other mmaparray object correctly
-            ffi.cast("char*", self._data)[pos:pos+othersize] = bytes_from_data
+            if data._mmap is self._mmap:
+                # extending with itself (or another view of the same mmap)
+                self._move(pos, 0, othersize)
+            else:
+                self._copy_in(pos, data._data, othersize)
 
 
     def append(self, x):
@@ -438,20 +787,186 @@ class mmaparray:
         """Tuple of address, length of the array"""
         return address_of_buffer(self._mmap), self._size
 
-    def byteswap(self):
+    #NumPy support, NumPy is optional and only imported when it is needed
+    @property
+    def __array_interface__(self):
+        """NumPy array interface describing the items in the mapping.
+        The data is the mmap itself, so arrays made from it keep the mmap
+        exported and resizing raises BufferError while they exist.
+        """
+        return {
+            'shape': (self._length,),
+            'typestr': _array_typestr(self.typecode, self.itemsize),
+            'data': self._mmap,
+            'version': 3,
+        }
+
+    def __array__(self, dtype=None, copy=None):
+        result = self.to_numpy()
+        if dtype is not None and result.dtype != dtype:
+            if copy is False:
+                raise ValueError(
+                    "can't convert typecode %r to %s without a copy" % (self.typecode, dtype)
+                )
+            return result.astype(dtype)
+        if copy:
+            result = result.copy()
+        return result
+
+    def to_numpy(self):
+        """NumPy array viewing the items in the mapping without copying.
+        While the view exists the array can't be resized (BufferError is
+        raised), so it never refers to a stale mapping. Arrays created with
+        reserve never move, they can grow but the view keeps its length.
+        """
+        import numpy
+        dtype = numpy.dtype(_array_typestr(self.typecode, self.itemsize))
+        return numpy.frombuffer(self._mmap, dtype=dtype, count=self._length)
+
+    @classmethod
+    def from_numpy(cls, ndarray, mmap=None):
+        """Create an mmaparray holding a copy of the items of a NumPy array.
+        Multi-dimensional arrays are flattened in C order.
+        :ndarray: the NumPy array
+        :mmap: optional mmap to copy the items into, it is resized to fit
+        """
+        import numpy
+        ndarray = numpy.asarray(ndarray)
+        if not ndarray.dtype.isnative:
+            ndarray = ndarray.astype(ndarray.dtype.newbyteorder('='))
+        typecode = _typecode_for_dtype(ndarray.dtype)
+        ndarray = numpy.ascontiguousarray(ndarray)
+        if mmap is None:
+            result = cls(typecode)
+        else:
+            result = cls(typecode, mmap=mmap)
+            result._resize(0)
+        if ndarray.nbytes:
+            result._resize(ndarray.nbytes)
+            result._copy_in(0, ffi.from_buffer(ndarray.reshape(-1)), ndarray.nbytes)
+        return result
+
+    def byteswap(self, threads=None):
         """Swap the byte order of the array."""
         if self.itemsize == 1:
             return
         if self.itemsize not in (2,4,8):
             raise RuntimeError
-        for pos in range(0, self._size, self.itemsize):
-            self._mmap[pos:pos+self.itemsize] = self._mmap[pos:pos+self.itemsize][::-1]
-
-    def count(self, x):
+        kernel = getattr(C, 'mba_byteswap_{}'.format(self.itemsize))
+        data = self._data
+        parallel.run(
+            self._length, lambda begin, end: kernel(data + begin, end - begin), threads
+        )
+
+    def fill(self, value, start=None, stop=None, threads=None):
+        """Set the items in [start:stop] to value without building a
+        temporary array.
+        :value: the item to store
+        """
+        item = ffi.new(self._ptrtype, value)
+        kernel = getattr(C, 'mba_fill_{}'.format(self.itemsize))
+        data, n = self._range(start, stop)
+        parallel.run(n, lambda begin, end: kernel(data + begin, end - begin, item), threads)
+
+    def _offset(self, index):
+        """Normalise an index that may also be the end of the array"""
+        index = operator.index(index)
+        if index < 0:
+            index += self._length
+        if not 0 <= index <= self._length:
+            raise IndexError("array index out of range")
+        return index
+
+    def copy_within(self, dest, src_start=None, src_stop=None):
+        """Copy the items [src_start:src_stop] to the items starting at
+        dest, the ranges may overlap. Items that would be copied past the
+        end of the array are left out.
+        :dest: index of the first item to overwrite
+        """
+        dest = self._offset(dest)
+        src_start, src_stop, _ = slice(src_start, src_stop).indices(self._length)
+        count = min(max(src_stop - src_start, 0), self._length - dest)
+        if count and dest != src_start:
+            itemsize = self.itemsize
+            self._move(dest*itemsize, src_start*itemsize, count*itemsize)
+
+    def copy_from(self, other, dest_offset=0, src_range=None):
+        """Copy items from another array straight into this one.
+        :other: mmaparray or array.array of the same typecode
+        :dest_offset: index of the first item to overwrite
+        :src_range: optional slice or (start, stop) tuple of the items of
+            other to copy, defaults to all of them
+        :raises ValueError: if the items don't fit in this array
+        """
+        if not isinstance(other, (mmaparray, array.array)):
+            raise TypeError("can only copy from an array")
+        if other.typecode != self.typecode:
+            raise TypeError("Typecodes must be the same, got %s and %s" % (self.typecode, other.typecode))
+        if src_range is None:
+            src_range = slice(None)
+        elif not isinstance(src_range, slice):
+            src_range = slice(*src_range)
+        start, stop, step = src_range.indices(len(other))
+        if step != 1:
+            raise ValueError("src_range must be contiguous")
+        dest_offset = self._offset(dest_offset)
+        count = max(stop - start, 0)
+        if dest_offset + count > self._length:
+            raise ValueError("source items don't fit in the array")
+        if count:
+            itemsize = self.itemsize
+            self._copy_in(dest_offset*itemsize, _pointer_to(other) + start, count*itemsize)
+
+    def _search_value(self, x):
+        """Convert x to the item type for the search kernels.
+        :returns: the converted value, or None if no item can equal x
+        :raises TypeError: if there is no search kernel for this typecode
+            or x can't be converted, the caller compares items in python
+        """
+        if self.typecode not in kernels._numeric_ctypes:
+            raise TypeError
+        try:
+            value = ffi.new(self._ptrtype, x)[0]
+        except OverflowError:
+            return None
+        except TypeError:
+            # cffi only takes ints for integer items, but 2.0 or Decimal(2)
+            # still equal an item
+            if self.typecode not in kernels._integer_typecodes:
+                raise
+            try:
+                integral = int(x)
+            except (ValueError, OverflowError):
+                # nan or infinity
+                return None
+            if integral != x:
+                return None
+            try:
+                value = ffi.new(self._ptrtype, integral)[0]
+            except OverflowError:
+                return None
+        if value != x:
+            # x is not representable, for example 0.1 in a float array
+            return None
+        return value
+
+    def count(self, x, threads=None):
         """Return the number of occurrences of the given item in the array.
         :x: the item we are counting in the array
         """
-        return sum(x==y for y in self)
+        try:
+            value = self._search_value(x)
+        except TypeError:
+            return sum(x==y for y in self)
+        if value is None:
+            return 0
+        kernel = self._kernel('count')
+        data = self._data
+        return sum(parallel.run(
+            self._length,
+            lambda begin, end: kernel(data + begin, end - begin, value),
+            threads,
+        ))
 
     def extend(self, items):
         """Append items to the end of the array
@@ -498,11 +1013,25 @@ class mmaparray:
             self._frombytes(memoryview(data))
     _fromlist = fromlist
 
-    def index(self, x):
+    def index(self, x, threads=None):
         """Return the smallest i such that i is the index of the first occurrence of x in the array."""
-        for i, y in enumerate(self):
-            if y == x:
-                return i
+        try:
+            value = self._search_value(x)
+        except TypeError:
+            for i, y in enumerate(self):
+                if y == x:
+                    return i
+            raise ValueError
+        if value is not None:
+            kernel = self._kernel('find')
+            data = self._data
+            def find_part(begin, end):
+                return begin + kernel(data + begin, end - begin, value)
+            for found, (_, end) in zip(
+                    parallel.run(self._length, find_part, threads),
+                    parallel.partition(self._length, threads)):
+                if found < end:
+                    return found
         raise ValueError
 
     def insert(self, i, x):
@@ -521,7 +1050,7 @@ class mmaparray:
         self._resize(size+self.itemsize)
         if i < stop:
             pos = i*self.itemsize
-            self._mmap.move(pos+self.itemsize, pos, size-pos)
+            self._move(pos+self.itemsize, pos, size-pos)
         self._data[i] = x
 
     def pop(self, i=-1):
@@ -541,7 +1070,7 @@ class mmaparray:
         assert size%self.itemsize == 0
         next_pos = pos+self.itemsize
         if next_pos < size:
-            self._mmap.move(pos, next_pos, size-next_pos)
+            self._move(pos, next_pos, size-next_pos)
         self._resize(size-self.itemsize)
         return x
 
@@ -549,6 +1078,14 @@ class mmaparray:
         """Remove the first occurence of x from the array"""
         self.pop(self.index(x))
 
+    def reshape(self, *shape):
+        """View the array as a multi-dimensional shapedview without copying.
+        :shape: the dimensions, either as arguments or as a single tuple.
+            One dimension may be -1 to have it computed from the length.
+        """
+        from .shaped_view import shapedview, _resolve_shape
+        return shapedview(self, _resolve_shape(shape, self._length))
+
     def reverse(self):
         """Reverse the order of the items in the array."""
         stop = self._length
@@ -575,6 +1112,11 @@ class mmaparray:
 
     def tobytes(self):
         """Returns a bytes object representing the array."""
+        if stats.enabled:
+            start = time.perf_counter()
+            result = bytes(ffi.buffer(self._data, self._length * self._itemsize))
+            stats._record(self, 'copy', len(result), start)
+            return result
         return bytes(ffi.buffer(self._data, self._length * self._itemsize))
     _tobytes = tobytes
 
@@ -586,5 +1128,360 @@ class mmaparray:
         return self._tobytes().decode('utf-32le') #Do we need to check that ffi.sizeof('wchar_t') == 4 first?
     _tounicode = tounicode
 
+    def checksum(self, algorithm='crc32c', block_size=1 << 20, threads=None):
+        """Checksums of the bytes of the array in blocks of block_size
+        bytes, see integrity.block_checksums.
+        :algorithm: 'crc32c' or 'xxh64'
+        """
+        from . import integrity
+        return integrity.block_checksums(self, algorithm, block_size, threads)
+
+    #memory usage reporting, implemented in the memory module
+    def residency(self, start=None, stop=None):
+        """Which pages holding the items [start:stop] are resident in
+        memory, see memory.residency.
+        """
+        from . import memory
+        return memory.residency(self, start, stop)
+
+    def memory_usage(self):
+        """Resident, proportional, shared and private memory used by the
+        mapping in bytes, see memory.memory_usage.
+        """
+        from . import memory
+        return memory.memory_usage(self)
+
+    #asyncio support, the coroutines are implemented in the aio module
+    def aload(self, path, n=None, chunk_size=None, executor=None):
+        """Coroutine that appends the items stored in a file in chunks read
+        on an executor, see aio.load.
+        """
+        from . import aio
+        return aio.load(self, path, n, chunk_size, executor)
+
+    def aflush(self, start=None, stop=None, chunk_size=None, executor=None):
+        """Coroutine that flushes the items [start:stop] to disk in chunks on
+        an executor, see aio.flush.
+        """
+        from . import aio
+        return aio.flush(self, start, stop, chunk_size, executor)
+
+    def aprefetch(self, start=None, stop=None, chunk_size=None, executor=None):
+        """Coroutine that faults in the pages of the items [start:stop] in
+        chunks on an executor, see aio.prefetch.
+        """
+        from . import aio
+        return aio.prefetch(self, start, stop, chunk_size, executor)
+
+    def aiter_chunks(self, chunk_items=None, start=None, stop=None, executor=None):
+        """Asynchronous iterator over the items [start:stop] as array.array
+        chunks, see aio.iter_chunks.
+        """
+        from . import aio
+        return aio.iter_chunks(self, chunk_items, start, stop, executor)
+
+    #Batch gather/scatter
+    def _gather_kernel(self, name, kind, mode):
+        """Look up a take/put kernel and the value for its mode argument"""
+        try:
+            mode_value = kernels._index_modes[mode]
+        except KeyError:
+            raise ValueError("mode must be one of 'raise', 'wrap' or 'clip'")
+        kernel = getattr(C, 'mba_{}_{}_{}'.format(name, self.itemsize, kind))
+        return kernel, mode_value
+
+    def _check_batch(self, name, batch, length):
+        """Validate an array of items that is read or written in one batch"""
+        if not isinstance(batch, (array.array, mmaparray)):
+            raise TypeError(
+                '{} must be an array (not "{}")'.format(name, type(batch).__name__)
+            )
+        if batch.typecode != self.typecode:
+            raise TypeError('{} must be an array of the same type'.format(name))
+        if len(batch) != length:
+            raise ValueError(
+                '{} has length {}, expected {}'.format(name, len(batch), length)
+            )
+
+    def take(self, indices, out=None, mode='raise', threads=None):
+        """Gather the items at each of the indices.
+        :indices: mmaparray, array.array or buffer of integer indices
+        :out: optional array of the same type and length as indices to store
+            the items in
+        :mode: how out of range indices are handled, 'raise' raises an
+            IndexError (negative indices count from the end), 'wrap' wraps
+            them around and 'clip' clamps them to the first or last item
+        :threads: number of threads to split the indices across, defaults
+            to the setting in mmap_backed_array.parallel
+        :returns: out, or a new mmaparray if out was not given
+        """
+        kind, index_data, count, owner = _index_vector(indices)
+        kernel, mode_value = self._gather_kernel('take', kind, mode)
+        if out is None:
+            out = mmaparray._zeros(self.typecode, count)
+        self._check_batch('out', out, count)
+        if count:
+            if not self._length:
+                raise IndexError("cannot take from an empty array")
+            data, length = self._data, self._length
+            idx = ffi.cast('char *', index_data)
+            index_size = int(kind[1:])
+            dst = _pointer_to(out)
+            def take_part(begin, end):
+                bad = kernel(data, length, idx + begin*index_size, end - begin,
+                             dst + begin, mode_value)
+                return bad if bad < 0 else begin + bad
+            bad = [b for b in parallel.run(count, take_part, threads) if b >= 0]
+            if bad:
+                raise IndexError(
+                    "index {} is out of range for array of length {}".format(
+                        _index_at(kind, index_data, bad[0]), self._length)
+                )
+        return out
+
+    def put(self, indices, values, mode='raise'):
+        """Scatter values into the array, item i of values is stored at
+        indices[i]. With repeated indices the last value wins, so unlike
+        take this always runs on a single thread.
+        :indices: mmaparray, array.array or buffer of integer indices
+        :values: array of the same type and length as indices
+        :mode: as for take, in 'raise' mode nothing is written if any
+            index is out of range
+        """
+        kind, idx, count, owner = _index_vector(indices)
+        kernel, mode_value = self._gather_kernel('put', kind, mode)
+        if not isinstance(values, (array.array, mmaparray)):
+            values = array.array(self.typecode, values)
+        self._check_batch('values', values, count)
+        if count:
+            if not self._length:
+                raise IndexError("cannot put into an empty array")
+            bad = kernel(self._data, self._length, idx, count, _pointer_to(values), mode_value)
+            if bad >= 0:
+                raise IndexError(
+                    "index {} is out of range for array of length {}".format(
+                        _index_at(kind, idx, bad), self._length)
+                )
+
+    #Native reductions
+    def _range(self, start, stop):
+        """Find the pointer and element count that [start:stop] refers to.
+        Out of range values are clipped the same way as slicing does.
+        """
+        start, stop, _ = slice(start, stop).indices(self._length)
+        return self._data + start, max(stop - start, 0)
+
+    def _kernel(self, name):
+        """Look up the C kernel called name for the typecode of this array"""
+        try:
+            return getattr(C, 'mba_{}_{}'.format(name, self.typecode))
+        except AttributeError:
+            raise TypeError(
+                "{}() is not supported for typecode '{}'".format(name, self.typecode)
+            )
+
+    @classmethod
+    def _zeros(cls, typecode, length):
+        """Create a zero filled array with a fresh anonymous mapping.
+        :typecode: the typecode of the new array
+        :length: the number of elements
+        """
+        result = cls(typecode)
+        result._resize(length*result.itemsize)
+        return result
+
+    def sum(self, start=None, stop=None, threads=None):
+        """Sum of the items in [start:stop].
+        Integer sums are exact, floating point sums use compensated summation.
+        :threads: number of threads to split the range across, defaults to
+            the setting in mmap_backed_array.parallel
+        """
+        ptr, n = self._range(start, stop)
+        if self.typecode in kernels._float_typecodes:
+            kernel = self._kernel('fsum')
+            return math.fsum(parallel.run(
+                n, lambda begin, end: kernel(ptr + begin, end - begin), threads
+            ))
+        kernel = self._kernel('sum')
+        def sum_part(begin, end):
+            hi = ffi.new('long long *')
+            lo = ffi.new('unsigned long long *')
+            kernel(ptr + begin, end - begin, hi, lo)
+            return (hi[0] << 64) + lo[0]
+        return sum(parallel.run(n, sum_part, threads))
+
+    def mean(self, start=None, stop=None, threads=None):
+        """Arithmetic mean of the items in [start:stop]"""
+        _, n = self._range(start, stop)
+        if n == 0:
+            raise ValueError("mean() of an empty range")
+        return self.sum(start, stop, threads) / n
+
+    def argmin(self, start=None, stop=None, threads=None):
+        """Index of the first occurrence of the smallest item in [start:stop].
+        If there is a NaN the index of the first NaN is returned.
+        """
+        return self._argextreme('argmin', operator.lt, start, stop, threads)
+
+    def argmax(self, start=None, stop=None, threads=None):
+        """Index of the first occurrence of the largest item in [start:stop].
+        If there is a NaN the index of the first NaN is returned.
+        """
+        return self._argextreme('argmax', operator.gt, start, stop, threads)
+
+    def _argextreme(self, name, better, start, stop, threads):
+        kernel = self._kernel(name)
+        ptr, n = self._range(start, stop)
+        if n == 0:
+            raise ValueError("{}() of an empty range".format(name))
+        offset = ptr - self._data
+        candidates = parallel.run(
+            n, lambda begin, end: offset + begin + kernel(ptr + begin, end - begin),
+            threads,
+        )
+        # combine the partitions keeping the first of equal values
+        best = candidates[0]
+        for index in candidates:
+            value = self._data[index]
+            if value != value:
+                return index
+            if better(value, self._data[best]):
+                best = index
+        return best
+
+    def min(self, start=None, stop=None, threads=None):
+        """Smallest item in [start:stop]"""
+        return self._data[self.argmin(start, stop, threads)]
+
+    def max(self, start=None, stop=None, threads=None):
+        """Largest item in [start:stop]"""
+        return self._data[self.argmax(start, stop, threads)]
+
+    def cumsum(self, out=None, start=None, stop=None, threads=None):
+        """Running totals of the items in [start:stop].
+        Totals are held in the accumulator type ('l' for signed, 'L' for
+        unsigned and 'd' for floating point typecodes), integer totals wrap
+        around on overflow.
+        :out: optional mmaparray or array.array of the accumulator type with
+            the same length as the range to write the totals into.
+        :threads: number of threads to split the range across, defaults to
+            the setting in mmap_backed_array.parallel
+        :returns: out, or a new mmaparray if out was not given
+        """
+        kernel = self._kernel('cumsum')
+        ptr, n = self._range(start, stop)
+        acc_typecode = kernels._accumulator_typecodes[self.typecode]
+        if out is None:
+            out = mmaparray._zeros(acc_typecode, n)
+        if not isinstance(out, (array.array, mmaparray)):
+            raise TypeError(
+                'out must be an array (not "{}")'.format(type(out).__name__)
+            )
+        if out.typecode != acc_typecode:
+            raise TypeError(
+                "out must have typecode '{}'".format(acc_typecode)
+            )
+        if len(out) != n:
+            raise ValueError(
+                'out has length {}, expected {}'.format(len(out), n)
+            )
+        if not n:
+            return out
+        dst = _pointer_to(out)
+        parts = parallel.partition(n, threads)
+        if len(parts) == 1:
+            kernel(ptr, n, 0, dst)
+            return out
+        # First find the total of each partition, then redo the running
+        # totals of every partition after the first starting from the sum
+        # of the partitions before it, wrapped like the accumulator type.
+        totals = parallel.run(
+            n, lambda begin, end: kernel(ptr + begin, end - begin, 0, dst + begin),
+            threads,
+        )
+        acc_type = _typecode_to_type[acc_typecode]
+        convert = float if acc_typecode == 'd' else int
+        carried = {}
+        carry = 0
+        for (begin, _), total in zip(parts[1:], totals):
+            carry = convert(ffi.cast(acc_type, carry + total))
+            carried[begin] = carry
+        def carry_part(begin, end):
+            if begin:
+                kernel(ptr + begin, end - begin, carried[begin], dst + begin)
+        parallel.run(n, carry_part, threads)
+        return out
+
+    def _counts(self, kernel_call, length, n, threads):
+        """Run a counting kernel over partitions with a separate counts
+        array per partition and merge them.
+        :kernel_call: function(begin, end, counts) that runs the kernel
+        :returns: mmaparray('L') of the merged counts
+        """
+        counts = mmaparray._zeros('L', length)
+        parts = parallel.partition(n, threads)
+        partials = [counts] + [mmaparray._zeros('L', length) for _ in parts[1:]]
+        lookup = dict((begin, partial) for (begin, _), partial in zip(parts, partials))
+        results = parallel.run(
+            n, lambda begin, end: kernel_call(begin, end, lookup[begin]), threads
+        )
+        for partial in partials[1:]:
+            C.mba_add_counts(counts._data, partial._data, length)
+        return counts, results
+
+    def bincount(self, minlength=0, start=None, stop=None, threads=None):
+        """Count the occurrences of each value in [start:stop].
+        Only for integer typecodes, all the values must be non-negative.
+        :minlength: minimum number of bins in the result
+        :returns: mmaparray('L') where item i is the number of occurrences of i
+        """
+        kernel = self._kernel('bincount')
+        ptr, n = self._range(start, stop)
+        length = minlength
+        if n:
+            length = max(length, self.max(start, stop, threads) + 1)
+        counts, results = self._counts(
+            lambda begin, end, part: kernel(ptr + begin, end - begin, part._data, length),
+            length, n, threads,
+        )
+        if any(results):
+            raise ValueError("bincount() values must be non-negative")
+        return counts
+
+    def histogram(self, bins=10, value_range=None, start=None, stop=None, threads=None):
+        """Count the items in [start:stop] falling into equal width bins.
+        :bins: number of bins
+        :value_range: (low, high) bounds of the bins, defaults to the
+            smallest and largest item. Items outside the bounds are ignored.
+        :returns: tuple of mmaparray('L') of counts and array.array('d') of
+            the bins+1 bin edges
+        """
+        kernel = self._kernel('histogram')
+        bins = operator.index(bins)
+        if bins <= 0:
+            raise ValueError("bins must be positive")
+        ptr, n = self._range(start, stop)
+        if value_range is None:
+            if n:
+                low = self.min(start, stop, threads)
+                high = self.max(start, stop, threads)
+            else:
+                low, high = 0.0, 1.0
+        else:
+            low, high = value_range
+        low, high = float(low), float(high)
+        if low > high:
+            raise ValueError("max must be larger than min in value_range")
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        counts, _ = self._counts(
+            lambda begin, end, part: kernel(ptr + begin, end - begin, low, high, part._data, bins),
+            bins, n, threads,
+        )
+        width = (high - low) / bins
+        edges = array.array('d', (low + i*width for i in range(bins)))
+        edges.append(high)
+        return counts, edges
+
     itemsize = property(operator.attrgetter('_itemsize'))
     typecode = property(operator.attrgetter('_typecode'))
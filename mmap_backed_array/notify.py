@@ -0,0 +1,121 @@
+"""Change notification between processes sharing mmaparrays"""
+import asyncio
+import time
+
+from .mmap_array import anon_mmap, ffi, C
+
+__all__ = [
+    "mmapnotifier",
+]
+
+# Bytes used by a notifier, the generation and the number of waiters
+NOTIFIER_SIZE = 16
+
+# Longest time an await_change spends blocked in one executor call, bounds
+# how long a cancelled wait keeps its executor thread
+_ASYNC_SLICE = 0.5
+
+# Longest sleep between checks where waiting is done by polling
+_MAX_POLL_DELAY = 0.01
+
+
+def _wait(block, since, timeout, count=True):
+    """Wait for the generation at block to differ from since.
+    :timeout: seconds to wait at most, or None to wait for ever
+    :count: count the waiter in the block, without it notify must always
+        wake
+    :returns: the new generation, or None if the wait timed out
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    delay = 0.0001
+    while True:
+        generation = C.mba_atomic_load(block)
+        if generation != since:
+            return generation
+        if deadline is None:
+            remaining = -1.0
+        else:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+        if C.mba_wait_change(block, since, remaining, count) < 0:
+            time.sleep(delay if remaining < 0 else min(delay, remaining))
+            delay = min(2*delay, _MAX_POLL_DELAY)
+
+
+async def _await(block, since, timeout, executor, count=True):
+    """Coroutine version of _wait that waits on an executor"""
+    loop = asyncio.get_running_loop()
+    deadline = None if timeout is None else loop.time() + timeout
+    while True:
+        wait = _ASYNC_SLICE if deadline is None else min(_ASYNC_SLICE, deadline - loop.time())
+        generation = await loop.run_in_executor(
+            executor, _wait, block, since, max(wait, 0), count
+        )
+        if generation is not None:
+            return generation
+        if deadline is not None and loop.time() >= deadline:
+            return None
+
+
+class mmapnotifier:
+    """Generation counter in shared memory that processes can sleep on.
+
+    A writer calls notify after changing shared arrays, readers call
+    wait_for_change to sleep until that happens instead of polling the
+    arrays. On Linux waiting uses a futex and notifying makes no system
+    call unless someone is waiting, elsewhere waiting polls the counter.
+    """
+    def __init__(self, mmap=None, offset=0):
+        """
+        :mmap: optional shared mmap holding the counter, by default a new
+            anonymous mapping that is shared with child processes
+        :offset: the offset of the NOTIFIER_SIZE bytes of the counter in
+            mmap, a multiple of 8
+        """
+        if mmap is None:
+            mmap = anon_mmap(bytes(NOTIFIER_SIZE))
+        if offset % 8 or not 0 <= offset <= len(mmap) - NOTIFIER_SIZE:
+            raise ValueError("offset must be a multiple of 8 inside the mmap")
+        self._mmap = mmap
+        self._block = ffi.cast('uint64_t *', ffi.from_buffer(mmap)) + offset // 8
+        self._seen = self.generation
+
+    @property
+    def mmap(self):
+        """The mapping holding the counter"""
+        return self._mmap
+
+    @property
+    def generation(self):
+        """The number of notifications so far"""
+        return C.mba_atomic_load(self._block)
+
+    def notify(self):
+        """Wake everything waiting for a change.
+        :returns: the new generation
+        """
+        return C.mba_notify(self._block)
+
+    def wait_for_change(self, since=None, timeout=None):
+        """Sleep until the generation differs from since.
+        :since: the generation to wait for a change from, defaults to the
+            generation this notifier last saw
+        :timeout: seconds to wait at most, or None to wait for ever
+        :returns: the new generation, or None if the wait timed out
+        """
+        generation = _wait(self._block, self._seen if since is None else since, timeout)
+        if generation is not None:
+            self._seen = generation
+        return generation
+
+    async def await_change(self, since=None, timeout=None, executor=None):
+        """Coroutine version of wait_for_change, the waiting is done on
+        an executor so the event loop keeps running.
+        :executor: executor to wait on, defaults to the loop's default executor
+        """
+        generation = await _await(self._block, self._seen if since is None else since,
+                                  timeout, executor)
+        if generation is not None:
+            self._seen = generation
+        return generation
@@ -0,0 +1,98 @@
+"""
+Partitioning of large operations across a thread pool.
+
+The C kernels run without the GIL so an operation over a large range of
+items can be split into contiguous partitions that are processed on
+separate threads. Operations smaller than the threshold, or when only one
+thread is configured, run serially on the calling thread.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+__all__ = [
+    "get_threads", "set_threads", "get_threshold", "set_threshold",
+]
+
+_threads = 1
+_threshold = 1 << 18
+
+_pool = None
+_pool_pid = None
+_pool_threads = 0
+_pool_lock = threading.Lock()
+
+
+def get_threads():
+    """The number of threads operations are split across by default"""
+    return _threads
+
+
+def set_threads(threads):
+    """Set the number of threads operations are split across by default.
+    :threads: number of threads, None for one per CPU. 1 disables threading.
+    """
+    global _threads
+    if threads is None:
+        threads = os.cpu_count() or 1
+    if threads < 1:
+        raise ValueError("threads must be at least 1")
+    _threads = threads
+
+
+def get_threshold():
+    """The minimum number of items each thread is given"""
+    return _threshold
+
+
+def set_threshold(items):
+    """Set the minimum number of items each thread is given, operations on
+    fewer than twice this many items always run serially.
+    """
+    global _threshold
+    if items < 1:
+        raise ValueError("threshold must be at least 1")
+    _threshold = items
+
+
+def _get_pool(threads):
+    """Get a pool with at least the given number of threads.
+    A new pool is created after a fork because threads are not inherited.
+    A pool that is too small is replaced but not shut down, other threads
+    may still be submitting to it. Its threads exit once it is no longer
+    referenced.
+    """
+    global _pool, _pool_pid, _pool_threads
+    with _pool_lock:
+        pid = os.getpid()
+        if _pool is None or _pool_pid != pid or _pool_threads < threads:
+            if _pool_pid == pid:
+                threads = max(threads, _pool_threads)
+            _pool = ThreadPoolExecutor(max_workers=threads)
+            _pool_pid = pid
+            _pool_threads = threads
+        return _pool
+
+
+def partition(length, threads=None):
+    """Split range(length) into contiguous (start, stop) partitions.
+    :length: the number of items
+    :threads: number of threads, defaults to the global setting
+    """
+    if threads is None:
+        threads = _threads
+    parts = max(1, min(threads, length // _threshold))
+    bounds = [length * i // parts for i in range(parts + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def run(length, func, threads=None):
+    """Call func(start, stop) for each partition of range(length).
+    :returns: list of the results in partition order
+    """
+    parts = partition(length, threads)
+    if len(parts) == 1:
+        return [func(*parts[0])]
+    pool = _get_pool(len(parts))
+    futures = [pool.submit(func, start, stop) for start, stop in parts]
+    return [future.result() for future in futures]
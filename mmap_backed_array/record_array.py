@@ -0,0 +1,264 @@
+"""mmap backed arrays of fixed width records"""
+import collections
+import itertools
+import operator
+
+from .mmap_array import mmaparray, ffi, _typecode_to_type
+from .shaped_view import shapedview
+
+__all__ = [
+    "mmaprecordarray",
+]
+
+# Struct types declared for field specs, keyed by the spec so that records
+# with the same layout share a type
+_declared_structs = {}
+_struct_counter = itertools.count()
+
+
+def _struct_for_fields(fields):
+    """Declare (or reuse) a cffi struct type for a list of (name, typecode)"""
+    fields = tuple((name, typecode) for name, typecode in fields)
+    if not fields:
+        raise ValueError("a record needs at least one field")
+    try:
+        return _declared_structs[fields]
+    except KeyError:
+        pass
+    members = []
+    for name, typecode in fields:
+        if not isinstance(name, str) or not name.isidentifier():
+            raise ValueError("field name %r is not a valid identifier" % (name,))
+        try:
+            itemtype = _typecode_to_type[typecode]
+        except (KeyError, TypeError):
+            raise ValueError("bad typecode %r for field %r" % (typecode, name))
+        members.append("{} {};".format(itemtype.cname, name))
+    struct_name = "struct mba_record_{}".format(next(_struct_counter))
+    ffi.cdef("{} {{ {} }};".format(struct_name, " ".join(members)))
+    ctype = ffi.typeof(struct_name)
+    _declared_structs[fields] = ctype
+    return ctype
+
+
+_type_to_typecode = {
+    itemtype: typecode for typecode, itemtype in _typecode_to_type.items()
+}
+
+
+class _fieldcolumn:
+    """Typed item access to one field of every record, used as the base of
+    column views. Item i of the column is the field of record
+    i*stride + offset, the length is measured in field sized items.
+    """
+    def __init__(self, records, typecode):
+        self._records = records
+        self.typecode = typecode
+        itemtype = _typecode_to_type[typecode]
+        self.itemsize = ffi.sizeof(itemtype)
+        self._ptrtype = ffi.typeof(ffi.getctype(itemtype, '*'))
+
+    @property
+    def _data(self):
+        return ffi.cast(self._ptrtype, self._records._rows._data)
+
+    @property
+    def _mmap(self):
+        return self._records._rows._mmap
+
+    def __len__(self):
+        return len(self._records._rows) // self.itemsize
+
+
+class mmaprecordarray:
+    """mmap backed array of fixed width records.
+
+    Records are stored contiguously as C structs with the natural alignment
+    of the platform, so the mapping can be shared with C programs that
+    declare the same struct.
+    """
+    def __init__(self, fields, data=None, mmap=None):
+        """
+        :fields: sequence of (name, typecode) pairs, or a cffi struct type
+            (or its name) that was declared with mmap_backed_array.ffi
+        :data: optional iterable of records to append
+        :mmap: optional mmap to use as backing, its existing contents are
+            interpreted as records
+        """
+        if isinstance(fields, (str, ffi.CType)):
+            ctype = ffi.typeof(fields)
+            if ctype.kind != 'struct':
+                raise TypeError("expected a struct type, got %r" % ctype.cname)
+        else:
+            ctype = _struct_for_fields(fields)
+        self._ctype = ctype
+        self._ptrtype = ffi.typeof(ffi.getctype(ctype, '*'))
+        self._itemsize = ffi.sizeof(ctype)
+
+        self._fields = collections.OrderedDict()
+        for name, field in ctype.fields:
+            try:
+                typecode = _type_to_typecode[field.type]
+            except KeyError:
+                raise TypeError(
+                    "field %r has type %r which has no typecode" % (name, field.type.cname)
+                )
+            self._fields[name] = (typecode, field.offset)
+        self.record = collections.namedtuple('record', list(self._fields))
+
+        if mmap is None:
+            self._rows = mmaparray('B')
+        else:
+            self._rows = mmaparray('B', mmap=mmap)
+            excess = len(self._rows) % self._itemsize
+            if excess:
+                self._rows._setsize(len(self._rows) - excess)
+        self._setlength()
+
+        if data is not None:
+            self.extend(data)
+
+    def _setlength(self):
+        """Refresh the length and record pointer after the rows have changed"""
+        self._length = len(self._rows) // self._itemsize
+        self._data = ffi.cast(self._ptrtype, self._rows._data)
+
+    def _resize(self, length):
+        """Resize to hold the given number of records"""
+        self._rows._resize(length*self._itemsize)
+        self._setlength()
+
+    def _index(self, index):
+        index = operator.index(index)
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("record index out of range")
+        return index
+
+    def _torecord(self, struct):
+        return self.record._make(getattr(struct, name) for name in self._fields)
+
+    def _initializer(self, value):
+        """Convert a record given as a sequence or mapping to a cffi initializer"""
+        if isinstance(value, dict):
+            unknown = set(value) - set(self._fields)
+            if unknown:
+                raise ValueError("unknown fields %s" % ", ".join(sorted(unknown)))
+            return value
+        value = list(value)
+        if len(value) != len(self._fields):
+            raise ValueError(
+                "expected %d fields, got %d" % (len(self._fields), len(value))
+            )
+        return value
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, str):
+            return self.column(index)
+        if isinstance(index, slice):
+            return [self._torecord(self._data[i])
+                    for i in range(*index.indices(self._length))]
+        return self._torecord(self._data[self._index(index)])
+
+    def __setitem__(self, index, value):
+        """Store a record given as a sequence of field values, or update
+        some of its fields given as a mapping of field names to values.
+        """
+        self._data[self._index(index)] = self._initializer(value)
+
+    def __iter__(self):
+        for i in range(self._length):
+            yield self._torecord(self._data[i])
+
+    def __repr__(self):
+        return "mmaprecordarray({!r}, {!r})".format(self.fields, list(self))
+
+    def append(self, record):
+        """Append a record given as a sequence of field values or a mapping
+        of field names to values (missing fields are zero).
+        """
+        initializer = self._initializer(record)
+        length = self._length
+        self._resize(length + 1)
+        try:
+            self._data[length] = initializer
+        except (TypeError, OverflowError):
+            self._resize(length)
+            raise
+
+    def extend(self, records):
+        """Append many records at once.
+        :records: an iterable of records, or a bytes-like object holding
+            records in the struct layout which is copied in a single block
+        """
+        if isinstance(records, mmaprecordarray):
+            if records._ctype is not self._ctype:
+                raise TypeError("can only extend with records of the same type")
+            # mapping to mapping, also when extending with itself
+            self._rows._from_mmaparray(records._rows)
+            self._setlength()
+            return
+        try:
+            view = memoryview(records)
+        except TypeError:
+            initializers = [self._initializer(record) for record in records]
+            length = self._length
+            self._resize(length + len(initializers))
+            try:
+                for i, initializer in enumerate(initializers, length):
+                    self._data[i] = initializer
+            except (TypeError, OverflowError):
+                self._resize(length)
+                raise
+        else:
+            self.frombytes(view)
+
+    def frombytes(self, data):
+        """Append records from a bytes-like object in the struct layout"""
+        view = memoryview(data).cast('B')
+        if view.nbytes % self._itemsize:
+            raise ValueError("bytes length not a multiple of the record size")
+        self._rows.frombytes(view)
+        self._setlength()
+
+    def column(self, name):
+        """A one dimensional view of a single field of every record.
+        Writes to the view are stored in the records.
+        """
+        try:
+            typecode, offset = self._fields[name]
+        except KeyError:
+            raise KeyError("no field named %r" % (name,))
+        base = _fieldcolumn(self, typecode)
+        if offset % base.itemsize or self._itemsize % base.itemsize:
+            raise ValueError("field %r is not aligned to its own size" % (name,))
+        return shapedview(
+            base,
+            (self._length,),
+            (self._itemsize // base.itemsize,),
+            offset // base.itemsize,
+        )
+
+    def buffer_info(self):
+        """Tuple of address, length in bytes of the records"""
+        return self._rows.buffer_info()
+
+    def tobytes(self):
+        """Returns a bytes object holding the records in the struct layout"""
+        return self._rows.tobytes()
+
+    def tolist(self):
+        """Convert to a list of record namedtuples"""
+        return list(self)
+
+    @property
+    def fields(self):
+        """Tuple of (name, typecode) of each field"""
+        return tuple((name, typecode) for name, (typecode, _) in self._fields.items())
+
+    ctype = property(operator.attrgetter('_ctype'))
+    itemsize = property(operator.attrgetter('_itemsize'))
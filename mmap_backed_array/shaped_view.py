@@ -0,0 +1,285 @@
+"""Multi-dimensional views over the items of an mmaparray"""
+import array
+import itertools
+import operator
+
+from .mmap_array import mmaparray, ffi, C
+
+__all__ = [
+    "shapedview",
+]
+
+
+def _contiguous_strides(shape):
+    """Row-major strides (in items) for the given shape"""
+    strides = []
+    stride = 1
+    for length in reversed(shape):
+        strides.append(stride)
+        stride *= length
+    return tuple(reversed(strides))
+
+
+def _product(values):
+    result = 1
+    for value in values:
+        result *= value
+    return result
+
+
+class shapedview:
+    """A multi-dimensional view of the items of an mmaparray.
+
+    The view shares memory with the mmaparray it was created from, so writes
+    through the view are visible in the array and vice versa. Strides and
+    the offset are measured in items. The view stays valid if the underlying
+    array is resized as long as it still covers the items of the view.
+    """
+    def __init__(self, base, shape, strides=None, offset=0):
+        """
+        :base: the mmaparray holding the items, or another object that gives
+            the same typed access to items (such as a record array column)
+        :shape: the length of each dimension
+        :strides: the number of items between neighbours in each dimension,
+            defaults to row-major (C) order
+        :offset: the index in base of the first item of the view
+        """
+        if not (isinstance(base, mmaparray) or hasattr(base, '_data')):
+            raise TypeError("expected an mmaparray, got %r" % type(base).__name__)
+        shape = tuple(operator.index(length) for length in shape)
+        if not shape:
+            raise ValueError("a view must have at least one dimension")
+        if any(length < 0 for length in shape):
+            raise ValueError("negative dimensions are not allowed")
+        if strides is None:
+            strides = _contiguous_strides(shape)
+        strides = tuple(operator.index(stride) for stride in strides)
+        if len(strides) != len(shape):
+            raise ValueError("strides must have one entry per dimension")
+        offset = operator.index(offset)
+
+        self._base = base
+        self._shape = shape
+        self._strides = strides
+        self._offset = offset
+        self._size = _product(shape)
+
+        # The lowest and highest index of base that the view touches
+        self._low = offset + sum(s*(n-1) for n, s in zip(shape, strides) if s < 0)
+        self._high = offset + sum(s*(n-1) for n, s in zip(shape, strides) if s > 0)
+        if self._size and (self._low < 0 or self._high >= len(base)):
+            raise ValueError("view does not fit in an array of length %d" % len(base))
+
+    base = property(operator.attrgetter('_base'))
+    shape = property(operator.attrgetter('_shape'))
+    strides = property(operator.attrgetter('_strides'))
+    offset = property(operator.attrgetter('_offset'))
+    size = property(operator.attrgetter('_size'))
+
+    @property
+    def ndim(self):
+        return len(self._shape)
+
+    @property
+    def typecode(self):
+        return self._base.typecode
+
+    @property
+    def itemsize(self):
+        return self._base.itemsize
+
+    @property
+    def T(self):
+        """The transposed view"""
+        return self.transpose()
+
+    def _pointer(self):
+        """Pointer to the first item of the view"""
+        if self._size and self._high >= len(self._base):
+            raise IndexError("view is out of range of the underlying array")
+        return self._base._data + self._offset
+
+    def _locate(self, key):
+        """Find the offset, shape and strides that key selects"""
+        if not isinstance(key, tuple):
+            key = (key,)
+        if len(key) > self.ndim:
+            raise IndexError(
+                "too many indices, view has %d dimensions" % self.ndim
+            )
+        offset = self._offset
+        shape = []
+        strides = []
+        for index, length, stride in zip(key, self._shape, self._strides):
+            if isinstance(index, slice):
+                start, stop, step = index.indices(length)
+                shape.append(len(range(start, stop, step)))
+                strides.append(stride*step)
+                offset += start*stride
+            else:
+                index = operator.index(index)
+                if index < 0:
+                    index += length
+                if not 0 <= index < length:
+                    raise IndexError("index out of range")
+                offset += index*stride
+        shape.extend(self._shape[len(key):])
+        strides.extend(self._strides[len(key):])
+        return offset, shape, strides
+
+    def __getitem__(self, key):
+        offset, shape, strides = self._locate(key)
+        self._pointer()
+        if not shape:
+            return self._base._data[offset]
+        return shapedview(self._base, shape, strides, offset)
+
+    def __setitem__(self, key, value):
+        offset, shape, strides = self._locate(key)
+        self._pointer()
+        if not shape:
+            self._base._data[offset] = value
+            return
+        shapedview(self._base, shape, strides, offset)._assign(value)
+
+    def __len__(self):
+        return self._shape[0]
+
+    def __iter__(self):
+        for i in range(self._shape[0]):
+            yield self[i]
+
+    def __eq__(self, other):
+        if isinstance(other, shapedview):
+            return (self._shape == other._shape and
+                    self.tolist() == other.tolist())
+        return NotImplemented
+
+    def __repr__(self):
+        return "shapedview('{}', {!r})".format(self.typecode, self.tolist())
+
+    def is_contiguous(self):
+        """True if the items of the view are contiguous and in row-major order"""
+        return self._strides == _contiguous_strides(self._shape) or self._size == 0
+
+    def transpose(self, *axes):
+        """View with the dimensions permuted, reversed by default.
+        :axes: the new order of the dimensions
+        """
+        if len(axes) == 1 and not isinstance(axes[0], int):
+            axes = tuple(axes[0])
+        if not axes:
+            axes = tuple(reversed(range(self.ndim)))
+        if sorted(axes) != list(range(self.ndim)):
+            raise ValueError("axes don't match the dimensions of the view")
+        return shapedview(
+            self._base,
+            [self._shape[axis] for axis in axes],
+            [self._strides[axis] for axis in axes],
+            self._offset,
+        )
+
+    def reshape(self, *shape):
+        """View the same items with a different shape.
+        Only contiguous views can be reshaped.
+        """
+        if not self.is_contiguous():
+            raise ValueError("only contiguous views can be reshaped")
+        return shapedview(self._base, _resolve_shape(shape, self._size), offset=self._offset)
+
+    def _row_offsets(self):
+        """Offsets (relative to the first item) of each row of the last dimension"""
+        outer = [range(length) for length in self._shape[:-1]]
+        for position in itertools.product(*outer):
+            yield sum(i*stride for i, stride in zip(position, self._strides))
+
+    def copy(self):
+        """Copy the items in row-major order into a new one dimensional mmaparray"""
+        result = mmaparray._zeros(self.typecode, self._size)
+        if self._size:
+            gather = getattr(C, 'mba_gather_strided_{}'.format(self.itemsize))
+            src = self._pointer()
+            row_length = self._shape[-1]
+            stride = self._strides[-1]
+            for row, row_offset in enumerate(self._row_offsets()):
+                gather(src + row_offset, stride, row_length, result._data + row*row_length)
+        return result
+
+    def _assign(self, value):
+        """Store the items of value in row-major order into the view"""
+        if isinstance(value, shapedview):
+            value = value.copy()
+        if not isinstance(value, (array.array, mmaparray)):
+            raise TypeError(
+                'can only assign array (not "%s") to a view' % type(value).__name__
+            )
+        if value.typecode != self.typecode:
+            raise TypeError('can only assign array of same kind to a view')
+        if len(value) != self._size:
+            raise ValueError(
+                'attempt to assign array of length %d to view of size %d'
+                % (len(value), self._size)
+            )
+        if isinstance(value, mmaparray) and value._mmap is self._base._mmap:
+            # Rows may overlap the source, take a copy first
+            value = mmaparray(self.typecode, value)
+        if self._size:
+            if isinstance(value, mmaparray):
+                owner = value
+                src = value._data
+            else:
+                owner = ffi.from_buffer(value)
+                src = ffi.cast(self._base._ptrtype, owner)
+            scatter = getattr(C, 'mba_scatter_strided_{}'.format(self.itemsize))
+            dst = self._pointer()
+            row_length = self._shape[-1]
+            stride = self._strides[-1]
+            for row, row_offset in enumerate(self._row_offsets()):
+                scatter(dst + row_offset, stride, row_length, src + row*row_length)
+
+    def tobytes(self):
+        """The items of the view in row-major order as bytes"""
+        if self.is_contiguous():
+            return bytes(ffi.buffer(self._pointer(), self._size*self.itemsize))
+        return self.copy().tobytes()
+
+    def tolist(self):
+        """Convert the view to nested lists"""
+        if self.ndim == 1:
+            return self.copy().tolist()
+        return [row.tolist() for row in self]
+
+    def buffer(self):
+        """A multi-dimensional memoryview of a contiguous view.
+        The memoryview refers directly to the mapping and must not be used
+        after the underlying array has been resized. memoryviews can't have
+        a zero in their shape, an empty view gives an empty one dimensional
+        memoryview and keeps its shape in the shape attribute.
+        """
+        if not self.is_contiguous():
+            raise ValueError("only contiguous views can be exported as a buffer")
+        nbytes = self._size*self.itemsize
+        if not nbytes:
+            return memoryview(array.array(self.typecode))
+        raw = memoryview(ffi.buffer(self._pointer(), nbytes))
+        return raw.cast('B').cast(self.typecode, self._shape)
+
+
+def _resolve_shape(shape, size):
+    """Normalize a shape given as arguments or as a tuple and fill in a
+    single -1 dimension so that the shape has the given size.
+    """
+    if len(shape) == 1 and not isinstance(shape[0], int):
+        shape = tuple(shape[0])
+    shape = [operator.index(length) for length in shape]
+    unknown = [axis for axis, length in enumerate(shape) if length == -1]
+    if len(unknown) > 1:
+        raise ValueError("can only specify one unknown dimension")
+    if unknown:
+        known = _product(length for length in shape if length != -1)
+        if known == 0 or size % known:
+            raise ValueError("cannot reshape %d items into shape %r" % (size, tuple(shape)))
+        shape[unknown[0]] = size // known
+    if _product(shape) != size:
+        raise ValueError("cannot reshape %d items into shape %r" % (size, tuple(shape)))
+    return tuple(shape)
@@ -0,0 +1,138 @@
+"""
+Opt in instrumentation of mmaparray operations.
+
+While enabled every resize, move of data within a mapping and copy of
+data into or out of a mapping is counted, both globally and per array,
+with the bytes involved, the system calls made on the mapping and the
+time spent. When disabled the only cost is a check of the enabled flag.
+"""
+import contextlib
+import threading
+import time
+
+__all__ = [
+    "enable", "disable", "is_enabled", "get_stats", "reset", "measure",
+    "add_hook", "remove_hook",
+]
+
+COUNTERS = (
+    "resizes", "moves", "copies",
+    "bytes_resized", "bytes_moved", "bytes_copied",
+    "syscalls", "seconds",
+)
+
+# the counters incremented by each event
+_EVENTS = {
+    "resize": ("resizes", "bytes_resized"),
+    "move": ("moves", "bytes_moved"),
+    "copy": ("copies", "bytes_copied"),
+}
+
+enabled = False
+
+# enabled is kept as a plain flag for the check on every operation, it is
+# set while enable was called or any measure block is running
+_enabled_by_call = False
+_measuring = 0
+
+_totals = dict.fromkeys(COUNTERS, 0)
+_hooks = []
+_lock = threading.Lock()
+
+
+def _update(call=None, measuring=0):
+    """Change the reasons for counting and set enabled from them"""
+    global enabled, _enabled_by_call, _measuring
+    with _lock:
+        if call is not None:
+            _enabled_by_call = call
+        _measuring += measuring
+        enabled = _enabled_by_call or _measuring > 0
+
+
+def enable():
+    """Start counting"""
+    _update(call=True)
+
+
+def disable():
+    """Stop counting, the counts so far are kept. Running measure blocks
+    keep counting until they exit.
+    """
+    _update(call=False)
+
+
+def is_enabled():
+    """True if operations are being counted"""
+    return enabled
+
+
+def get_stats(arr=None):
+    """Get a dict of the counters.
+    :arr: optional array to get the counters of, defaults to the totals
+        for all arrays
+    """
+    with _lock:
+        if arr is None:
+            return dict(_totals)
+        return dict(arr._stats or dict.fromkeys(COUNTERS, 0))
+
+
+def reset(arr=None):
+    """Zero the counters.
+    :arr: optional array to reset the counters of, by default the totals
+        are reset
+    """
+    with _lock:
+        if arr is None:
+            _totals.update(dict.fromkeys(COUNTERS, 0))
+        else:
+            arr._stats = None
+
+
+@contextlib.contextmanager
+def measure(arr=None):
+    """Context manager that counts the operations in its block.
+    Yields a dict that is filled with the counts of the block on exit.
+    Blocks can be nested or run at the same time in several threads, the
+    counts of each block include the operations of the others running.
+    :arr: optional array to only count the operations of
+    """
+    before = get_stats(arr)
+    result = {}
+    _update(measuring=1)
+    try:
+        yield result
+    finally:
+        _update(measuring=-1)
+        after = get_stats(arr)
+        result.update((name, after[name] - before[name]) for name in COUNTERS)
+
+
+def add_hook(hook):
+    """Call hook(event, arr, nbytes, seconds) after each counted operation.
+    event is one of 'resize', 'move' or 'copy'.
+    """
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    """Stop calling a hook added with add_hook"""
+    _hooks.remove(hook)
+
+
+def _record(arr, event, nbytes, start, syscalls=0):
+    """Count an operation that began at time.perf_counter() start"""
+    seconds = time.perf_counter() - start
+    count, byte_count = _EVENTS[event]
+    with _lock:
+        counters = arr._stats
+        if counters is None:
+            counters = arr._stats = dict.fromkeys(COUNTERS, 0)
+        for target in (_totals, counters):
+            target[count] += 1
+            target[byte_count] += nbytes
+            target["syscalls"] += syscalls
+            target["seconds"] += seconds
+    for hook in _hooks:
+        hook(event, arr, nbytes, seconds)
@@ -0,0 +1,77 @@
+import array
+import asyncio
+import mmap
+import pytest
+
+from mmap_backed_array import mmaparray
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestAsyncio:
+    """Test the asyncio coroutines of mmaparray"""
+
+    def test_aload(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        with open(path, 'wb') as f:
+            f.write(array.array('i', range(1000)).tobytes())
+        arr = mmaparray('i', (-1,))
+        run(arr.aload(path, chunk_size=100))
+        assert len(arr) == 1001
+        assert arr[0] == -1
+        assert list(arr[1:]) == list(range(1000))
+
+    def test_aload_count(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        with open(path, 'wb') as f:
+            f.write(array.array('h', range(10)).tobytes())
+        arr = mmaparray('h')
+        run(arr.aload(path, n=4))
+        assert list(arr) == [0, 1, 2, 3]
+        with pytest.raises(EOFError):
+            run(arr.aload(path, n=12, chunk_size=6))
+        assert len(arr) == 14
+        assert list(arr[4:]) == list(range(10))
+
+    def test_aload_bad_size(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        with open(path, 'wb') as f:
+            f.write(b'\x00' * 5)
+        arr = mmaparray('i')
+        with pytest.raises(ValueError):
+            run(arr.aload(path))
+        assert len(arr) == 0
+
+    def test_aflush(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        with open(path, 'wb') as f:
+            f.write(b'\x00' * 4 * 5000)
+        with open(path, 'r+b') as f:
+            backing = mmap.mmap(f.fileno(), 0)
+            arr = mmaparray('i', mmap=backing)
+            arr[4500] = 42
+            run(arr.aflush(4000, chunk_size=1))
+            backing.close()
+        with open(path, 'rb') as f:
+            assert array.array('i', f.read())[4500] == 42
+
+    def test_aprefetch(self):
+        arr = mmaparray('d', range(100000))
+        run(arr.aprefetch(chunk_size=4096))
+        run(arr.aprefetch(10, 20))
+        assert arr[99999] == 99999.0
+
+    def test_aiter_chunks(self):
+        arr = mmaparray('I', range(10))
+
+        async def collect():
+            return [chunk async for chunk in arr.aiter_chunks(4)]
+
+        chunks = run(collect())
+        assert [list(chunk) for chunk in chunks] == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9]]
@@ -0,0 +1,126 @@
+import array
+import mmap
+import os
+import pytest
+
+from mmap_backed_array import mmaparray, arrow
+
+
+class TestArrow:
+    """Test the Arrow IPC file writer and reader"""
+
+    def test_round_trip(self, tmpdir):
+        path = str(tmpdir.join('table.arrow'))
+        arrow.write_file(path, [
+            ('id', mmaparray('L', range(1000))),
+            ('score', array.array('d', [0.5]*1000)),
+            ('flag', mmaparray('b', [1, -1]*500)),
+        ])
+        columns = arrow.read_file(path)
+        assert list(columns) == ['id', 'score', 'flag']
+        assert columns['id'].typecode == 'L'
+        assert list(columns['id']) == list(range(1000))
+        assert columns['score'].tolist() == [0.5]*1000
+        assert columns['flag'].sum() == 0
+
+    def test_columns_are_mapped(self, tmpdir):
+        path = str(tmpdir.join('table.arrow'))
+        arrow.write_file(path, {'a': mmaparray('i', [1, 2, 3]), 'b': mmaparray('i', [4, 5, 6])})
+        columns = arrow.read_file(path)
+        columns['a'][0] = 10
+        assert arrow.read_file(path)['a'][0] == 1
+        columns = arrow.read_file(path, access=mmap.ACCESS_WRITE)
+        columns['b'][2] = 60
+        columns['b']._mmap.flush()
+        assert list(arrow.read_file(path)['b']) == [4, 5, 60]
+
+    def test_mapped_columns_are_fixed(self, tmpdir):
+        path = str(tmpdir.join('table.arrow'))
+        arrow.write_file(path, {'a': mmaparray('i', [1, 2, 3]), 'b': mmaparray('i', [4, 5, 6])})
+        size = os.path.getsize(path)
+        for access in (mmap.ACCESS_COPY, mmap.ACCESS_WRITE):
+            column = arrow.read_file(path, access=access)['b']
+            with pytest.raises(BufferError):
+                column.append(7)
+            with pytest.raises(BufferError):
+                column.extend([7, 8])
+            with pytest.raises(BufferError):
+                column.pop()
+            assert list(column) == [4, 5, 6]
+        assert os.path.getsize(path) == size
+        assert list(arrow.read_file(path)['a']) == [1, 2, 3]
+
+    def test_read_only_access(self, tmpdir):
+        path = str(tmpdir.join('table.arrow'))
+        arrow.write_file(path, {'a': mmaparray('i', [1, 2, 3])})
+        with pytest.raises(ValueError):
+            arrow.read_file(path, access=mmap.ACCESS_READ)
+
+    def test_empty(self, tmpdir):
+        path = str(tmpdir.join('table.arrow'))
+        arrow.write_file(path, {'a': mmaparray('h')})
+        columns = arrow.read_file(path)
+        assert len(columns['a']) == 0
+
+    def test_bad_columns(self, tmpdir):
+        path = str(tmpdir.join('table.arrow'))
+        with pytest.raises(ValueError):
+            arrow.write_file(path, {'a': mmaparray('h', [1]), 'b': mmaparray('h')})
+        with pytest.raises(TypeError):
+            arrow.write_file(path, {'a': [1, 2]})
+        with pytest.raises(TypeError):
+            arrow.write_file(path, {'a': mmaparray('u', 'ab')})
+        with open(path, 'wb') as f:
+            f.write(b'not an arrow file at all')
+        with pytest.raises(ValueError):
+            arrow.read_file(path)
+
+
+class TestPyarrow:
+    """Check the files against pyarrow when it is installed"""
+
+    def setup_class(cls):
+        cls.pa = pytest.importorskip('pyarrow')
+        import pyarrow.ipc
+
+    def test_pyarrow_reads(self, tmpdir):
+        pa = self.pa
+        path = str(tmpdir.join('table.arrow'))
+        arrow.write_file(path, {
+            'a': mmaparray('l', range(-5, 5)),
+            'b': mmaparray('f', [1.5]*10),
+            'c': mmaparray('H', range(10)),
+        })
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            assert table.schema.field('a').type == pa.int64()
+            assert table.schema.field('b').type == pa.float32()
+            assert table.schema.field('c').type == pa.uint16()
+            assert not table.schema.field('a').nullable
+            assert table.column('a').to_pylist() == list(range(-5, 5))
+            assert table.column('b').to_pylist() == [1.5]*10
+            assert table.column('c').to_pylist() == list(range(10))
+            table.validate(full=True)
+
+    def test_read_pyarrow_file(self, tmpdir):
+        pa = self.pa
+        path = str(tmpdir.join('table.arrow'))
+        table = pa.table({
+            'x': pa.array([1, 2, 3], pa.int32()),
+            'y': pa.array([0.25, 0.5, 1.0], pa.float64()),
+        })
+        with pa.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+        columns = arrow.read_file(path)
+        assert columns['x'].typecode == 'i'
+        assert list(columns['x']) == [1, 2, 3]
+        assert list(columns['y']) == [0.25, 0.5, 1.0]
+
+    def test_nulls_rejected(self, tmpdir):
+        pa = self.pa
+        path = str(tmpdir.join('table.arrow'))
+        table = pa.table({'x': pa.array([1, None, 3], pa.int64())})
+        with pa.ipc.new_file(path, table.schema) as writer:
+            writer.write_table(table)
+        with pytest.raises(ValueError):
+            arrow.read_file(path)
@@ -0,0 +1,83 @@
+import mmap
+import pytest
+
+from mmap_backed_array import mmapbitarray
+
+
+class TestBitArray:
+    """Test the packed bit array"""
+
+    def test_get_set_flip(self):
+        bits = mmapbitarray(130)
+        assert len(bits) == 130
+        assert not bits.any()
+        bits[0] = True
+        bits[129] = 1
+        bits[-2] = True
+        assert bits[0] and bits[128] and bits[129]
+        assert not bits[64]
+        assert bits.flip(64) is True
+        assert bits.flip(0) is False
+        bits[129] = False
+        assert not bits[129]
+        with pytest.raises(IndexError):
+            bits[130]
+
+    def test_count_and_find(self):
+        bits = mmapbitarray([0, 1, 0, 0, 1] * 40)
+        assert bits.count() == 80
+        assert bits.count(False) == 120
+        assert bits.count(True, 1, 5) == 2
+        assert bits.find() == 1
+        assert bits.find(True, 2) == 4
+        assert bits.find(False, 1) == 2
+        assert bits.find(True, 2, 4) == -1
+        assert mmapbitarray(70).find() == -1
+
+    def test_fill_and_resize(self):
+        bits = mmapbitarray(200)
+        bits.fill(True, 10, 150)
+        assert bits.count() == 140
+        assert not bits[9] and bits[10] and bits[149] and not bits[150]
+        bits.resize(100)
+        assert bits.count() == 90
+        bits.resize(300)
+        assert bits.count() == 90
+        assert not bits[150]
+        bits.fill(True)
+        assert bits.all()
+
+    def test_append_extend(self):
+        bits = mmapbitarray()
+        bits.append(True)
+        bits.extend([False, True])
+        assert bits.tolist() == [True, False, True]
+        assert repr(bits) == "mmapbitarray('101')"
+
+    def test_bitwise(self):
+        a = mmapbitarray([1, 1, 0, 0] * 20)
+        b = mmapbitarray([1, 0, 1, 0] * 20)
+        assert (a & b).tolist() == [True, False, False, False] * 20
+        assert (a | b).tolist() == [True, True, True, False] * 20
+        assert (a ^ b).tolist() == [False, True, True, False] * 20
+        inverted = ~a
+        assert inverted.tolist() == [False, False, True, True] * 20
+        assert inverted.count() == 40
+        a &= b
+        assert a.count() == 20
+        a |= b
+        assert a == b
+        with pytest.raises(ValueError):
+            a ^ mmapbitarray(3)
+
+    def test_mmap_backing(self, tmpdir):
+        path = str(tmpdir.join('bits.dat'))
+        with open(path, 'wb') as f:
+            f.write(b'\x05' + b'\x00' * 15)
+        with open(path, 'r+b') as f:
+            backing = mmap.mmap(f.fileno(), 0)
+            bits = mmapbitarray(mmap=backing)
+            assert len(bits) == 128
+            assert bits.count() == 2
+            assert bits[0] and bits[2]
+            backing.close()
@@ -0,0 +1,84 @@
+import array
+import mmap
+import pytest
+
+from mmap_backed_array import mmapbytesarray
+
+
+class TestBytesArray:
+    """Test the variable length bytes array"""
+
+    def test_append_and_index(self):
+        items = mmapbytesarray()
+        assert len(items) == 0
+        items.append(b'abc')
+        items.append(b'')
+        items.append(bytearray(b'xy'))
+        items.append(array.array('H', [1]))
+        assert len(items) == 4
+        assert items[0] == b'abc'
+        assert items[1] == b''
+        assert items[-2] == b'xy'
+        assert items[3] == array.array('H', [1]).tobytes()
+        assert items[1:3] == [b'', b'xy']
+        assert items.itemlength(0) == 3
+        assert list(items.offsets) == [0, 3, 3, 5, 7]
+        with pytest.raises(IndexError):
+            items[4]
+
+    def test_extend(self):
+        items = mmapbytesarray([b'a'])
+        items.extend([b'bb', b'', b'cccc'])
+        items.extend([])
+        items.extend(mmapbytesarray([b'd']))
+        assert items.tolist() == [b'a', b'bb', b'', b'cccc', b'd']
+        assert repr(mmapbytesarray([b'a'])) == "mmapbytesarray([b'a'])"
+
+    def test_extend_with_self(self):
+        items = mmapbytesarray([b'a', b'', b'bc'])
+        items.extend(items)
+        assert items.tolist() == [b'a', b'', b'bc', b'a', b'', b'bc']
+        items.extend([bytearray(b'xy'), memoryview(b'z')])
+        assert items[-2:] == [b'xy', b'z']
+
+    def test_view(self):
+        items = mmapbytesarray([b'hello', b'world'])
+        view = items.view(1)
+        assert view.tobytes() == b'world'
+        view[0] = ord(b'W')
+        assert items[1] == b'World'
+
+    def test_bisect(self):
+        items = mmapbytesarray([b'a', b'ab', b'abc', b'b', b'b', b'ba', b'c'])
+        assert items.bisect_left(b'') == 0
+        assert items.bisect_left(b'ab') == 1
+        assert items.bisect_right(b'ab') == 2
+        assert items.bisect_left(b'b') == 3
+        assert items.bisect_right(b'b') == 5
+        assert items.bisect_left(b'bb') == 6
+        assert items.bisect_left(b'd') == 7
+        assert items.bisect_left(b'b', 4) == 4
+        assert items.search_sorted(b'ba') == 5
+        assert items.search_sorted(b'aa') == -1
+        assert items.search_sorted(b'z') == -1
+        with pytest.raises(ValueError):
+            items.bisect_left(b'a', 3, 2)
+
+    def test_mmap_backing(self, tmpdir):
+        offsets_path = str(tmpdir.join('offsets.dat'))
+        data_path = str(tmpdir.join('data.dat'))
+        with open(offsets_path, 'wb') as f:
+            f.write(array.array('L', [0, 2, 5]).tobytes())
+        with open(data_path, 'wb') as f:
+            f.write(b'hiyou' + b'\x00' * 11)
+        with open(offsets_path, 'r+b') as f, open(data_path, 'r+b') as g:
+            offsets = mmap.mmap(f.fileno(), 0)
+            data = mmap.mmap(g.fileno(), 0)
+            items = mmapbytesarray(offsets_mmap=offsets, data_mmap=data)
+            assert items.tolist() == [b'hi', b'you']
+            items.append(b'!')
+            assert items[2] == b'!'
+            offsets.close()
+            data.close()
+        with pytest.raises(TypeError):
+            mmapbytesarray(offsets_mmap=mmap.mmap(-1, 8))
@@ -0,0 +1,92 @@
+import pytest
+
+from mmap_backed_array import mmaparray, parallel
+from mmap_backed_array.delta import diff, apply_patch, patch_info, save_patch, load_patch
+
+
+def versions(old_length, new_length, changes=()):
+    old = mmaparray('l', range(old_length))
+    new = mmaparray('l', range(new_length))
+    for i in changes:
+        new[i] = -1
+    return old, new
+
+
+class TestDiff:
+
+    def test_changed_blocks(self):
+        old, new = versions(1000, 1000, [0, 7, 8, 500, 999])
+        patch = diff(old, new, block_size=64)
+        info = patch_info(patch)
+        assert info['typecode'] == 'l'
+        assert (info['old_size'], info['new_size']) == (8000, 8000)
+        assert info['blocks'] == [0, 1, 62, 124]
+        apply_patch(old, patch)
+        assert old == new
+
+    def test_unchanged(self):
+        old, new = versions(1000, 1000)
+        patch = diff(old, new)
+        assert patch_info(patch)['blocks'] == []
+        apply_patch(old, patch)
+        assert old == new
+
+    @pytest.mark.parametrize('old_length,new_length', [(100, 150), (150, 100), (0, 10), (10, 0)])
+    def test_resize(self, old_length, new_length):
+        old, new = versions(old_length, new_length, [i for i in (3, 40) if i < new_length])
+        patch = diff(old, new, block_size=48)
+        apply_patch(old, patch)
+        assert old == new
+
+    def test_threads(self):
+        threshold = parallel.get_threshold()
+        parallel.set_threshold(100)
+        try:
+            old, new = versions(10000, 10003, range(0, 10000, 777))
+            patch = diff(old, new, block_size=256, threads=4)
+            assert patch == diff(old, new, block_size=256, threads=1)
+            apply_patch(old, patch)
+            assert old == new
+        finally:
+            parallel.set_threshold(threshold)
+
+    def test_errors(self):
+        old, new = versions(100, 100, [5])
+        with pytest.raises(TypeError):
+            diff(old, mmaparray('i', range(100)))
+        with pytest.raises(ValueError):
+            diff(old, new, block_size=0)
+        patch = diff(old, new, block_size=64)
+        with pytest.raises(ValueError):
+            apply_patch(mmaparray('l', range(99)), patch)
+        with pytest.raises(TypeError):
+            apply_patch(mmaparray('L', range(100)), patch)
+        with pytest.raises(ValueError):
+            apply_patch(old, patch.tobytes()[:-1])
+        with pytest.raises(ValueError):
+            apply_patch(old, b'not a patch' * 10)
+
+
+class TestPatchFiles:
+
+    def test_save_and_load(self, tmpdir):
+        old, new = versions(5000, 5100, [10, 4000])
+        path = str(tmpdir.join('table.patch'))
+        save_patch(diff(old, new, block_size=4096), path)
+        patch = load_patch(path)
+        assert patch_info(patch)['blocks'] == [0, 7, 9]
+        apply_patch(old, patch)
+        assert old == new
+
+    def test_apply_to_open_file(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        old, new = versions(20000, 19000, [123, 18000])
+        with mmaparray.open('l', path) as table:
+            table.extend(old)
+        patch = diff(old, new, block_size=4096)
+        with mmaparray.open('l', path) as table:
+            apply_patch(table, patch)
+        with mmaparray.open('l', path) as table:
+            assert table == new
+        with pytest.raises(ValueError):
+            apply_patch(old, bytes(patch)[:40])
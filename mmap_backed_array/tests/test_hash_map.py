@@ -0,0 +1,103 @@
+import array
+import mmap
+import pytest
+
+from mmap_backed_array import mmapdict, mmaparray
+
+
+class TestMmapDict:
+    """Test the mmap backed hash table"""
+
+    def test_mapping(self):
+        table = mmapdict('d', {1: 0.5, 2**64 - 1: 1.5})
+        assert len(table) == 2
+        assert table[2**64 - 1] == 1.5
+        assert 1 in table and 3 not in table
+        assert table.get(3, -1.0) == -1.0
+        table[1] = 2.5
+        assert table[1] == 2.5
+        assert len(table) == 2
+        del table[1]
+        assert 1 not in table
+        assert dict(table.items()) == {2**64 - 1: 1.5}
+        with pytest.raises(KeyError):
+            table[-1]
+        with pytest.raises(KeyError):
+            del table[1]
+        with pytest.raises(TypeError):
+            table['a'] = 1.0
+
+    def test_growth(self):
+        table = mmapdict('I', capacity=8)
+        for key in range(0, 5000, 7):
+            table[key] = key // 7
+        assert table.capacity > 8
+        assert len(table) == len(range(0, 5000, 7))
+        assert all(table[key] == key // 7 for key in range(0, 5000, 7))
+        assert sorted(table) == list(range(0, 5000, 7))
+
+    def test_delete_keeps_probe_chains(self):
+        table = mmapdict('i', capacity=8, max_load=0.9)
+        keys = list(range(100, 107))
+        for key in keys:
+            table[key] = key
+        for key in keys[::2]:
+            del table[key]
+        assert sorted(table) == keys[1::2]
+        assert all(table[key] == key for key in keys[1::2])
+
+    def test_batch(self):
+        table = mmapdict('h')
+        keys = array.array('Q', [10**12 + k*977 for k in range(1000)])
+        table.put_many(keys, array.array('h', range(1000)))
+        assert len(table) == 1000
+        query = array.array('q', [keys[5], 3, keys[999]])
+        found = array.array('B', [9]*3)
+        values = table.get_many(query, default=-1, found=found)
+        assert isinstance(values, mmaparray)
+        assert list(values) == [5, -1, 999]
+        assert list(found) == [1, 0, 1]
+        assert list(table.get_many(mmaparray('L', [keys[1]]))) == [1]
+        assert list(table.get_many([keys[2]])) == [2]
+        with pytest.raises(ValueError):
+            table.put_many([1, 2], [1])
+
+    def test_clear(self):
+        table = mmapdict('b', {1: 1, 2: 2})
+        table.clear()
+        assert len(table) == 0
+        assert 1 not in table
+
+    def test_mmap_backing(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        with open(path, 'wb') as f:
+            f.write(b'\x00')
+        with open(path, 'r+b') as f:
+            backing = mmap.mmap(f.fileno(), 0)
+            table = mmapdict('L', mmap=backing)
+            table.put_many(range(100), range(100, 200))
+            backing.close()
+        with open(path, 'r+b') as f:
+            backing = mmap.mmap(f.fileno(), 0)
+            table = mmapdict('L', mmap=backing)
+            assert len(table) == 100
+            assert table[42] == 142
+            with pytest.raises(TypeError):
+                mmapdict('d', mmap=backing)
+            backing.close()
+
+    def test_reader_follows_growth(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        with open(path, 'wb') as f:
+            f.write(b'\x00')
+        with open(path, 'r+b') as f:
+            writer = mmapdict('L', capacity=8, mmap=mmap.mmap(f.fileno(), 0))
+            writer[1] = 101
+            reader = mmapdict('L', mmap=mmap.mmap(f.fileno(), 0))
+        assert reader[1] == 101
+        writer.put_many(range(2, 1000), range(102, 1100))
+        assert writer.capacity > 8
+        assert reader[999] == 1099
+        assert reader.capacity == writer.capacity
+        assert len(reader) == 999
+        assert sorted(reader) == list(range(1, 1000))
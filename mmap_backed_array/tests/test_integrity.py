@@ -0,0 +1,93 @@
+import mmap
+import pytest
+
+from mmap_backed_array import mmaparray, parallel
+from mmap_backed_array.integrity import (
+    ChecksumError, block_checksums, save_checksums, load_checksums,
+)
+
+
+def crc32c(data):
+    """Bitwise reference CRC32C"""
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc ^= byte
+        for _ in range(8):
+            crc = (crc >> 1) ^ (0x82F63B78 if crc & 1 else 0)
+    return crc ^ 0xFFFFFFFF
+
+
+class TestChecksums:
+
+    def test_known_values(self):
+        arr = mmaparray('B', b'123456789')
+        assert list(arr.checksum(block_size=100)) == [0xE3069283]
+        assert list(mmaparray('B', b'abc').checksum('xxh64')) == [0x44BC2CF5AD770999]
+        assert list(mmaparray('B').checksum('xxh64')) == []
+
+    def test_blocks(self):
+        data = bytes(range(256)) * 10 + b'tail'
+        arr = mmaparray('B', data)
+        checksums = arr.checksum(block_size=1000)
+        assert checksums.typecode == 'L'
+        assert list(checksums) == [crc32c(data[i:i + 1000]) for i in range(0, len(data), 1000)]
+        items = mmaparray('i', range(1000))
+        assert list(items.checksum(block_size=4000)) == [crc32c(items.tobytes())]
+        with pytest.raises(ValueError):
+            arr.checksum('md5')
+        with pytest.raises(ValueError):
+            arr.checksum(block_size=0)
+
+    def test_threads(self):
+        threshold = parallel.get_threshold()
+        parallel.set_threshold(100)
+        try:
+            arr = mmaparray('B', bytes(range(256)) * 40)
+            serial = block_checksums(arr, 'xxh64', 64, threads=1)
+            assert list(block_checksums(arr, 'xxh64', 64, threads=4)) == list(serial)
+            assert list(block_checksums(arr, 'xxh64', 100, threads=3)) == \
+                list(block_checksums(arr, 'xxh64', 100, threads=1))
+        finally:
+            parallel.set_threshold(threshold)
+
+
+class TestVerify:
+
+    def write_table(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        checksum_path = str(tmpdir.join('table.dat.checksum'))
+        arr = mmaparray('I', range(5000))
+        with open(path, 'wb') as f:
+            f.write(arr.tobytes())
+        save_checksums(arr, checksum_path, 'xxh64', block_size=4096)
+        return path, checksum_path
+
+    def test_save_and_load(self, tmpdir):
+        path, checksum_path = self.write_table(tmpdir)
+        algorithm, block_size, size, checksums = load_checksums(checksum_path)
+        assert (algorithm, block_size, size, len(checksums)) == ('xxh64', 4096, 20000, 5)
+
+    def test_verify_on_open(self, tmpdir):
+        path, checksum_path = self.write_table(tmpdir)
+        with open(path, 'r+b') as f:
+            backing = mmap.mmap(f.fileno(), 0)
+            arr = mmaparray('I', mmap=backing, verify=checksum_path)
+            assert arr[4999] == 4999
+            backing[10000] ^= 1
+            with pytest.raises(ChecksumError) as excinfo:
+                mmaparray('I', mmap=backing, verify=checksum_path)
+            assert excinfo.value.blocks == [2]
+            backing.close()
+
+    def test_truncated(self, tmpdir):
+        path, checksum_path = self.write_table(tmpdir)
+        with open(path, 'r+b') as f:
+            f.truncate(16000)
+        with pytest.raises(ChecksumError):
+            mmaparray.open('I', path, verify=checksum_path)
+        with open(path, 'rb') as f:
+            assert len(f.read()) == 16000
+        with open(path, 'ab') as f:
+            f.write(mmaparray('I', range(4000, 5000)).tobytes())
+        with mmaparray.open('I', path, verify=checksum_path) as arr:
+            assert len(arr) == 5000
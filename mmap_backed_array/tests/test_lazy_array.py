@@ -0,0 +1,118 @@
+import array
+import os
+
+import pytest
+
+from mmap_backed_array import mmaparray, mmaplazyarray
+
+
+class Squares:
+    """compute_block that records the blocks it was called for"""
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, start, stop):
+        self.calls.append((start, stop))
+        return array.array('l', (i*i for i in range(start, stop)))
+
+
+class TestLazyArray:
+
+    def test_compute_on_access(self):
+        compute = Squares()
+        arr = mmaplazyarray('l', 1000, compute, block_size=100)
+        assert len(arr) == 1000
+        assert compute.calls == []
+        assert arr[250] == 250*250
+        assert compute.calls == [(200, 300)]
+        assert arr[-1] == 999*999
+        assert arr[210] == 210*210
+        assert compute.calls == [(200, 300), (900, 1000)]
+        assert arr.filled.count() == 2
+        assert arr.is_filled(2) and not arr.is_filled(3)
+        with pytest.raises(IndexError):
+            arr[1000]
+
+    def test_slices(self):
+        compute = Squares()
+        arr = mmaplazyarray('l', 1000, compute, block_size=100)
+        assert list(arr[95:105]) == [i*i for i in range(95, 105)]
+        assert compute.calls == [(0, 100), (100, 200)]
+        assert list(arr[450:250:-50]) == [i*i for i in range(450, 250, -50)]
+        assert compute.calls[2:] == [(200, 300), (300, 400), (400, 500)]
+        assert list(arr) == [i*i for i in range(1000)]
+        assert len(compute.calls) == 10
+
+    def test_last_block_and_values(self):
+        arr = mmaplazyarray('d', 25, lambda start, stop: [0.5]*(stop - start), block_size=10)
+        assert list(arr) == [0.5]*25
+        arr = mmaplazyarray('i', 25, lambda start, stop: mmaparray('i', range(start, stop)), 10)
+        assert arr[24] == 24
+        arr = mmaplazyarray('i', 25, lambda start, stop: [1], block_size=10)
+        with pytest.raises(ValueError):
+            arr[0]
+        assert not arr.is_filled(0)
+
+    def test_materialize(self):
+        compute = Squares()
+        arr = mmaplazyarray('l', 1000, compute, block_size=100)
+        arr[0]
+        assert arr.materialize(0, 500) == 4
+        assert arr.materialize(threads=4) == 5
+        assert arr.materialize() == 0
+        assert len(compute.calls) == 10
+        assert list(arr.array) == [i*i for i in range(1000)]
+
+    def test_precompute(self):
+        compute = Squares()
+        arr = mmaplazyarray('l', 1000, compute, block_size=100)
+        assert arr.precompute().result(timeout=10) == 10
+        assert arr.filled.count() == 10
+        assert arr[999] == 999*999
+        assert len(compute.calls) == 10
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork")
+    def test_shared_with_child(self):
+        compute = Squares()
+        arr = mmaplazyarray('l', 1000, compute, block_size=100)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                arr[500]
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+        assert arr.is_filled(5)
+        assert arr[500] == 500*500
+        assert compute.calls == []
+
+    def test_persistence(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        compute = Squares()
+        with mmaplazyarray('l', 1000, compute, block_size=100, path=path) as arr:
+            arr[150]
+            arr[999]
+        assert os.path.getsize(path) == 8000
+        compute = Squares()
+        with mmaplazyarray('l', 1000, compute, block_size=100, path=path) as arr:
+            assert arr[150] == 150*150
+            assert arr[999] == 999*999
+            assert compute.calls == []
+            assert list(arr) == [i*i for i in range(1000)]
+            assert len(compute.calls) == 8
+        with pytest.raises(ValueError):
+            mmaplazyarray('l', 10, compute, path=path)
+
+    def test_reopen_unclosed(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        compute = Squares()
+        arr = mmaplazyarray('l', 1000, compute, block_size=100, path=path)
+        arr[150]
+        # not closed, as after a crash the file keeps its preallocated size
+        assert os.path.getsize(path) > 8000
+        compute = Squares()
+        with mmaplazyarray('l', 1000, compute, block_size=100, path=path) as reopened:
+            assert reopened[150] == 150*150
+            assert compute.calls == []
+            assert reopened[999] == 999*999
+        assert os.path.getsize(path) == 8000
@@ -0,0 +1,120 @@
+import mmap
+import os
+
+import pytest
+
+from mmap_backed_array import mmapmemocache
+
+
+class TestMemoCache:
+
+    def test_get_put(self):
+        cache = mmapmemocache('qq', 'd', slots=64, ways=4)
+        assert cache.capacity == 64
+        assert cache.get((1, 2)) is None
+        assert cache.get((1, 2), -1.0) == -1.0
+        assert cache.put((1, 2), 3.5)
+        assert cache.get((1, 2)) == 3.5
+        assert (1, 2) in cache
+        assert (2, 1) not in cache
+        assert cache.put((1, 2), 4.5)
+        assert cache.get((1, 2)) == 4.5
+        assert len(cache) == 1
+
+    def test_formats(self):
+        cache = mmapmemocache('q', 'qd')
+        cache.put(5, (1, 2.5))
+        assert cache.get(5) == (1, 2.5)
+        assert cache.get((5,)) == (1, 2.5)
+        with pytest.raises(ValueError):
+            mmapmemocache('q' * 32, 'q')
+
+    def test_eviction(self):
+        cache = mmapmemocache('q', 'q', slots=64, ways=8)
+        for i in range(1000):
+            cache.put(i, i * i)
+        assert len(cache) == 64
+        stats = cache.stats()
+        assert stats['inserts'] == 1000
+        assert stats['evictions'] == 1000 - 64
+        hits = [i for i in range(1000) if i in cache]
+        assert len(hits) == 64
+        assert all(cache.get(i) == i * i for i in hits)
+
+    def test_clock_keeps_used_entries(self):
+        cache = mmapmemocache('q', 'q', slots=8, ways=8)
+        for i in range(8):
+            cache.put(i, i)
+        # a full round of the hand clears every reference flag and evicts 0
+        cache.put(100, 100)
+        assert 0 not in cache
+        # 1 was used since, so the next eviction passes it by
+        assert cache.get(1) == 1
+        cache.put(101, 101)
+        assert 1 in cache
+        assert 2 not in cache
+
+    def test_stats(self):
+        cache = mmapmemocache('q', 'q')
+        cache.get(1)
+        cache.put(1, 1)
+        cache.get(1)
+        assert cache.stats() == {'hits': 1, 'misses': 1, 'inserts': 1, 'evictions': 0}
+
+    def test_memoize(self):
+        cache = mmapmemocache('qq', 'q')
+        calls = []
+
+        @cache.memoize
+        def add(a, b):
+            calls.append((a, b))
+            return a + b
+        assert add(1, 2) == 3
+        assert add(1, 2) == 3
+        assert add(2, 2) == 4
+        assert calls == [(1, 2), (2, 2)]
+        assert add.cache is cache
+        assert add.__name__ == 'add'
+
+    def test_shared_mmap(self, tmpdir):
+        path = str(tmpdir.join('cache'))
+        size = 1 << 16
+        with open(path, 'wb') as f:
+            f.write(bytes(size))
+        with open(path, 'r+b') as f:
+            first = mmapmemocache('q', 'd', slots=256, mmap=mmap.mmap(f.fileno(), size))
+            first.put(7, 0.5)
+            second = mmapmemocache('q', 'd', mmap=mmap.mmap(f.fileno(), size))
+            assert second.capacity == 256
+            assert second.get(7) == 0.5
+            with pytest.raises(TypeError):
+                mmapmemocache('q', 'q', mmap=mmap.mmap(f.fileno(), size))
+        with pytest.raises(ValueError):
+            mmapmemocache('q', 'd', slots=1 << 20, mmap=mmap.mmap(-1, 4096))
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork")
+    def test_processes(self):
+        cache = mmapmemocache('q', 'qq', slots=256, ways=4)
+        children = []
+        for child in range(4):
+            pid = os.fork()
+            if pid == 0:
+                status = 1
+                try:
+                    for n in range(20000):
+                        key = (n * 7 + child) % 1000
+                        value = cache.get(key)
+                        if value is None:
+                            cache.put(key, (key, -key))
+                        elif value != (key, -key):
+                            break
+                    else:
+                        status = 0
+                finally:
+                    os._exit(status)
+            children.append(pid)
+        for pid in children:
+            assert os.waitpid(pid, 0)[1] == 0
+        stats = cache.stats()
+        assert stats['hits'] + stats['misses'] == 80000
+        assert stats['hits'] > 0
@@ -0,0 +1,46 @@
+import mmap
+import os
+import pytest
+
+from mmap_backed_array import mmaparray
+
+linux_only = pytest.mark.skipif(
+    not os.path.exists('/proc/self/smaps'), reason="needs mincore and /proc/self/smaps"
+)
+
+
+@linux_only
+class TestMemory:
+    """Test page residency and memory usage reporting"""
+
+    def test_residency(self):
+        page = mmap.PAGESIZE
+        arr = mmaparray('B', reserve=16*page)
+        arr._resize(16*page)
+        arr[0] = 1
+        arr[5*page + 10] = 1
+        pages = arr.residency()
+        assert len(pages) == 16
+        assert pages.count() == 2
+        assert pages[0] and pages[5]
+        pages = arr.residency(5*page - 1, 6*page)
+        assert len(pages) == 2
+        assert pages.tolist() == [False, True]
+        assert len(arr.residency(3, 3)) == 0
+
+    def test_residency_items(self):
+        page = mmap.PAGESIZE
+        arr = mmaparray('d', [1.0] * (page // 2))
+        assert len(arr.residency()) == 4
+        assert arr.residency().all()
+        assert len(arr.residency(page // 8, page // 8 + 1)) == 1
+
+    def test_memory_usage(self):
+        page = mmap.PAGESIZE
+        arr = mmaparray('B', reserve=64*page)
+        arr.frombytes(b'\x01' * (8*page))
+        usage = arr.memory_usage()
+        assert usage['rss'] >= 8*page
+        assert usage['rss'] < 64*page
+        assert usage['pss'] <= usage['rss']
+        assert usage['shared'] + usage['private'] == usage['rss']
@@ -207,3 +207,439 @@ class Test_mmaparray:
         assert test_mmap_array[0] == 0
         assert test_mmap_array[1] == 50
         assert test_mmap_array[2] == 2
+
+
+class TestReductions:
+    """Test the native reductions"""
+
+    def setup_class(cls):
+        from mmap_backed_array import mmaparray
+        cls.mmaparray = mmaparray
+
+    def test_sum(self):
+        arr = self.mmaparray('i', (3, -1, 4, 1, -5))
+        assert arr.sum() == 2
+        assert arr.sum(1, 3) == 3
+        assert arr.sum(-2) == -4
+        assert self.mmaparray('i').sum() == 0
+
+    def test_sum_does_not_overflow(self):
+        big = 2**63 - 1
+        arr = self.mmaparray('l', (big, big, big))
+        assert arr.sum() == 3*big
+        arr = self.mmaparray('l', (-big, -big, -big))
+        assert arr.sum() == -3*big
+        arr = self.mmaparray('L', (2**64 - 1, 2**64 - 1))
+        assert arr.sum() == 2*(2**64 - 1)
+
+    def test_float_sum(self):
+        arr = self.mmaparray('d', (1e100, 1.0, -1e100))
+        assert arr.sum() == 1.0
+        assert arr.mean() == 1.0/3
+
+    def test_min_max(self):
+        arr = self.mmaparray('h', (3, 1, 4, 1, 5, 9, 2, 6))
+        assert arr.min() == 1
+        assert arr.argmin() == 1
+        assert arr.max() == 9
+        assert arr.argmax() == 5
+        assert arr.argmin(2) == 3
+        assert arr.max(0, 5) == 5
+        with pytest.raises(ValueError):
+            arr.min(3, 3)
+        with pytest.raises(TypeError):
+            self.mmaparray('u', 'abc').max()
+
+    def test_argmin_nan(self):
+        arr = self.mmaparray('f', (2.0, float('nan'), 1.0))
+        assert arr.argmin() == 1
+        assert arr.argmax() == 1
+
+    def test_cumsum(self):
+        import array
+        arr = self.mmaparray('b', (100, 100, -50))
+        totals = arr.cumsum()
+        assert totals.typecode == 'l'
+        assert list(totals) == [100, 200, 150]
+
+        out = array.array('l', (0, 0))
+        assert arr.cumsum(out=out, start=1) is out
+        assert list(out) == [100, 50]
+
+        with pytest.raises(TypeError):
+            arr.cumsum(out=array.array('i', (0, 0, 0)))
+        with pytest.raises(ValueError):
+            arr.cumsum(out=array.array('l', (0,)))
+
+    def test_bincount(self):
+        arr = self.mmaparray('I', (1, 3, 1, 0))
+        assert list(arr.bincount()) == [1, 2, 0, 1]
+        assert list(arr.bincount(minlength=6)) == [1, 2, 0, 1, 0, 0]
+        with pytest.raises(ValueError):
+            self.mmaparray('i', (1, -1)).bincount()
+        with pytest.raises(TypeError):
+            self.mmaparray('d', (1.0,)).bincount()
+
+    def test_search_integral_values(self):
+        import decimal, fractions
+        arr = self.mmaparray('i', (1, 2, 2))
+        for value in (2.0, decimal.Decimal(2), fractions.Fraction(2)):
+            assert arr.count(value) == 2
+            assert arr.index(value) == 1
+        assert arr.count(2.5) == 0
+        assert arr.count(float('nan')) == 0
+        assert arr.count(2**70) == 0
+        with pytest.raises(ValueError):
+            arr.index(2.5)
+        assert self.mmaparray('d', (0.5, 2.0)).count(decimal.Decimal('0.5')) == 1
+
+    def test_histogram(self):
+        arr = self.mmaparray('d', (0.0, 0.5, 1.0, 2.5, 3.0, 7.0))
+        counts, edges = arr.histogram(3, value_range=(0, 3))
+        assert list(counts) == [2, 1, 2]
+        assert list(edges) == [0.0, 1.0, 2.0, 3.0]
+        counts, edges = arr.histogram(2)
+        assert list(counts) == [5, 1]
+        assert edges[0] == 0.0 and edges[-1] == 7.0
+
+
+class TestTakePut:
+    """Test batch gather/scatter"""
+
+    def setup_class(cls):
+        from mmap_backed_array import mmaparray
+        cls.mmaparray = mmaparray
+
+    def test_take(self):
+        import array
+        arr = self.mmaparray('d', (0.5, 1.5, 2.5, 3.5))
+        result = arr.take(array.array('I', (3, 0, 0)))
+        assert isinstance(result, self.mmaparray)
+        assert list(result) == [3.5, 0.5, 0.5]
+        assert list(arr.take(self.mmaparray('b', (-1, 1)))) == [3.5, 1.5]
+        assert list(arr.take(bytes((2, 1)))) == [2.5, 1.5]
+        assert list(arr.take([0, 1])) == [0.5, 1.5]
+
+    def test_take_out(self):
+        import array
+        arr = self.mmaparray('i', (10, 20, 30))
+        out = array.array('i', (0, 0))
+        assert arr.take([2, 1], out=out) is out
+        assert list(out) == [30, 20]
+        with pytest.raises(ValueError):
+            arr.take([2], out=out)
+        with pytest.raises(TypeError):
+            arr.take([2, 1], out=array.array('l', (0, 0)))
+
+    def test_take_modes(self):
+        import array
+        arr = self.mmaparray('h', (10, 20, 30))
+        with pytest.raises(IndexError):
+            arr.take([0, 3])
+        with pytest.raises(IndexError):
+            arr.take([-4])
+        assert list(arr.take([3, -4, 7], mode='wrap')) == [10, 30, 20]
+        assert list(arr.take([3, -4, 1], mode='clip')) == [30, 10, 20]
+        with pytest.raises(ValueError):
+            arr.take([0], mode='bogus')
+        with pytest.raises(TypeError):
+            arr.take(array.array('d', (1.0,)))
+
+    def test_put(self):
+        import array
+        arr = self.mmaparray('I', (0, 0, 0, 0))
+        arr.put(array.array('l', (3, -4)), (7, 8))
+        assert list(arr) == [8, 0, 0, 7]
+        arr.put([5, 6], self.mmaparray('I', (1, 2)), mode='wrap')
+        assert list(arr) == [8, 1, 2, 7]
+
+    def test_put_raise_writes_nothing(self):
+        arr = self.mmaparray('I', (0, 0, 0))
+        with pytest.raises(IndexError):
+            arr.put([0, 3], (1, 1))
+        assert list(arr) == [0, 0, 0]
+
+    def test_bad_index_from_iterator(self):
+        arr = self.mmaparray('h', (10, 20, 30))
+        with pytest.raises(IndexError, match='index 9 '):
+            arr.take(x for x in [0, 9])
+        with pytest.raises(IndexError, match='index -7 '):
+            arr.put(iter([1, -7]), (1, 1))
+        assert list(arr) == [10, 20, 30]
+
+
+class TestReserve:
+    """Test arrays in a reserved address range"""
+
+    def setup_class(cls):
+        from mmap_backed_array import mmaparray
+        cls.mmaparray = mmaparray
+
+    def test_growth_never_moves(self):
+        arr = self.mmaparray('l', range(10), reserve=1 << 20)
+        assert arr.reserved == 1 << 20
+        address = arr.buffer_info()[0]
+        arr.extend(range(100000))
+        for i in range(1000):
+            arr.append(i)
+        assert arr.buffer_info()[0] == address
+        assert len(arr) == 10 + 100000 + 1000
+        assert arr[9] == 9 and arr[10] == 0 and arr[-1] == 999
+        arr[5:] = self.mmaparray('l')
+        assert list(arr) == [0, 1, 2, 3, 4]
+        assert arr.buffer_info()[0] == address
+
+    def test_shrink_zeroes_tail(self):
+        arr = self.mmaparray('B', b'\xff' * 20000, reserve=1 << 16)
+        arr._resize(10)
+        arr._resize(20000)
+        assert arr.tobytes() == b'\xff' * 10 + b'\x00' * 19990
+        arr._resize(0)
+        arr._resize(5)
+        assert arr.tobytes() == b'\x00' * 5
+
+    def test_reserve_exhausted(self):
+        arr = self.mmaparray('I', reserve=4)
+        assert arr.reserved == mmap.PAGESIZE // 4
+        arr.extend([1] * arr.reserved)
+        with pytest.raises(MemoryError):
+            arr.append(2)
+        assert len(arr) == arr.reserved
+
+    def test_reserve_arguments(self):
+        assert self.mmaparray('I').reserved is None
+        with pytest.raises(ValueError):
+            self.mmaparray('I', reserve=0)
+        with pytest.raises(TypeError):
+            self.mmaparray('I', reserve=10, mmap=mmap.mmap(-1, 10))
+
+
+class TestOpen:
+    """Test arrays in preallocated files"""
+
+    def setup_class(cls):
+        from mmap_backed_array import mmaparray
+        cls.mmaparray = mmaparray
+
+    def test_growth_in_chunks(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        growth = mmap.ALLOCATIONGRANULARITY
+        with self.mmaparray.open('I', path, growth=growth) as arr:
+            assert len(arr) == 0
+            assert os.path.getsize(path) == growth
+            arr.extend(range(growth // 4 + 1))
+            assert os.path.getsize(path) == 2 * growth
+            address = arr.buffer_info()[0]
+            arr.append(7)
+            assert arr.buffer_info()[0] == address
+            assert arr[-1] == 7
+        assert os.path.getsize(path) == (growth // 4 + 2) * 4
+        with self.mmaparray.open('I', path, growth=growth) as arr:
+            assert len(arr) == growth // 4 + 2
+            assert arr[growth // 4] == growth // 4
+            arr.pop()
+        assert os.path.getsize(path) == (growth // 4 + 1) * 4
+
+    def test_shrink_zeroes_tail(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        growth = mmap.ALLOCATIONGRANULARITY
+        with self.mmaparray.open('B', path, growth=growth) as arr:
+            arr.frombytes(b'\xff' * (3 * growth))
+            arr._resize(10)
+            assert os.path.getsize(path) == growth
+            arr._resize(3 * growth)
+            assert arr.tobytes() == b'\xff' * 10 + b'\x00' * (3 * growth - 10)
+
+    def test_no_trim(self, tmpdir):
+        path = str(tmpdir.join('table.dat'))
+        growth = mmap.ALLOCATIONGRANULARITY
+        with self.mmaparray.open('B', path, growth=growth, trim=False) as arr:
+            arr.append(1)
+        assert os.path.getsize(path) == growth
+
+    def test_no_space(self, tmpdir, monkeypatch):
+        import errno
+        def no_space(fd, offset, size):
+            raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+        path = str(tmpdir.join('table.dat'))
+        growth = mmap.ALLOCATIONGRANULARITY
+        with self.mmaparray.open('B', path, growth=growth) as arr:
+            arr.append(1)
+            monkeypatch.setattr(os, 'posix_fallocate', no_space)
+            with pytest.raises(OSError) as excinfo:
+                arr.frombytes(bytes(growth))
+            assert excinfo.value.errno == errno.ENOSPC
+            assert excinfo.value.filename == path
+            assert arr.tolist() == [1]
+
+
+class TestFillCopy:
+    """Test filling and copying ranges in place"""
+
+    def setup_class(cls):
+        from mmap_backed_array import mmaparray
+        cls.mmaparray = mmaparray
+
+    def test_fill(self):
+        arr = self.mmaparray('i', range(10))
+        arr.fill(0, 2, 5)
+        assert list(arr) == [0, 1, 0, 0, 0, 5, 6, 7, 8, 9]
+        arr.fill(-1, -3)
+        assert list(arr[-4:]) == [6, -1, -1, -1]
+        arr.fill(258)
+        assert list(arr) == [258] * 10
+        floats = self.mmaparray('d', [0.0] * 5)
+        floats.fill(1.5, stop=2)
+        assert list(floats) == [1.5, 1.5, 0.0, 0.0, 0.0]
+        chars = self.mmaparray('c', b'abc')
+        chars.fill(b'z', 1)
+        assert chars.tobytes() == b'azz'
+        with pytest.raises(OverflowError):
+            self.mmaparray('B', [1]).fill(256)
+
+    def test_fill_threads(self):
+        from mmap_backed_array import parallel
+        threshold = parallel.get_threshold()
+        parallel.set_threshold(3)
+        try:
+            arr = self.mmaparray('H', range(100))
+            arr.fill(7, 10, 90, threads=4)
+            assert list(arr) == list(range(10)) + [7] * 80 + list(range(90, 100))
+        finally:
+            parallel.set_threshold(threshold)
+
+    def test_copy_within(self):
+        arr = self.mmaparray('h', range(8))
+        arr.copy_within(0, 3, 6)
+        assert list(arr) == [3, 4, 5, 3, 4, 5, 6, 7]
+        arr.copy_within(2, 0)
+        assert list(arr) == [3, 4, 3, 4, 5, 3, 4, 5]
+        arr.copy_within(-1, 0)
+        assert arr[-1] == 3
+        with pytest.raises(IndexError):
+            arr.copy_within(9, 0)
+
+    def test_copy_from(self):
+        import array
+        arr = self.mmaparray('l', [0] * 6)
+        arr.copy_from(self.mmaparray('l', [1, 2, 3]), 2)
+        assert list(arr) == [0, 0, 1, 2, 3, 0]
+        arr.copy_from(array.array('l', range(10, 20)), 0, (4, 6))
+        assert list(arr) == [14, 15, 1, 2, 3, 0]
+        arr.copy_from(arr, 3, slice(0, 3))
+        assert list(arr) == [14, 15, 1, 14, 15, 1]
+        with pytest.raises(ValueError):
+            arr.copy_from(self.mmaparray('l', [1, 2]), 5)
+        with pytest.raises(TypeError):
+            arr.copy_from(self.mmaparray('i', [1]))
+        with pytest.raises(ValueError):
+            arr.copy_from(arr, 0, slice(0, 4, 2))
+
+
+class TestExtendedSlices:
+    """Test strided reads, writes and deletes"""
+
+    def setup_class(cls):
+        from mmap_backed_array import mmaparray
+        cls.mmaparray = mmaparray
+
+    def test_get(self):
+        import array
+        data = list(range(20))
+        arr = self.mmaparray('l', data)
+        for index in (slice(None, None, 3), slice(1, None, 2), slice(None, None, -1),
+                      slice(15, 2, -4), slice(5, 5, 2), slice(-3, None, 7)):
+            result = arr[index]
+            assert isinstance(result, array.array)
+            assert result.tolist() == data[index]
+
+    def test_set(self):
+        import array
+        data = list(range(20))
+        arr = self.mmaparray('i', data)
+        arr[1::3] = array.array('i', [-1] * len(data[1::3]))
+        data[1::3] = [-1] * len(data[1::3])
+        assert list(arr) == data
+        arr[::-2] = self.mmaparray('i', range(100, 110))
+        data[::-2] = range(100, 110)
+        assert list(arr) == data
+        arr[::-1] = arr
+        assert list(arr) == data[::-1]
+        with pytest.raises(ValueError):
+            arr[::2] = array.array('i', [1])
+
+    def test_interleaved_column(self):
+        arr = self.mmaparray('d', [float(i) for i in range(30)])
+        assert arr[1::3].tolist() == [float(i) for i in range(1, 30, 3)]
+
+    def test_delete(self):
+        for index in (slice(None, None, 3), slice(1, 17, 4), slice(None, None, -2),
+                      slice(2, 9), slice(18, 3, -5), slice(5, 5), slice(None, None, 25),
+                      0, -1, 7):
+            data = list(range(20))
+            arr = self.mmaparray('H', data)
+            del arr[index]
+            del data[index]
+            assert list(arr) == data
+        with pytest.raises(IndexError):
+            del arr[30]
+
+
+class TestCopyPaths:
+    """Test slice assignment and extend copy straight from the source"""
+
+    def setup_class(cls):
+        from mmap_backed_array import mmaparray
+        cls.mmaparray = mmaparray
+
+    def test_assign_self(self):
+        for start, stop in ((0, 0), (2, 5), (0, 6), (6, 6), (3, 4), (0, 1), (1, 6)):
+            data = list(range(6))
+            arr = self.mmaparray('i', data)
+            arr[start:stop] = arr
+            data[start:stop] = data[:]
+            assert list(arr) == data
+
+    def test_extend_self(self):
+        arr = self.mmaparray('d', [1.5, 2.5])
+        arr.extend(arr)
+        arr += arr
+        assert list(arr) == [1.5, 2.5] * 4
+
+    def test_shared_mmap(self):
+        import mmap
+        backing = mmap.mmap(-1, 16)
+        a = self.mmaparray('I', mmap=backing)
+        b = self.mmaparray('I', mmap=backing)
+        a[:] = self.mmaparray('I', [1, 2, 3, 4])
+        a.extend(b)
+        assert list(a) == [1, 2, 3, 4] * 2
+        c = self.mmaparray('I', mmap=backing)
+        a[0:1] = c
+        assert list(a)[:9] == [1, 2, 3, 4, 1, 2, 3, 4, 2]
+
+    def test_peak_memory(self):
+        resource = pytest.importorskip('resource')
+        import subprocess
+        import sys
+        script = '\n'.join([
+            "import resource",
+            "from mmap_backed_array import mmaparray",
+            "n = 32 << 20",
+            "arr = mmaparray('B')",
+            "arr._resize(n)",
+            "arr.fill(1)",
+            "base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss",
+            "arr.extend(arr)",
+            "arr[n:n] = arr",
+            "arr[:] = mmaparray('B', arr)",
+            "peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss",
+            "print((peak - base) * 1024 // n)",
+        ])
+        package_root = os.path.dirname(os.path.dirname(mmap_backed_array.__file__))
+        env = dict(os.environ, PYTHONPATH=package_root)
+        output = subprocess.check_output([sys.executable, '-c', script], env=env)
+        # the array grows from n to 4n bytes and the last assignment needs a
+        # second 4n array, so 7n more at the peak. An intermediate bytes copy
+        # in the last assignment alone would add another 4n.
+        assert int(output) < 9
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from mmap_backed_array import mmaparray, mmapnotifier, mmapversionedarray
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def notify_later(notifier, delay=0.05):
+    thread = threading.Timer(delay, notifier.notify)
+    thread.start()
+    return thread
+
+
+class TestNotifier:
+
+    def test_notify(self):
+        notifier = mmapnotifier()
+        assert notifier.generation == 0
+        assert notifier.notify() == 1
+        assert notifier.wait_for_change(timeout=0) == 1
+        assert notifier.wait_for_change(timeout=0) is None
+        assert notifier.wait_for_change(since=0) == 1
+
+    def test_timeout(self):
+        notifier = mmapnotifier()
+        start = time.monotonic()
+        assert notifier.wait_for_change(timeout=0.05) is None
+        assert time.monotonic() - start >= 0.05
+
+    def test_wait_in_thread(self):
+        notifier = mmapnotifier()
+        thread = notify_later(notifier)
+        assert notifier.wait_for_change(timeout=10) == 1
+        thread.join()
+
+    def test_shared_mmap(self):
+        arr = mmaparray('L', [0] * 4)
+        first = mmapnotifier(arr._mmap, offset=8)
+        second = mmapnotifier(arr._mmap, offset=8)
+        first.notify()
+        assert second.wait_for_change(timeout=0) == 1
+        assert list(arr) == [0, 1, 0, 0]
+        with pytest.raises(ValueError):
+            mmapnotifier(arr._mmap, offset=4)
+        with pytest.raises(ValueError):
+            mmapnotifier(arr._mmap, offset=24)
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork")
+    def test_other_process(self):
+        notifier = mmapnotifier()
+        shared = mmaparray('l', [0])
+        pid = os.fork()
+        if pid == 0:
+            try:
+                time.sleep(0.05)
+                shared[0] = 42
+                notifier.notify()
+            finally:
+                os._exit(0)
+        assert notifier.wait_for_change(timeout=10) == 1
+        assert shared[0] == 42
+        os.waitpid(pid, 0)
+
+    def test_await_change(self):
+        notifier = mmapnotifier()
+        thread = notify_later(notifier)
+        assert run(notifier.await_change(timeout=10)) == 1
+        thread.join()
+        assert run(notifier.await_change(timeout=0.01)) is None
+
+
+class TestVersionedNotification:
+
+    def test_wait_for_version(self, tmpdir):
+        path = str(tmpdir.join('table'))
+        mmapversionedarray.publish(path, mmaparray('i', [1]))
+        table = mmapversionedarray(path)
+        assert not table.wait_for_change(timeout=0.01)
+        thread = threading.Timer(
+            0.05, mmapversionedarray.publish, (path, mmaparray('i', [2]))
+        )
+        thread.start()
+        assert table.wait_for_change(timeout=10)
+        thread.join()
+        assert table.generation == 2
+        assert list(table.array) == [2]
+        mmapversionedarray.publish(path, mmaparray('i', [3]))
+        assert run(table.await_change(timeout=10))
+        assert list(table) == [3]
+        table.close()
@@ -0,0 +1,90 @@
+import mmap
+import pytest
+
+from mmap_backed_array import mmaparray
+
+
+class TestArrayInterface:
+    """Test the array interface, which doesn't need NumPy"""
+
+    def test_interface(self):
+        arr = mmaparray('i', [1, 2, 3])
+        interface = arr.__array_interface__
+        assert interface['shape'] == (3,)
+        assert interface['typestr'][1:] == 'i4'
+        assert interface['version'] == 3
+        assert memoryview(interface['data']).nbytes >= 12
+        assert mmaparray('B').__array_interface__['typestr'] == '|u1'
+        assert mmaparray('d').__array_interface__['typestr'][1:] == 'f8'
+
+
+class TestNumpy:
+    """Test conversions to and from NumPy arrays"""
+
+    def setup_class(cls):
+        cls.numpy = pytest.importorskip('numpy')
+
+    def test_to_numpy_is_a_view(self):
+        arr = mmaparray('l', range(10))
+        view = arr.to_numpy()
+        assert view.dtype == self.numpy.dtype('int64')
+        assert view.tolist() == list(range(10))
+        view[3] = 42
+        assert arr[3] == 42
+        arr[4] = -1
+        assert view[4] == -1
+        assert int(view.sum()) == arr.sum()
+
+    def test_resize_with_view(self):
+        arr = mmaparray('H', [1, 2])
+        view = arr.to_numpy()
+        with pytest.raises(BufferError):
+            arr.append(3)
+        del view
+        arr.append(3)
+        assert list(arr) == [1, 2, 3]
+
+    def test_asarray(self):
+        arr = mmaparray('f', [1.5, 2.5])
+        converted = self.numpy.asarray(arr)
+        assert converted.dtype == self.numpy.float32
+        converted[0] = 0.5
+        assert arr[0] == 0.5
+        assert self.numpy.array(arr, dtype='d').tolist() == [0.5, 2.5]
+
+    def test_array_copy_false(self):
+        arr = mmaparray('f', [1.5, 2.5])
+        view = arr.__array__(copy=False)
+        view[0] = 0.5
+        assert arr[0] == 0.5
+        assert arr.__array__('f', copy=False).dtype == self.numpy.float32
+        with pytest.raises(ValueError):
+            arr.__array__('d', copy=False)
+        copied = arr.__array__('d', copy=True)
+        copied[0] = 3.5
+        assert arr[0] == 0.5
+
+    def test_from_numpy(self):
+        numpy = self.numpy
+        source = numpy.arange(12, dtype=numpy.int32).reshape(3, 4)
+        arr = mmaparray.from_numpy(source)
+        assert arr.typecode == 'i'
+        assert list(arr) == list(range(12))
+        swapped = mmaparray.from_numpy(numpy.arange(3, dtype='>u2'))
+        assert swapped.typecode == 'H'
+        assert list(swapped) == [0, 1, 2]
+        strided = mmaparray.from_numpy(numpy.arange(10.0)[::3])
+        assert list(strided) == [0.0, 3.0, 6.0, 9.0]
+        with pytest.raises(TypeError):
+            mmaparray.from_numpy(numpy.zeros(2, dtype=numpy.complex128))
+
+    def test_from_numpy_into_mmap(self, tmpdir):
+        numpy = self.numpy
+        path = str(tmpdir.join('table.dat'))
+        with open(path, 'wb') as f:
+            f.write(b'\x00')
+        with open(path, 'r+b') as f:
+            backing = mmap.mmap(f.fileno(), 0)
+            arr = mmaparray.from_numpy(numpy.arange(5, dtype=numpy.float64), mmap=backing)
+            assert len(arr) == 5
+            assert arr.to_numpy().tolist() == [0.0, 1.0, 2.0, 3.0, 4.0]
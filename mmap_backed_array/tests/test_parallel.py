@@ -0,0 +1,143 @@
+import array
+import pytest
+
+from mmap_backed_array import mmaparray, parallel
+
+
+@pytest.fixture
+def small_partitions():
+    """Split even small operations across threads"""
+    threads, threshold = parallel.get_threads(), parallel.get_threshold()
+    parallel.set_threads(4)
+    parallel.set_threshold(3)
+    yield
+    parallel.set_threads(threads)
+    parallel.set_threshold(threshold)
+
+
+class TestPartition:
+
+    def test_partition(self):
+        threshold = parallel.get_threshold()
+        try:
+            parallel.set_threshold(10)
+            assert parallel.partition(15, threads=4) == [(0, 15)]
+            assert parallel.partition(40, threads=4) == [(0, 10), (10, 20), (20, 30), (30, 40)]
+            assert parallel.partition(41, threads=2) == [(0, 20), (20, 41)]
+            assert parallel.partition(1000, threads=1) == [(0, 1000)]
+            assert parallel.partition(0) == [(0, 0)]
+        finally:
+            parallel.set_threshold(threshold)
+
+    def test_settings(self):
+        threads = parallel.get_threads()
+        try:
+            parallel.set_threads(None)
+            assert parallel.get_threads() >= 1
+            with pytest.raises(ValueError):
+                parallel.set_threads(0)
+            with pytest.raises(ValueError):
+                parallel.set_threshold(0)
+        finally:
+            parallel.set_threads(threads)
+
+    def test_run_keeps_order(self):
+        results = parallel.run(100, lambda begin, end: (begin, end), threads=4)
+        assert results[0][0] == 0 and results[-1][1] == 100
+
+    def test_growing_pool_keeps_old_pool_usable(self):
+        import threading
+        pool = parallel._get_pool(2)
+        bigger = parallel._get_pool(parallel._pool_threads + 1)
+        assert bigger is not pool
+        # a thread that got the old pool before it was replaced can still use it
+        assert pool.submit(sum, (1, 2)).result() == 3
+        assert parallel._get_pool(2) is bigger
+
+        errors = []
+        arr = mmaparray('i', range(1000))
+
+        def work(threads):
+            try:
+                for _ in range(20):
+                    assert arr.sum(threads=threads) == 499500
+            except Exception as e:
+                errors.append(e)
+        threshold = parallel.get_threshold()
+        parallel.set_threshold(10)
+        try:
+            workers = [threading.Thread(target=work, args=(n,)) for n in range(2, 12)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            parallel.set_threshold(threshold)
+        assert errors == []
+
+
+@pytest.mark.usefixtures('small_partitions')
+class TestParallelOperations:
+    """The partitioned operations must give the same results as serial ones"""
+
+    values = [3, -1, 4, 1, -5, 9, 2, -6, 5, 3, -5, 8, 9, -7, 9, 3, 2, -3]
+
+    def test_reductions(self):
+        arr = mmaparray('i', self.values)
+        assert arr.sum() == sum(self.values)
+        assert arr.sum(threads=1) == sum(self.values)
+        assert arr.min() == min(self.values)
+        assert arr.argmin() == self.values.index(min(self.values))
+        assert arr.argmax() == self.values.index(max(self.values))
+        assert arr.mean(2, 14) == sum(self.values[2:14]) / 12
+        floats = mmaparray('d', [float(v) for v in self.values])
+        assert floats.sum() == float(sum(self.values))
+
+    def test_cumsum(self):
+        arr = mmaparray('h', self.values)
+        expected = []
+        total = 0
+        for value in self.values:
+            total += value
+            expected.append(total)
+        assert list(arr.cumsum()) == expected
+        assert list(mmaparray('f', self.values).cumsum()) == expected
+
+    def test_cumsum_wraps(self):
+        arr = mmaparray('L', [2**63] * 8)
+        assert list(arr.cumsum()) == [(2**63 * (i + 1)) % 2**64 for i in range(8)]
+
+    def test_counts(self):
+        arr = mmaparray('B', [v + 7 for v in self.values])
+        counts = arr.bincount()
+        for value in range(len(counts)):
+            assert counts[value] == self.values.count(value - 7)
+        counts, _ = arr.histogram(4)
+        assert sum(counts) == len(self.values)
+
+    def test_take(self):
+        arr = mmaparray('d', range(10))
+        indices = array.array('l', [9, 0, 5, 5, 2, 1, 3, 8, 7, 6])
+        assert list(arr.take(indices)) == list(indices)
+        with pytest.raises(IndexError) as excinfo:
+            arr.take(array.array('l', [0, 1, 2, 3, 4, 5, 6, 10, 11]))
+        assert 'index 10 ' in str(excinfo.value)
+
+    def test_search(self):
+        arr = mmaparray('i', self.values)
+        assert arr.count(9) == 3
+        assert arr.count(9.5) == 0
+        assert arr.index(-5) == 4
+        assert arr.index(-3) == len(self.values) - 1
+        with pytest.raises(ValueError):
+            arr.index(100)
+        floats = mmaparray('f', (1.5, 0.1))
+        assert floats.count(0.1) == 0
+        assert floats.index(1.5) == 0
+
+    def test_byteswap(self):
+        arr = mmaparray('i', self.values)
+        expected = array.array('i', self.values)
+        arr.byteswap()
+        expected.byteswap()
+        assert arr.tobytes() == expected.tobytes()
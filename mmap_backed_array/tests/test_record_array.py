@@ -0,0 +1,90 @@
+import mmap
+import struct
+import pytest
+
+from mmap_backed_array import mmaprecordarray, ffi, stats
+
+
+class TestRecordArray:
+    """Test arrays of fixed width records"""
+
+    fields = [('id', 'L'), ('timestamp', 'd'), ('value', 'i')]
+
+    def test_create_and_index(self):
+        records = mmaprecordarray(self.fields, [(1, 0.5, -3), (2, 1.5, 4)])
+        assert len(records) == 2
+        assert records.itemsize == struct.calcsize('@Ldi0L')
+        assert records[0] == (1, 0.5, -3)
+        assert records[-1].value == 4
+        assert records[0:2] == [(1, 0.5, -3), (2, 1.5, 4)]
+        with pytest.raises(IndexError):
+            records[2]
+
+    def test_set_and_append(self):
+        records = mmaprecordarray(self.fields)
+        records.append((7, 2.0, 1))
+        records.append({'id': 8})
+        assert records[1] == (8, 0.0, 0)
+        records[1] = {'value': 5}
+        assert records[1] == (8, 0.0, 5)
+        with pytest.raises(ValueError):
+            records.append((1, 2.0))
+        with pytest.raises(ValueError):
+            records.append({'bogus': 1})
+        with pytest.raises(TypeError):
+            records.append(('x', 1.0, 1))
+        assert len(records) == 2
+
+    def test_bulk_extend(self):
+        records = mmaprecordarray(self.fields, [(1, 0.5, 1)])
+        records.extend([(2, 1.5, 2), (3, 2.5, 3)])
+        records.extend(records)
+        assert [r.id for r in records] == [1, 2, 3, 1, 2, 3]
+        copy = mmaprecordarray(self.fields)
+        copy.frombytes(records.tobytes())
+        assert copy.tolist() == records.tolist()
+        with pytest.raises(ValueError):
+            copy.frombytes(b'\x00')
+
+    def test_extend_from_records(self):
+        source = mmaprecordarray(self.fields, [(1, 0.5, 1), (2, 1.5, 2)])
+        records = mmaprecordarray(self.fields, [(3, 2.5, 3)])
+        with stats.measure() as counts:
+            records.extend(source)
+        assert counts['copies'] == 1
+        assert counts['bytes_copied'] == len(source.tobytes())
+        assert [r.id for r in records] == [3, 1, 2]
+
+    def test_column_views(self):
+        records = mmaprecordarray(self.fields, [(1, 0.5, 10), (2, 1.5, 20)])
+        column = records['value']
+        assert column.tolist() == [10, 20]
+        column[1] = 25
+        assert records[1].value == 25
+        assert list(records.column('id').copy()) == [1, 2]
+        with pytest.raises(KeyError):
+            records.column('bogus')
+
+    def test_layout_matches_c_struct(self):
+        records = mmaprecordarray([('a', 'b'), ('b', 'i')], [(1, 2)])
+        assert records.itemsize == 8
+        assert records.tobytes() == struct.pack('@bi', 1, 2)
+
+    def test_cffi_struct(self):
+        ffi.cdef("struct test_point { int x; int y; };")
+        points = mmaprecordarray('struct test_point', [(1, 2), (3, 4)])
+        assert points.fields == (('x', 'i'), ('y', 'i'))
+        assert points['y'].tolist() == [2, 4]
+
+    def test_mmap_backing(self, tmpdir):
+        path = str(tmpdir.join('records.dat'))
+        with open(path, 'wb') as f:
+            f.write(struct.pack('@ii', 1, 2) * 3 + b'\x00')
+        with open(path, 'r+b') as f:
+            backing = mmap.mmap(f.fileno(), 0)
+            records = mmaprecordarray([('x', 'i'), ('y', 'i')], mmap=backing)
+            assert len(records) == 3
+            assert records[2] == (1, 2)
+            records.append((5, 6))
+            assert records[3] == (5, 6)
+            backing.close()
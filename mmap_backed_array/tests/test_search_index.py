@@ -0,0 +1,127 @@
+import array
+import bisect
+import random
+from decimal import Decimal
+from fractions import Fraction
+
+import pytest
+
+from mmap_backed_array import mmaparray, mmapsearchindex, parallel
+
+
+def sorted_array(typecode, n, seed=0):
+    rng = random.Random(seed)
+    if typecode in 'fd':
+        return mmaparray(typecode, sorted(rng.uniform(-100, 100) for _ in range(n)))
+    return mmaparray(typecode, sorted(rng.randrange(-10**6, 10**6) for _ in range(n)))
+
+
+LAYOUTS = [('eytzinger', None), ('sparse', None), ('sparse', 1), ('sparse', 7)]
+
+
+class TestSearchIndex:
+
+    @pytest.mark.parametrize('layout,stride', LAYOUTS)
+    @pytest.mark.parametrize('n', [0, 1, 2, 3, 31, 32, 33, 1000])
+    def test_lookup_many(self, layout, stride, n):
+        arr = sorted_array('l', n)
+        items = list(arr)
+        rng = random.Random(n)
+        keys = [rng.choice(items) for _ in range(100)] if items else []
+        keys += [rng.randrange(-2*10**6, 2*10**6) for _ in range(100)]
+        index = mmapsearchindex(arr, layout, stride)
+        result = index.lookup_many(keys)
+        assert result.typecode == 'L'
+        assert list(result) == [bisect.bisect_left(items, key) for key in keys]
+
+    @pytest.mark.parametrize('layout,stride', LAYOUTS)
+    def test_duplicates_and_floats(self, layout, stride):
+        arr = mmaparray('d', [0.5, 1.5, 1.5, 1.5, 2.5, 2.5, 7.0])
+        index = mmapsearchindex(arr, layout, stride)
+        keys = [-1.0, 0.5, 1.0, 1.5, 2.0, 2.5, 7.0, 8.0]
+        assert list(index.lookup_many(keys)) == [0, 0, 1, 1, 4, 4, 6, 7]
+        assert index.lookup(2.5) == 4
+
+    @pytest.mark.parametrize('layout,stride', LAYOUTS)
+    def test_lookup_other_keys(self, layout, stride):
+        items = list(range(0, 100, 3))
+        index = mmapsearchindex(mmaparray('b', items), layout, stride)
+        for key in (2.5, 3.0, -0.5, 99.5, Fraction(7, 2), Decimal('4.5'), 1000, -1000, 2**70):
+            assert index.lookup(key) == bisect.bisect_left(items, key)
+
+    @pytest.mark.parametrize('layout,stride', LAYOUTS)
+    def test_lookup_rounded_keys(self, layout, stride):
+        floats = mmaparray('f', [0.1, 0.7, 0.9])
+        index = mmapsearchindex(floats, layout, stride)
+        keys = [0.1, 0.7, 0.9, 0.5, 1.0]
+        assert index.lookup(0.7) == bisect.bisect_left(floats, 0.7) == 2
+        assert list(index.lookup_many(keys)) == [bisect.bisect_left(floats, k) for k in keys]
+        doubles = mmaparray('d', [2.0**53, 2.0**53 + 2])
+        index = mmapsearchindex(doubles, layout, stride)
+        assert index.lookup(2**53 + 1) == 1
+        assert list(index.lookup_many([2**53, 2**53 + 1, 2.5, 2**53 + 2])) == [0, 1, 0, 1]
+
+    @pytest.mark.parametrize('typecode', 'bBhHiIlLfd')
+    def test_typecodes(self, typecode):
+        arr = mmaparray(typecode, range(0, 100, 3))
+        keys = array.array(typecode, range(0, 100))
+        for layout, stride in LAYOUTS:
+            index = mmapsearchindex(arr, layout, stride)
+            assert list(index.lookup_many(keys)) == \
+                [bisect.bisect_left(list(arr), key) for key in keys]
+
+    def test_threads_and_out(self):
+        threshold = parallel.get_threshold()
+        parallel.set_threshold(100)
+        try:
+            arr = sorted_array('i', 5000)
+            keys = sorted_array('i', 3000, seed=1)
+            out = mmaparray('L', [0] * 3000)
+            for layout, stride in LAYOUTS:
+                index = mmapsearchindex(arr, layout, stride)
+                assert index.lookup_many(keys, out=out, threads=4) is out
+                assert out == index.lookup_many(keys, threads=1)
+            with pytest.raises(TypeError):
+                index.lookup_many(keys, out=mmaparray('L', [0]))
+        finally:
+            parallel.set_threshold(threshold)
+
+    def test_from_arrays(self):
+        arr = sorted_array('l', 1000)
+        keys = sorted_array('l', 100, seed=2)
+        for layout, stride in LAYOUTS:
+            index = mmapsearchindex(arr, layout, stride)
+            arrays = {name: mmaparray(a.typecode, a) for name, a in index.arrays.items()}
+            reopened = mmapsearchindex.from_arrays(arr, layout, arrays, index.stride)
+            assert reopened.lookup_many(keys) == index.lookup_many(keys)
+        with pytest.raises(ValueError):
+            mmapsearchindex.from_arrays(arr, 'eytzinger', {'samples': arr})
+        with pytest.raises(TypeError):
+            mmapsearchindex.from_arrays(arr, 'sparse', {'samples': arr})
+        index = mmapsearchindex(arr, 'eytzinger')
+        with pytest.raises(ValueError):
+            mmapsearchindex.from_arrays(arr[:500], 'eytzinger', index.arrays)
+        with pytest.raises(ValueError):
+            mmapsearchindex.from_arrays(arr, 'sparse', {'samples': arr[::10]}, 5)
+
+    @pytest.mark.parametrize('layout,stride', LAYOUTS)
+    def test_array_length_changed(self, layout, stride):
+        arr = sorted_array('l', 100)
+        index = mmapsearchindex(arr, layout, stride)
+        arr.extend(range(10**7, 10**7 + 10000))
+        assert len(index) == 100
+        with pytest.raises(ValueError):
+            index.lookup_many([10**7 + 5000])
+        del arr[100:]
+        assert index.lookup(arr[50]) == 50
+
+    def test_errors(self):
+        with pytest.raises(ValueError):
+            mmapsearchindex(mmaparray('i', [2, 1]))
+        for items in ([1.0, float('nan'), 2.0], [float('nan'), 1.0, 2.0]):
+            with pytest.raises(ValueError):
+                mmapsearchindex(mmaparray('d', items))
+        with pytest.raises(ValueError):
+            mmapsearchindex(mmaparray('i', [1, 2]), 'btree')
+        with pytest.raises(TypeError):
+            mmapsearchindex(mmaparray('u', 'ab'))
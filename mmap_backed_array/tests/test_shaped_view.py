@@ -0,0 +1,93 @@
+import array
+import pytest
+
+from mmap_backed_array import mmaparray, shapedview
+
+
+class TestShapedView:
+    """Test multi-dimensional views of mmaparrays"""
+
+    def test_reshape(self):
+        arr = mmaparray('i', range(12))
+        view = arr.reshape(3, 4)
+        assert view.shape == (3, 4)
+        assert view.strides == (4, 1)
+        assert arr.reshape((3, -1)).shape == (3, 4)
+        assert arr.reshape(2, 3, -1).shape == (2, 3, 2)
+        with pytest.raises(ValueError):
+            arr.reshape(5, -1)
+        with pytest.raises(ValueError):
+            arr.reshape(-1, -1)
+        with pytest.raises(ValueError):
+            shapedview(arr, (4, 4))
+
+    def test_indexing(self):
+        view = mmaparray('i', range(12)).reshape(3, 4)
+        assert view[1, 2] == 6
+        assert view[-1, -1] == 11
+        assert view[1].tolist() == [4, 5, 6, 7]
+        assert view[:, 2].tolist() == [2, 6, 10]
+        assert view[::2, 1::2].tolist() == [[1, 3], [9, 11]]
+        assert view[::-1, 0].tolist() == [8, 4, 0]
+        with pytest.raises(IndexError):
+            view[3, 0]
+        with pytest.raises(IndexError):
+            view[0, 0, 0]
+
+    def test_transpose(self):
+        view = mmaparray('h', range(6)).reshape(2, 3)
+        assert view.T.shape == (3, 2)
+        assert view.T.tolist() == [[0, 3], [1, 4], [2, 5]]
+        cube = mmaparray('h', range(24)).reshape(2, 3, 4)
+        assert cube.transpose(1, 0, 2)[2, 1, 3] == cube[1, 2, 3]
+        with pytest.raises(ValueError):
+            cube.transpose(0, 0, 1)
+
+    def test_writes_share_memory(self):
+        arr = mmaparray('d', [0.0]*6)
+        view = arr.reshape(2, 3)
+        view[1, 1] = 2.5
+        assert arr[4] == 2.5
+        view[:, 0] = array.array('d', (1.0, 4.0))
+        assert arr[0] == 1.0 and arr[3] == 4.0
+        view.T[2] = mmaparray('d', (3.0, 6.0))
+        assert list(arr) == [1.0, 0.0, 3.0, 4.0, 2.5, 6.0]
+        with pytest.raises(ValueError):
+            view[0] = array.array('d', (1.0,))
+        with pytest.raises(TypeError):
+            view[0] = array.array('f', (1.0, 2.0, 3.0))
+
+    def test_copy_and_bytes(self):
+        arr = mmaparray('I', range(6))
+        view = arr.reshape(2, 3)
+        column = view[:, 1].copy()
+        assert isinstance(column, mmaparray)
+        assert list(column) == [1, 4]
+        assert view.tobytes() == arr.tobytes()
+        assert view.T.tobytes() == array.array('I', (0, 3, 1, 4, 2, 5)).tobytes()
+
+    def test_buffer(self):
+        view = mmaparray('i', range(6)).reshape(2, 3)
+        buf = view.buffer()
+        assert buf.shape == (2, 3)
+        assert buf.format == 'i'
+        assert buf.tolist() == [[0, 1, 2], [3, 4, 5]]
+        assert view[1:].buffer().tolist() == [[3, 4, 5]]
+        with pytest.raises(ValueError):
+            view.T.buffer()
+
+    def test_empty_buffer(self):
+        view = mmaparray('i').reshape(0, 3)
+        buf = view.buffer()
+        assert view.shape == (0, 3)
+        assert buf.format == 'i'
+        assert buf.nbytes == 0
+        assert buf.tolist() == []
+        assert mmaparray('d', range(6)).reshape(2, 3)[2:].buffer().format == 'd'
+
+    def test_shrunk_base(self):
+        arr = mmaparray('i', range(6))
+        view = arr.reshape(2, 3)
+        arr.pop()
+        with pytest.raises(IndexError):
+            view.tolist()
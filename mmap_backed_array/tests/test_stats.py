@@ -0,0 +1,91 @@
+import pytest
+
+from mmap_backed_array import mmaparray, stats
+
+
+@pytest.fixture(autouse=True)
+def clean_stats():
+    stats.disable()
+    stats.reset()
+    yield
+    stats.disable()
+    stats.reset()
+
+
+class TestStats:
+
+    def test_disabled_by_default(self):
+        arr = mmaparray('I', [1, 2, 3])
+        arr.append(4)
+        assert not stats.is_enabled()
+        assert stats.get_stats() == dict.fromkeys(stats.COUNTERS, 0)
+        assert stats.get_stats(arr) == dict.fromkeys(stats.COUNTERS, 0)
+
+    def test_counters(self):
+        stats.enable()
+        arr = mmaparray('I', [1, 2, 3])
+        arr.append(4)
+        arr.insert(0, 5)
+        arr.tobytes()
+        counts = stats.get_stats(arr)
+        assert counts['resizes'] == 3
+        assert counts['bytes_resized'] == 20
+        assert counts['syscalls'] == 3
+        assert counts['moves'] == 1
+        assert counts['bytes_moved'] == 16
+        assert counts['copies'] == 2
+        assert counts['bytes_copied'] == 12 + 20
+        assert counts['seconds'] >= 0
+        other = mmaparray('B', b'ab')
+        assert stats.get_stats(other)['copies'] == 1
+        assert stats.get_stats()['copies'] == 3
+        stats.reset(arr)
+        assert stats.get_stats(arr)['copies'] == 0
+        assert stats.get_stats()['copies'] == 3
+
+    def test_measure(self):
+        arr = mmaparray('I', [1, 2, 3])
+        with stats.measure() as counts:
+            arr.extend([4, 5])
+            with stats.measure(arr) as array_counts:
+                arr.tobytes()
+        assert not stats.is_enabled()
+        assert counts['resizes'] == 1
+        assert counts['copies'] == 2
+        assert array_counts['copies'] == 1
+        assert array_counts['resizes'] == 0
+        arr.tobytes()
+        assert stats.get_stats()['copies'] == 2
+
+    def test_overlapping_measure(self):
+        arr = mmaparray('I', [1, 2, 3])
+        first = stats.measure()
+        second = stats.measure()
+        first_counts = first.__enter__()
+        second_counts = second.__enter__()
+        first.__exit__(None, None, None)
+        assert stats.is_enabled()
+        arr.tobytes()
+        second.__exit__(None, None, None)
+        assert not stats.is_enabled()
+        assert first_counts['copies'] == 0
+        assert second_counts['copies'] == 1
+
+    def test_measure_while_enabled(self):
+        stats.enable()
+        with stats.measure():
+            pass
+        assert stats.is_enabled()
+
+    def test_hooks(self):
+        events = []
+        def hook(event, arr, nbytes, seconds):
+            events.append((event, nbytes))
+        stats.add_hook(hook)
+        try:
+            with stats.measure():
+                arr = mmaparray('B', b'abc')
+                arr.pop(0)
+        finally:
+            stats.remove_hook(hook)
+        assert events == [('resize', 3), ('copy', 3), ('move', 2), ('resize', 1)]
@@ -0,0 +1,88 @@
+import os
+import struct
+import subprocess
+import sys
+
+import pytest
+
+import mmap_backed_array
+from mmap_backed_array import mmaparray, mmapversionedarray
+
+
+class TestVersioned:
+
+    def test_publish_and_refresh(self, tmpdir):
+        path = str(tmpdir.join('table'))
+        mmapversionedarray.publish(path, mmaparray('l', range(10)))
+        table = mmapversionedarray(path)
+        assert (table.typecode, table.generation, len(table)) == ('l', 1, 10)
+        assert list(table) == list(range(10))
+        held = table.array
+        with mmapversionedarray.build(path, 'l') as arr:
+            arr.extend([7, 8, 9])
+        assert table.generation == 1
+        assert table.latest_generation == 2
+        assert table[0] == 7
+        assert table.generation == 2
+        assert not table.refresh()
+        # the array of the old version is still valid
+        assert list(held) == list(range(10))
+        table.close()
+
+    def test_old_versions_removed(self, tmpdir):
+        path = str(tmpdir.join('table'))
+        for i in range(5):
+            mmapversionedarray.publish(path, mmaparray('i', [i]), keep=1)
+        assert sorted(os.listdir(str(tmpdir))) == ['table', 'table.4', 'table.5']
+        with mmapversionedarray(path) as table:
+            assert list(table) == [4]
+        mmapversionedarray.publish(path, mmaparray('i'))
+        with mmapversionedarray(path) as table:
+            assert len(table) == 0
+
+    def test_failed_build(self, tmpdir):
+        path = str(tmpdir.join('table'))
+        mmapversionedarray.publish(path, mmaparray('i', [1]))
+        with pytest.raises(RuntimeError):
+            with mmapversionedarray.build(path, 'i') as arr:
+                arr.append(2)
+                raise RuntimeError
+        with pytest.raises(TypeError):
+            with mmapversionedarray.build(path, 'd'):
+                pass
+        assert sorted(os.listdir(str(tmpdir))) == ['table', 'table.1']
+        with mmapversionedarray(path) as table:
+            assert (table.generation, list(table)) == (1, [1])
+
+    def test_errors(self, tmpdir):
+        with pytest.raises(FileNotFoundError):
+            mmapversionedarray(str(tmpdir.join('missing')))
+        path = str(tmpdir.join('not_a_table'))
+        with open(path, 'wb') as f:
+            f.write(bytes(100))
+        with pytest.raises(ValueError):
+            mmapversionedarray(path)
+        # the control block of the first format, without the waiters word
+        old_format = str(tmpdir.join('old_format'))
+        with open(old_format, 'wb') as f:
+            f.write(struct.pack('<8sQc', b'MBAVERS1', 1, b'l').ljust(64, b'\x00'))
+        with pytest.raises(ValueError):
+            mmapversionedarray(old_format)
+        with pytest.raises(ValueError):
+            mmapversionedarray.publish(old_format, mmaparray('l', [1]))
+
+    def test_other_process(self, tmpdir):
+        path = str(tmpdir.join('table'))
+        mmapversionedarray.publish(path, mmaparray('d', [0.5]))
+        table = mmapversionedarray(path)
+        script = '\n'.join([
+            "import sys",
+            "from mmap_backed_array import mmaparray, mmapversionedarray",
+            "mmapversionedarray.publish(sys.argv[1], mmaparray('d', [1.5, 2.5]))",
+        ])
+        package_root = os.path.dirname(os.path.dirname(mmap_backed_array.__file__))
+        env = dict(os.environ, PYTHONPATH=package_root)
+        subprocess.check_call([sys.executable, '-c', script, path], env=env)
+        assert list(table) == [1.5, 2.5]
+        assert table.generation == 2
+        table.close()
@@ -0,0 +1,234 @@
+"""Versioned file backed arrays that readers remap when a new version is published"""
+import contextlib
+import errno
+import mmap
+import os
+import struct
+
+from .mmap_array import mmaparray, ffi, C
+from . import notify
+
+__all__ = [
+    "mmapversionedarray",
+]
+
+_MAGIC = b'MBAVERS2'
+# magic, generation, waiters, typecode. The generation and waiters words at
+# offset 8 are the notifier that readers load the generation from and wait
+# on for new versions. Readers map it read only and can't count themselves
+# as waiters, so the waiters word is always 1 and every publish wakes.
+_CONTROL = struct.Struct('<8sQQc')
+_CONTROL_SIZE = 64
+
+
+def _version_path(path, generation):
+    return '%s.%d' % (path, generation)
+
+
+def _create_control(path, typecode):
+    """Create the control file of a table unless it exists.
+    The file is written in full under a temporary name and linked into
+    place so that readers never see a partial control block.
+    """
+    temp = '%s.%d.tmp' % (path, os.getpid())
+    with open(temp, 'wb') as f:
+        f.write(_CONTROL.pack(_MAGIC, 0, 1, typecode.encode()).ljust(_CONTROL_SIZE, b'\x00'))
+        f.flush()
+        os.fsync(f.fileno())
+    try:
+        os.link(temp, path)
+    except FileExistsError:
+        pass
+    finally:
+        os.unlink(temp)
+
+
+def _map_control(path, access):
+    """Map the control file of a table.
+    :returns: tuple of the mapping, a pointer to the generation and the
+        typecode
+    """
+    with open(path, 'r+b' if access == mmap.ACCESS_WRITE else 'rb') as f:
+        if os.fstat(f.fileno()).st_size < _CONTROL_SIZE:
+            raise ValueError("%s is not a versioned array" % path)
+        control = mmap.mmap(f.fileno(), _CONTROL_SIZE, access=access)
+    magic, _, _, typecode = _CONTROL.unpack_from(control)
+    if magic != _MAGIC:
+        control.close()
+        raise ValueError("%s is not a versioned array" % path)
+    generation = ffi.cast('uint64_t *', ffi.from_buffer(control)) + 1
+    return control, generation, typecode.decode()
+
+
+class mmapversionedarray:
+    """Reader of an array published in versions by another process.
+
+    The writer builds each version in a new file named after the path and
+    the generation, then bumps the generation in a small control file at
+    the path. Readers check the generation on every access, a single
+    atomic load, and map the new file when it changed. Mappings of older
+    versions stay valid for as long as something refers to them and are
+    released when the last reference goes, so readers never take a lock.
+    """
+    def __init__(self, path):
+        """:path: the control file of the table, see build and publish"""
+        self._path = path
+        self._control, self._latest, self._typecode = _map_control(path, mmap.ACCESS_READ)
+        self._generation = None
+        self._array = None
+        self.refresh()
+
+    @property
+    def typecode(self):
+        return self._typecode
+
+    @property
+    def generation(self):
+        """The generation of the version currently mapped"""
+        return self._generation
+
+    @property
+    def latest_generation(self):
+        """The generation most recently published"""
+        return C.mba_atomic_load(self._latest)
+
+    def refresh(self):
+        """Map the latest version if a newer one was published.
+        :returns: True if a new version was mapped
+        """
+        generation = C.mba_atomic_load(self._latest)
+        if generation == self._generation:
+            return False
+        while True:
+            if generation == 0:
+                raise FileNotFoundError(
+                    errno.ENOENT, "no version has been published", self._path
+                )
+            try:
+                f = open(_version_path(self._path, generation), 'rb')
+            except FileNotFoundError:
+                # the writer removed it after publishing a newer version
+                latest = C.mba_atomic_load(self._latest)
+                if latest == generation:
+                    raise
+                generation = latest
+                continue
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                if size:
+                    backing = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_COPY)
+                    self._array = mmaparray(self._typecode, mmap=backing)
+                else:
+                    self._array = mmaparray(self._typecode)
+            self._generation = generation
+            return True
+
+    def wait_for_change(self, timeout=None):
+        """Sleep until a version newer than the one mapped is published
+        and map it.
+        :timeout: seconds to wait at most, or None to wait for ever
+        :returns: True if a new version was mapped, False on timeout
+        """
+        if notify._wait(self._latest, self._generation, timeout, False) is None:
+            return False
+        return self.refresh()
+
+    async def await_change(self, timeout=None, executor=None):
+        """Coroutine version of wait_for_change, the waiting is done on
+        an executor so the event loop keeps running.
+        """
+        if await notify._await(self._latest, self._generation, timeout, executor, False) is None:
+            return False
+        return self.refresh()
+
+    @property
+    def array(self):
+        """The mmaparray of the latest version. Changes to it are private
+        to the process. Keep using the returned array for a consistent
+        view across several reads, it stays mapped while it is referenced.
+        """
+        self.refresh()
+        return self._array
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, index):
+        return self.array[index]
+
+    def __iter__(self):
+        return iter(self.array)
+
+    def __repr__(self):
+        return "mmapversionedarray(%r) generation %s" % (self._path, self._generation)
+
+    def close(self):
+        """Drop the current version and unmap the control file"""
+        self._array = None
+        self._latest = None
+        self._control.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    @contextlib.contextmanager
+    def build(path, typecode, keep=1):
+        """Context manager that builds the next version of a table.
+        Yields an empty array opened with mmaparray.open on a new file, fill
+        it and the version is published when the block exits without an
+        exception. Only one process may build a table at a time.
+        :path: the control file of the table, created if it doesn't exist
+        :typecode: the typecode of the items, fixed when the table is created
+        :keep: the number of older versions to keep on disk for readers that
+            are still opening them
+        :raises FileExistsError: if another process published the same
+            generation
+        """
+        _create_control(path, typecode)
+        control, latest, table_typecode = _map_control(path, mmap.ACCESS_WRITE)
+        try:
+            if table_typecode != typecode:
+                raise TypeError("%s holds typecode %r, not %r" % (path, table_typecode, typecode))
+            generation = C.mba_atomic_load(latest) + 1
+            temp = '%s.%d.tmp' % (_version_path(path, generation), os.getpid())
+            arr = mmaparray.open(typecode, temp)
+            try:
+                yield arr
+            except BaseException:
+                arr.close()
+                os.unlink(temp)
+                raise
+            arr.close()
+            try:
+                with open(temp, 'rb') as f:
+                    os.fsync(f.fileno())
+                os.link(temp, _version_path(path, generation))
+            finally:
+                os.unlink(temp)
+            C.mba_notify(latest)
+            control.flush()
+            old = generation - keep - 1
+            while old > 0:
+                try:
+                    os.unlink(_version_path(path, old))
+                except FileNotFoundError:
+                    break
+                except OSError:
+                    # still mapped on a platform that doesn't allow removing it
+                    pass
+                old -= 1
+        finally:
+            del latest
+            control.close()
+
+    @classmethod
+    def publish(cls, path, items, keep=1):
+        """Publish a copy of an mmaparray as the next version of a table,
+        see build.
+        """
+        with cls.build(path, items.typecode, keep) as arr:
+            arr.extend(items)
@@ -21,4 +21,5 @@ setup(name='mmap_backed_array',
       ],
       keywords='mmap array',
       install_requires=['cffi'],
+      extras_require={'numpy': ['numpy']},
 )